@@ -13,7 +13,7 @@ from config_manager import load_environment_config, get_database_config
 load_environment_config()  # 确保环境变量已加载
 
 # 导入新的数据库模型
-from database.flask_models import Base
+from database.flask_models import Base, include_in_migrations
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -51,7 +51,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        include_name=include_in_migrations
     )
 
     with context.begin_transaction():
@@ -86,7 +87,8 @@ def run_migrations_online():
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
-            process_revision_directives=process_revision_directives
+            process_revision_directives=process_revision_directives,
+            include_name=include_in_migrations
         )
 
         with context.begin_transaction():
@@ -7,14 +7,15 @@ import logging
 from datetime import datetime, date, timedelta
 from flask import request, current_app
 from . import checkin_bp
-from app.shared import make_succ_response, make_err_response
+from app.shared import make_succ_response, make_succ_stream_response, make_err_response
 from app.shared.decorators import login_required
 from app.shared.utils.auth import verify_token
 from wxcloudrun.user_service import UserService
 from wxcloudrun.checkin_rule_service import CheckinRuleService
 from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.checkin_calendar_service import CheckinCalendarService
 from wxcloudrun.utils.timeutil import parse_date_only, parse_time_only, format_time
-from database.flask_models import db
+from database.flask_models import db, User
 
 app_logger = logging.getLogger('log')
 
@@ -103,38 +104,82 @@ def perform_checkin():
         return make_err_response({}, '缺少请求参数')
 
     rule_id = params.get('rule_id')
-    checkin_time_str = params.get('checkin_time')
-    note = params.get('note', '')
+    rule_source = params.get('rule_source', 'personal')
 
     if not rule_id:
         current_app.logger.warning('打卡请求缺少rule_id参数')
         return make_err_response({}, '缺少规则ID参数')
 
-    if not checkin_time_str:
-        current_app.logger.warning('打卡请求缺少checkin_time参数')
-        return make_err_response({}, '缺少打卡时间参数')
-
     try:
-        # 解析打卡时间
-        checkin_time = parse_time_only(checkin_time_str)
-        if not checkin_time:
-            current_app.logger.error(f'打卡时间格式错误: {checkin_time_str}')
-            return make_err_response({}, '打卡时间格式错误')
-
-        # 调用 Service 层执行打卡
+        # 调用 Service 层执行打卡，客户端重试时携带相同的 Idempotency-Key 返回首次结果
         response_data = CheckinRecordService.perform_checkin(
-            user.user_id, rule_id, checkin_time, note
+            rule_id, user.user_id, rule_source=rule_source,
+            idempotency_key=request.headers.get('Idempotency-Key')
         )
 
         current_app.logger.info(
-            f'用户 {user.user_id} 成功打卡，规则ID: {rule_id}, 打卡时间: {checkin_time_str}')
+            f'用户 {user.user_id} 成功打卡，规则ID: {rule_id}, 记录ID: {response_data["record_id"]}')
         return make_succ_response(response_data)
 
+    except ValueError as e:
+        current_app.logger.warning(f'打卡失败: {str(e)}')
+        return make_err_response({}, str(e))
     except Exception as e:
         current_app.logger.error(f'执行打卡操作时发生错误: {str(e)}', exc_info=True)
         return make_err_response({}, f'打卡失败: {str(e)}')
 
 
+@checkin_bp.route('/checkin/batch', methods=['POST'])
+def perform_batch_checkin():
+    """
+    批量打卡（Controller）
+    请求体: {"rule_ids": [个人规则ID], "community_rule_ids": [社区规则ID]}
+    请求头 Idempotency-Key 可选，客户端重试时携带相同的键返回首次结果
+    """
+    current_app.logger.info('=== 开始执行批量打卡接口 ===')
+
+    # 验证token
+    decoded, error_response = verify_token()
+    if error_response:
+        return error_response
+
+    user_id = decoded.get('user_id')
+
+    # 获取请求参数
+    params = request.get_json(silent=True)
+    if not params:
+        current_app.logger.warning('批量打卡请求缺少请求体参数')
+        return make_err_response({}, '缺少请求参数')
+
+    rule_ids = params.get('rule_ids') or []
+    community_rule_ids = params.get('community_rule_ids') or []
+    if not isinstance(rule_ids, list) or not isinstance(community_rule_ids, list):
+        return make_err_response({}, '规则ID参数必须为数组')
+
+    try:
+        rule_ids = [int(rule_id) for rule_id in rule_ids]
+        community_rule_ids = [int(rule_id) for rule_id in community_rule_ids]
+    except (TypeError, ValueError):
+        return make_err_response({}, '规则ID必须为整数')
+
+    try:
+        response_data = CheckinRecordService.perform_batch_checkin(
+            user_id, rule_ids=rule_ids, community_rule_ids=community_rule_ids,
+            idempotency_key=request.headers.get('Idempotency-Key')
+        )
+
+        current_app.logger.info(
+            f'用户 {user_id} 批量打卡完成，成功 {response_data["success_count"]} 项')
+        return make_succ_response(response_data)
+
+    except ValueError as e:
+        current_app.logger.warning(f'批量打卡参数错误: {str(e)}')
+        return make_err_response({}, str(e))
+    except Exception as e:
+        current_app.logger.error(f'执行批量打卡时发生错误: {str(e)}', exc_info=True)
+        return make_err_response({}, f'批量打卡失败: {str(e)}')
+
+
 @checkin_bp.route('/checkin/miss', methods=['POST'])
 def report_miss_checkin():
     """
@@ -246,6 +291,8 @@ def cancel_checkin():
 def get_checkin_history():
     """
     获取打卡历史记录（Controller）
+    查询参数: start_date, end_date, cursor（上一页的 next_cursor）, limit（每页条数）
+    stream=true 时以流式JSON数组返回范围内的全部记录；已不支持 page 页码分页，传入时返回400
     """
     current_app.logger.info('=== 开始执行获取打卡历史记录接口 ===')
 
@@ -264,10 +311,28 @@ def get_checkin_history():
     # 获取查询参数
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
-    page = int(request.args.get('page', 1))
-    per_page = min(int(request.args.get('per_page', 20)), 100)
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream', '').lower() in ('1', 'true')
 
     try:
+        # 页码分页已改为游标分页，旧客户端传 page 时明确报错，避免静默地反复返回第一页
+        if request.args.get('page') is not None:
+            current_app.logger.warning(f"打卡历史不再支持页码分页: page={request.args.get('page')}")
+            return make_err_response({}, '打卡历史已改为游标分页，请使用 cursor 和 limit 参数'), 400
+
+        # 每页条数：未传时使用默认值，非正整数返回400，超过上限时按上限返回
+        limit = None
+        limit_str = request.args.get('limit') or request.args.get('per_page')
+        if limit_str is not None:
+            try:
+                limit = int(limit_str)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                current_app.logger.warning(f'每页条数无效: {limit_str}')
+                return make_err_response({}, '每页条数必须为正整数'), 400
+            limit = min(limit, CheckinRecordService.HISTORY_MAX_PAGE_SIZE)
+
         # 解析日期参数
         start_date = None
         end_date = None
@@ -284,20 +349,67 @@ def get_checkin_history():
                 current_app.logger.error(f'结束日期格式错误: {end_date_str}')
                 return make_err_response({}, '结束日期格式错误')
 
+        if stream:
+            # 流式输出，内存占用与记录总数无关
+            items = CheckinRecordService.iter_checkin_history(user.user_id, start_date, end_date, cursor)
+            current_app.logger.info(f'用户 {user.user_id} 开始流式获取打卡历史记录')
+            return make_succ_stream_response({
+                'start_date': start_date_str,
+                'end_date': end_date_str
+            }, 'history', items)
+
         # 调用 Service 层获取打卡历史
         response_data = CheckinRecordService.get_checkin_history(
-            user.user_id, start_date, end_date, page, per_page
+            user.user_id, start_date, end_date, cursor=cursor, limit=limit
         )
 
         current_app.logger.info(
-            f'用户 {user.user_id} 成功获取打卡历史记录，记录数: {response_data["total"]}')
+            f'用户 {user.user_id} 成功获取打卡历史记录，记录数: {len(response_data["history"])}')
         return make_succ_response(response_data)
 
+    except ValueError as e:
+        current_app.logger.warning(f'获取打卡历史记录参数错误: {str(e)}')
+        return make_err_response({}, str(e))
     except Exception as e:
         current_app.logger.error(f'获取打卡历史记录时发生错误: {str(e)}', exc_info=True)
         return make_err_response({}, f'获取打卡历史记录失败: {str(e)}')
 
 
+@checkin_bp.route('/checkin/calendar', methods=['GET'])
+def get_checkin_calendar():
+    """
+    获取打卡月历（Controller）
+    查询参数: month（YYYY-MM，默认当月）
+    每条规则返回 due/checked/missed/pending 四个日期掩码，第 i 位对应当月第 i+1 天
+    """
+    current_app.logger.info('=== 开始执行获取打卡月历接口 ===')
+
+    # 验证token
+    decoded, error_response = verify_token()
+    if error_response:
+        return error_response
+
+    user_id = decoded.get('user_id')
+    user = db.session.get(User, user_id)
+    if not user:
+        current_app.logger.error(f'数据库中未找到user_id为 {user_id} 的用户')
+        return make_err_response({}, '用户不存在')
+
+    try:
+        response_data = CheckinCalendarService.get_month_calendar(user.user_id, request.args.get('month'))
+
+        current_app.logger.info(
+            f'用户 {user.user_id} 成功获取 {response_data["month"]} 打卡月历，规则数: {len(response_data["rules"])}')
+        return make_succ_response(response_data)
+
+    except ValueError as e:
+        current_app.logger.warning(f'获取打卡月历参数错误: {str(e)}')
+        return make_err_response({}, str(e))
+    except Exception as e:
+        current_app.logger.error(f'获取打卡月历时发生错误: {str(e)}', exc_info=True)
+        return make_err_response({}, f'获取打卡月历失败: {str(e)}')
+
+
 @checkin_bp.route('/checkin/rules', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def manage_checkin_rules():
     """
@@ -52,81 +52,63 @@ def _format_community_info(community, include_worker_stats=False):
     Returns:
         dict: 格式化后的社区信息
     """
-    # 获取创建者信息
-    creator = None
-    if community.creator_id:
-        creator_user = db.session.get(User, community.creator_id)
-        if creator_user:
-            creator = {
-                'user_id': creator_user.user_id,
-                'nickname': creator_user.nickname,
-                'avatar_url': creator_user.avatar_url
-            }
+    return _format_communities_info([community], include_worker_stats)[0]
 
-    # 获取主管信息
-    manager = None
-    if community.manager_id:
-        manager_user = db.session.get(User, community.manager_id)
-        if manager_user:
-            manager = {
-                'user_id': manager_user.user_id,
-                'nickname': manager_user.nickname,
-                'avatar_url': manager_user.avatar_url
-            }
+
+def _format_communities_info(communities, include_worker_stats=False):
+    """
+    批量格式化社区信息：创建者和主管用一次 IN 查询加载，
+    工作人员和成员数量用一次 GROUP BY 查询统计，查询次数与社区数量无关
+
+    Args:
+        communities: Community对象列表
+        include_worker_stats: 是否包含工作人员统计信息
+
+    Returns:
+        list: 与 communities 顺序对应的社区信息字典列表
+    """
+    # 获取创建者和主管信息
+    user_ids = {c.creator_id for c in communities if c.creator_id} | {c.manager_id for c in communities if c.manager_id}
+    users = {}
+    if user_ids:
+        users = {u.user_id: {
+            'user_id': u.user_id,
+            'nickname': u.nickname,
+            'avatar_url': u.avatar_url
+        } for u in db.session.query(User).filter(User.user_id.in_(user_ids)).all()}
 
     # 获取工作人员数量统计
-    manager_count = 0
-    staff_count = 0
-    worker_count = 0
-    user_count = 0  # 普通成员数量（不包括工作人员）
-    if include_worker_stats:
-        manager_count = CommunityStaff.query.filter_by(
-            community_id=community.community_id,
-            role='manager'  # 社区主管
-        ).count()
-        # 只统计专员（不包括主管）
-        staff_count = CommunityStaff.query.filter_by(
-            community_id=community.community_id,
-            role='staff'  # 社区专员
-        ).count()
-        worker_count = manager_count + staff_count  # 工作人员总数 = 主管 + 专员
-        
-        # 获取所有工作人员的用户ID列表
-        staff_user_ids = [s.user_id for s in CommunityStaff.query.filter_by(
-            community_id=community.community_id
-        ).all()]
-        
-        # 统计普通成员（不包括工作人员）
-        if staff_user_ids:
-            user_count = db.session.query(User).filter(
-                User.community_id == community.community_id,
-                User.user_id.notin_(staff_user_ids)
-            ).count()
-        else:
-            # 如果没有工作人员，统计所有社区用户
-            user_count = db.session.query(User).filter_by(community_id=community.community_id).count()
-
-    return {
-        'community_id': community.community_id,
-        'name': community.name,
-        'description': community.description,
-        'location': community.location or '',
-        'location_lat': community.location_lat,
-        'location_lon': community.location_lon,
-        'creator_id': community.creator_id,
-        'creator': creator,
-        'manager_id': community.manager_id,
-        'manager': manager,
-        'status': community.status,
-        'is_default': community.is_default,
-        'is_blackhouse': community.is_blackhouse,
-        'created_at': community.created_at.isoformat() if community.created_at else None,
-        'updated_at': community.updated_at.isoformat() if community.updated_at else None,
-        'manager_count': manager_count,  # 主管数量
-        'worker_count': worker_count,  # 工作人员总数（主管+专员）
-        'staff_count': staff_count,  # 专员数量（不包括主管）
-        'user_count': user_count  # 普通成员数量（不包括工作人员）
-    }
+    member_stats = {}
+    if include_worker_stats and communities:
+        member_stats = CommunityService.get_communities_member_stats([c.community_id for c in communities])
+
+    communities_data = []
+    for community in communities:
+        stats = member_stats.get(community.community_id, {})
+        manager_count = stats.get('manager_count', 0)
+        staff_count = stats.get('staff_count', 0)  # 只统计专员（不包括主管）
+        communities_data.append({
+            'community_id': community.community_id,
+            'name': community.name,
+            'description': community.description,
+            'location': community.location or '',
+            'location_lat': community.location_lat,
+            'location_lon': community.location_lon,
+            'creator_id': community.creator_id,
+            'creator': users.get(community.creator_id),
+            'manager_id': community.manager_id,
+            'manager': users.get(community.manager_id),
+            'status': community.status,
+            'is_default': community.is_default,
+            'is_blackhouse': community.is_blackhouse,
+            'created_at': community.created_at.isoformat() if community.created_at else None,
+            'updated_at': community.updated_at.isoformat() if community.updated_at else None,
+            'manager_count': manager_count,  # 主管数量
+            'worker_count': manager_count + staff_count,  # 工作人员总数（主管+专员）
+            'staff_count': staff_count,  # 专员数量（不包括主管）
+            'user_count': stats.get('user_count', 0)  # 普通成员数量（不包括工作人员）
+        })
+    return communities_data
 
 
 @community_bp.route('/communities', methods=['GET'])
@@ -152,11 +134,8 @@ def get_communities():
         # 查询所有社区
         communities = db.session.query(Community).all()
         
-        # 格式化社区信息
-        communities_data = []
-        for community in communities:
-            community_data = _format_community_info(community, include_worker_stats=True)
-            communities_data.append(community_data)
+        # 格式化社区信息（批量加载创建者、主管和统计）
+        communities_data = _format_communities_info(communities, include_worker_stats=True)
 
         current_app.logger.info(f'获取社区列表成功，共 {len(communities_data)} 个社区')
         return make_succ_response({'communities': communities_data})
@@ -183,11 +162,8 @@ def get_community_list():
         # 获取用户可见的社区列表
         communities = CommunityService.get_available_communities()
         
-        # 格式化社区信息（包含主管信息）
-        communities_data = []
-        for community in communities:
-            community_data = _format_community_info(community, include_worker_stats=True)
-            communities_data.append(community_data)
+        # 格式化社区信息（批量加载创建者、主管和统计）
+        communities_data = _format_communities_info(communities, include_worker_stats=True)
 
         current_app.logger.info(f'获取用户社区列表成功，共 {len(communities_data)} 个社区')
         return make_succ_response({'communities': communities_data})
@@ -522,11 +498,8 @@ def get_managed_communities():
         # 获取用户可管理的社区
         communities, _ = CommunityService.get_manageable_communities(user)
         
-        # 格式化社区信息
-        communities_data = []
-        for community in communities:
-            community_data = _format_community_info(community)
-            communities_data.append(community_data)
+        # 格式化社区信息（批量加载创建者和主管）
+        communities_data = _format_communities_info(communities)
 
         current_app.logger.info(f'获取可管理社区列表成功，共 {len(communities_data)} 个社区')
         return make_succ_response({'communities': communities_data})
@@ -553,11 +526,8 @@ def get_available_communities():
         # 获取可加入的社区列表
         communities = CommunityService.get_available_communities(user_id)
         
-        # 格式化社区信息
-        communities_data = []
-        for community in communities:
-            community_data = _format_community_info(community)
-            communities_data.append(community_data)
+        # 格式化社区信息（批量加载创建者和主管）
+        communities_data = _format_communities_info(communities)
 
         current_app.logger.info(f'获取可加入社区列表成功，共 {len(communities_data)} 个社区')
         return make_succ_response({'communities': communities_data})
@@ -1468,11 +1438,8 @@ def get_manageable_communities():
         # 获取可管理的社区列表
         communities, total = CommunityService.get_manageable_communities(user)
         
-        # 格式化社区信息
-        communities_data = []
-        for community in communities:
-            community_data = _format_community_info(community)
-            communities_data.append(community_data)
+        # 格式化社区信息（批量加载创建者和主管）
+        communities_data = _format_communities_info(communities)
 
         current_app.logger.info(f'获取可管理社区列表成功，共 {len(communities_data)} 个社区')
         return make_succ_response({'communities': communities_data})
@@ -1512,10 +1479,7 @@ def search_manageable_communities():
         current_app.logger.info(f'搜索结果: 找到 {result["total"]} 条记录')
 
         # 构造返回数据
-        communities = []
-        for community in result.get('communities', []):
-            community_data = _format_community_info(community)
-            communities.append(community_data)
+        communities = _format_communities_info(result.get('communities', []))
 
         response_data = {
             'communities': communities,
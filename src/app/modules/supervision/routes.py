@@ -13,10 +13,35 @@ from app.shared.utils.auth import verify_token
 from wxcloudrun.user_service import UserService
 from wxcloudrun.checkin_rule_service import CheckinRuleService
 from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.supervision_service import SupervisionService
+from wxcloudrun.utils.timeutil import parse_date_only
 from database.flask_models import db, SupervisionRuleRelation, CheckinRecord
 
 app_logger = logging.getLogger('log')
 
+# 分页参数的每页最大条数
+MAX_PAGE_SIZE = 100
+
+
+def _positive_int_arg(names, default, maximum=None):
+    """
+    解析正整数查询参数（页码、每页条数）
+    :param names: 参数名，多个时取第一个传入的参数
+    :param default: 未传时的默认值
+    :param maximum: 上限，超过时按上限返回
+    :return: 解析后的整数，不是正整数时返回None
+    """
+    value = next((request.args.get(name) for name in names if request.args.get(name) is not None), None)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    if number < 1:
+        return None
+    return min(number, maximum) if maximum else number
+
 
 @supervision_bp.route('/supervision/invite', methods=['POST'])
 @login_required
@@ -191,8 +216,11 @@ def get_supervision_invitations(decoded):
     try:
         # 获取查询参数
         status = request.args.get('status')  # pending, accepted, rejected
-        page = int(request.args.get('page', 1))
-        per_page = min(int(request.args.get('per_page', 20)), 100)
+        page = _positive_int_arg(('page',), 1)
+        per_page = _positive_int_arg(('per_page',), 20, MAX_PAGE_SIZE)
+        if page is None or per_page is None:
+            current_app.logger.warning(f'分页参数无效: {dict(request.args)}')
+            return make_err_response({}, '页码和每页条数必须为正整数'), 400
 
         # 这里简化处理，实际应该从数据库查询
         invitations = [
@@ -298,28 +326,16 @@ def get_my_supervised_users(decoded):
 
     try:
         # 获取查询参数
-        page = int(request.args.get('page', 1))
-        per_page = min(int(request.args.get('per_page', 20)), 100)
+        page = _positive_int_arg(('page',), 1)
+        per_page = _positive_int_arg(('per_page',), 20, MAX_PAGE_SIZE)
+        if page is None or per_page is None:
+            current_app.logger.warning(f'分页参数无效: {dict(request.args)}')
+            return make_err_response({}, '页码和每页条数必须为正整数'), 400
 
-        # 这里简化处理，实际应该从数据库查询
-        supervised_users = [
-            {
-                'user_id': 2,
-                'nickname': '李四',
-                'avatar_url': 'https://example.com/avatar2.jpg',
-                'supervision_count': 3,
-                'last_checkin': '2025-12-24 09:00:00',
-                'status': 'active'
-            }
-        ]
+        result = SupervisionService.get_supervised_users(user.user_id, page, per_page)
 
-        current_app.logger.info(f'用户 {user.user_id} 获取监督用户列表成功，共 {len(supervised_users)} 个用户')
-        return make_succ_response({
-            'supervised_users': supervised_users,
-            'total': len(supervised_users),
-            'page': page,
-            'per_page': per_page
-        })
+        current_app.logger.info(f'用户 {user.user_id} 获取监督用户列表成功，共 {result["total"]} 个用户')
+        return make_succ_response(result)
 
     except Exception as e:
         current_app.logger.error(f'获取监督用户列表失败: {str(e)}', exc_info=True)
@@ -342,28 +358,16 @@ def get_my_guardians(decoded):
 
     try:
         # 获取查询参数
-        page = int(request.args.get('page', 1))
-        per_page = min(int(request.args.get('per_page', 20)), 100)
+        page = _positive_int_arg(('page',), 1)
+        per_page = _positive_int_arg(('per_page',), 20, MAX_PAGE_SIZE)
+        if page is None or per_page is None:
+            current_app.logger.warning(f'分页参数无效: {dict(request.args)}')
+            return make_err_response({}, '页码和每页条数必须为正整数'), 400
 
-        # 这里简化处理，实际应该从数据库查询
-        guardians = [
-            {
-                'user_id': 1,
-                'nickname': '张三',
-                'avatar_url': 'https://example.com/avatar1.jpg',
-                'supervision_count': 2,
-                'last_checkin': '2025-12-24 08:30:00',
-                'status': 'active'
-            }
-        ]
+        result = SupervisionService.get_guardians(user.user_id, page, per_page)
 
-        current_app.logger.info(f'用户 {user.user_id} 获取监督者列表成功，共 {len(guardians)} 个监督者')
-        return make_succ_response({
-            'guardians': guardians,
-            'total': len(guardians),
-            'page': page,
-            'per_page': per_page
-        })
+        current_app.logger.info(f'用户 {user.user_id} 获取监督者列表成功，共 {result["total"]} 个监督者')
+        return make_succ_response(result)
 
     except Exception as e:
         current_app.logger.error(f'获取监督者列表失败: {str(e)}', exc_info=True)
@@ -386,35 +390,21 @@ def get_supervision_records(decoded):
 
     try:
         # 获取查询参数
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        page = int(request.args.get('page', 1))
-        per_page = min(int(request.args.get('per_page', 20)), 100)
+        start_date = parse_date_only(request.args.get('start_date'))
+        end_date = parse_date_only(request.args.get('end_date'))
+        cursor = request.args.get('cursor')
+        limit = _positive_int_arg(('limit', 'per_page'), 20, MAX_PAGE_SIZE)
+        if limit is None:
+            current_app.logger.warning(f'每页条数无效: {dict(request.args)}')
+            return make_err_response({}, '每页条数必须为正整数'), 400
 
-        # 这里简化处理，实际应该从数据库查询
-        records = [
-            {
-                'record_id': 1,
-                'supervisor_id': 1,
-                'supervisor_nickname': '张三',
-                'supervised_id': 2,
-                'supervised_nickname': '李四',
-                'rule_id': 1,
-                'rule_name': '每日阅读',
-                'checkin_time': '2025-12-24 09:00:00',
-                'status': 'completed',
-                'created_at': '2025-12-24 09:00:00'
-            }
-        ]
+        result = SupervisionService.get_supervision_records(user, start_date, end_date, cursor, limit)
 
-        current_app.logger.info(f'用户 {user.user_id} 获取监督记录成功，共 {len(records)} 条记录')
-        return make_succ_response({
-            'records': records,
-            'total': len(records),
-            'page': page,
-            'per_page': per_page
-        })
+        current_app.logger.info(f'用户 {user.user_id} 获取监督记录成功，共 {len(result["records"])} 条记录')
+        return make_succ_response(result)
 
+    except ValueError as e:
+        return make_err_response({}, str(e))
     except Exception as e:
         current_app.logger.error(f'获取监督记录失败: {str(e)}', exc_info=True)
         return make_err_response({}, f'获取监督记录失败: {str(e)}')
\ No newline at end of file
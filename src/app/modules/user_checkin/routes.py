@@ -221,12 +221,16 @@ def get_user_checkin_statistics():
         "msg": "success",
         "data": {
             "period": "week",
+            "start_date": "2025-12-18",
+            "end_date": "2025-12-24",
             "total_days": 7,
             "checkin_days": 5,
             "checkin_rate": 71.4,
             "total_rules": 3,
             "completed_checkins": 15,
             "missed_checkins": 6,
+            "current_streak": 2,
+            "longest_streak": 4,
             "daily_stats": [
                 {
                     "date": "2025-12-18",
@@ -235,6 +239,19 @@ def get_user_checkin_statistics():
                     "missed_rules": 1,
                     "checkin_rate": 66.7
                 }
+            ],
+            "rules": [
+                {
+                    "rule_source": "personal",
+                    "rule_id": 1,
+                    "rule_name": "阅读",
+                    "total_checkins": 7,
+                    "completed_checkins": 6,
+                    "missed_checkins": 1,
+                    "completion_rate": 85.7,
+                    "current_streak": 3,
+                    "longest_streak": 3
+                }
             ]
         }
     }
@@ -7,6 +7,7 @@
 from .response import (
     make_succ_empty_response,
     make_succ_response,
+    make_succ_stream_response,
     make_err_response
 )
 
@@ -3,7 +3,7 @@
 统一API响应格式
 """
 import json
-from flask import Response
+from flask import Response, stream_with_context
 
 
 def make_succ_empty_response(msg='success'):
@@ -18,6 +18,27 @@ def make_succ_response(data, msg='success'):
     return Response(data, mimetype='application/json')
 
 
+def make_succ_stream_response(data, stream_key, items, msg='success'):
+    """
+    创建流式成功响应：data[stream_key] 为逐项序列化的JSON数组，内存占用与总条数无关
+    :param data: 固定字段字典
+    :param stream_key: 流式数组的字段名
+    :param items: 数组元素的迭代器（在请求上下文中惰性求值）
+    """
+    # 用占位符序列化固定部分，再在占位符处逐项输出数组
+    placeholder = '\u0000stream\u0000'
+    envelope = json.dumps({'code': 1, 'data': dict(data, **{stream_key: placeholder}), 'msg': msg})
+    head, tail = envelope.split(json.dumps(placeholder), 1)
+
+    def generate():
+        yield head + '['
+        for index, item in enumerate(items):
+            yield (',' if index else '') + json.dumps(item)
+        yield ']' + tail
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
 def make_err_response(data={}, msg='error'):
     """创建错误响应"""
     data = json.dumps({'code': 0, 'data': data, 'msg': msg})
@@ -4,6 +4,7 @@ Flask-SQLAlchemy模型定义
 """
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Date, Time, Float, CheckConstraint, UniqueConstraint, Index
+from sqlalchemy import DDL, event
 from app.extensions import db
 
 class User(db.Model):
@@ -99,6 +100,11 @@ class Community(db.Model):
     created_at = Column(db.DateTime, default=datetime.now)
     updated_at = Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        # 可管理社区列表：按状态筛选后按创建时间倒序分页
+        db.Index('idx_communities_status_created', 'status', 'created_at'),
+    )
+
     # 关系
     creator = db.relationship('User', foreign_keys=[creator_id], backref='created_communities')
     # 注意：users backref 与 User 模型中的 community 关系冲突，所以不在这里定义
@@ -118,6 +124,22 @@ class Community(db.Model):
         return f'<Community {self.community_id}: {self.name}>'
 
 
+class CommunityCounter(db.Model):
+    """社区人数计数表（随成员/工作人员变更在同一事务内增减，由后台定期校正）"""
+    __tablename__ = 'community_counters'
+
+    community_id = Column(db.Integer, db.ForeignKey('communities.community_id'), primary_key=True)
+    manager_count = Column(db.Integer, nullable=False, default=0, comment='主管数')
+    staff_count = Column(db.Integer, nullable=False, default=0, comment='专员数')
+    member_count = Column(db.Integer, nullable=False, default=0, comment='普通成员数（不含本社区工作人员）')
+    resident_count = Column(db.Integer, nullable=False, default=0, comment='归属本社区的全部用户数')
+    updated_at = Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return (f'<CommunityCounter {self.community_id}: {self.manager_count}/{self.staff_count}/'
+                f'{self.member_count}/{self.resident_count}>')
+
+
 class CheckinRule(db.Model):
     __tablename__ = 'checkin_rules'
 
@@ -165,6 +187,12 @@ class CheckinRule(db.Model):
         return f'<CheckinRule {self.rule_id}: {self.rule_name}>'
 
 
+def _planned_date_default(context):
+    """插入打卡记录时由计划时间得到计划日期"""
+    planned_time = context.get_current_parameters().get('planned_time')
+    return planned_time.date() if planned_time else None
+
+
 class CheckinRecord(db.Model):
     """打卡记录表"""
     __tablename__ = 'checkin_records'
@@ -175,6 +203,7 @@ class CheckinRecord(db.Model):
     rule_id = Column(db.Integer, db.ForeignKey('checkin_rules.rule_id'), nullable=True)
     community_rule_id = Column(db.Integer, nullable=True, comment='社区规则ID')
     planned_time = Column(db.DateTime, nullable=False, comment='计划打卡时间')
+    planned_date = Column(db.Date, default=_planned_date_default, comment='计划日期，用于每日唯一约束')
     checkin_time = Column(db.DateTime, comment='实际打卡时间')
     checkin_type = Column(db.String(50), comment='打卡类型')
     content = Column(db.Text, comment='打卡内容')
@@ -182,25 +211,79 @@ class CheckinRecord(db.Model):
     updated_at = Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     created_at = Column(db.DateTime, default=datetime.now)
 
+    # 按规则/用户 + 计划时间范围查询的复合索引；
+    # 每个用户每条规则每天只有一条记录（个人规则和社区规则分别约束，另一列为NULL时不冲突）
+    __table_args__ = (
+        db.Index('idx_checkin_records_rule_planned', 'rule_id', 'planned_time'),
+        db.Index('idx_checkin_records_community_rule_planned', 'community_rule_id', 'planned_time'),
+        db.Index('idx_checkin_records_user_planned', 'user_id', 'planned_time'),
+        db.Index('idx_checkin_records_solo_user_planned', 'solo_user_id', 'planned_time'),
+        db.UniqueConstraint('user_id', 'rule_id', 'planned_date', name='uq_checkin_records_personal_daily'),
+        db.UniqueConstraint('user_id', 'community_rule_id', 'planned_date', name='uq_checkin_records_community_daily'),
+    )
+
     # 关系
     user = db.relationship('User', foreign_keys=[user_id], backref='checkin_records')
     solo_user = db.relationship('User', foreign_keys=[solo_user_id], backref='solo_checkin_records')
     rule = db.relationship('CheckinRule', backref='records')
 
+    # 状态映射
+    STATUS_MAPPING = {
+        0: 'unchecked',
+        1: 'checked',
+        2: 'cancelled'
+    }
+
     @property
     def status_name(self):
         """获取状态名称"""
-        status_mapping = {
-            0: 'unchecked',
-            1: 'checked',
-            2: 'cancelled'
-        }
-        return status_mapping.get(self.status, 'unknown')
+        return self.STATUS_MAPPING.get(self.status, 'unknown')
 
     def __repr__(self):
         return f'<CheckinRecord {self.record_id}: User {self.user_id} at {self.checkin_time}>'
 
 
+class CheckinRecordArchive(db.Model):
+    """打卡记录归档表（冷数据，结构与 checkin_records 相同，保留原 record_id）"""
+    __tablename__ = 'checkin_records_archive'
+
+    record_id = Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = Column(db.Integer, nullable=False)
+    solo_user_id = Column(db.Integer, nullable=True, comment='社区规则打卡用户ID')
+    rule_id = Column(db.Integer, nullable=True)
+    community_rule_id = Column(db.Integer, nullable=True, comment='社区规则ID')
+    planned_time = Column(db.DateTime, nullable=False, comment='计划打卡时间')
+    planned_date = Column(db.Date, comment='计划日期')
+    checkin_time = Column(db.DateTime, comment='实际打卡时间')
+    checkin_type = Column(db.String(50), comment='打卡类型')
+    content = Column(db.Text, comment='打卡内容')
+    status = Column(db.Integer, default=0, comment='打卡状态: 0=未打卡, 1=已打卡, 2=已撤销')
+    updated_at = Column(db.DateTime)
+    created_at = Column(db.DateTime)
+    archived_at = Column(db.DateTime, default=datetime.now, comment='归档时间')
+
+    __table_args__ = (
+        db.Index('idx_checkin_records_archive_user_planned', 'user_id', 'planned_time'),
+    )
+
+    def __repr__(self):
+        return f'<CheckinRecordArchive {self.record_id}: User {self.user_id} at {self.planned_time}>'
+
+
+class CheckinIdempotencyKey(db.Model):
+    """打卡幂等键表（按 (用户, Idempotency-Key) 保存首次打卡结果，多进程间重试可直接返回）"""
+    __tablename__ = 'checkin_idempotency_keys'
+
+    user_id = Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
+    idempotency_key = Column(db.String(128), primary_key=True, comment='客户端请求的幂等键')
+    response = Column(db.Text, nullable=False, comment='首次打卡结果（JSON）')
+    created_at = Column(db.DateTime, default=datetime.now)
+    expires_at = Column(db.DateTime, nullable=False, comment='过期时间')
+
+    def __repr__(self):
+        return f'<CheckinIdempotencyKey User{self.user_id}: {self.idempotency_key}>'
+
+
 class UserAuditLog(db.Model):
     """用户审计日志表"""
     __tablename__ = 'user_audit_logs'
@@ -419,6 +502,72 @@ class Counters(db.Model):
         return f'<Counter {self.id}: {self.count}>'
 
 
+class BackgroundTaskLease(db.Model):
+    """后台任务租约表（多进程选主）"""
+    __tablename__ = 'background_task_leases'
+
+    lease_name = Column(db.String(64), primary_key=True, comment='租约名称')
+    holder_id = Column(db.String(128), comment='持有者标识')
+    acquired_at = Column(db.DateTime, comment='获得租约时间')
+    heartbeat_at = Column(db.DateTime, comment='最近心跳时间')
+    expires_at = Column(db.DateTime, nullable=False, comment='租约过期时间')
+
+    def __repr__(self):
+        return f'<BackgroundTaskLease {self.lease_name}: {self.holder_id} until {self.expires_at}>'
+
+
+class DailyCheckinPlan(db.Model):
+    """每日打卡计划表（按天物化的今日打卡事项）"""
+    __tablename__ = 'daily_checkin_plan'
+
+    plan_id = Column(db.Integer, primary_key=True, autoincrement=True)
+    plan_date = Column(db.Date, nullable=False, comment='计划日期')
+    user_id = Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    rule_source = Column(db.String(20), nullable=False, comment='规则来源: personal=个人规则, community=社区规则')
+    rule_id = Column(db.Integer, nullable=False, comment='个人规则为rule_id，社区规则为community_rule_id')
+    rule_name = Column(db.String(100), comment='规则名称')
+    icon_url = Column(db.String(500), comment='图标URL')
+    community_name = Column(db.String(100), comment='社区名称（社区规则）')
+    planned_time = Column(db.DateTime, nullable=False, comment='计划打卡时间')
+    status = Column(db.String(20), nullable=False, default='unchecked', comment='打卡状态: unchecked/checked')
+    record_id = Column(db.Integer, comment='打卡记录ID')
+    checkin_time = Column(db.DateTime, comment='实际打卡时间')
+    updated_at = Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint('plan_date', 'user_id', 'rule_source', 'rule_id', name='uq_daily_checkin_plan_item'),
+        # 今日计划读取：按用户和日期的范围读取
+        db.Index('idx_daily_checkin_plan_user_date', 'user_id', 'plan_date', 'planned_time'),
+    )
+
+    def __repr__(self):
+        return f'<DailyCheckinPlan {self.plan_date} User{self.user_id}-{self.rule_source}{self.rule_id}: {self.status}>'
+
+
+class DailyCheckinPlanVersion(db.Model):
+    """每日打卡计划版本表（用户的计划事项每次变更时递增，多进程据此判断今日计划缓存是否失效）"""
+    __tablename__ = 'daily_checkin_plan_versions'
+
+    user_id = Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
+    version = Column(db.Integer, nullable=False, default=0, comment='计划版本号')
+    updated_at = Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<DailyCheckinPlanVersion User{self.user_id}: {self.version}>'
+
+
+class DailyCheckinPlanBuild(db.Model):
+    """每日打卡计划构建标记表"""
+    __tablename__ = 'daily_checkin_plan_builds'
+
+    plan_date = Column(db.Date, primary_key=True, comment='计划日期')
+    item_count = Column(db.Integer, default=0, comment='构建的事项数')
+    built_at = Column(db.DateTime, default=datetime.now, comment='构建完成时间')
+
+    def __repr__(self):
+        return f'<DailyCheckinPlanBuild {self.plan_date}: {self.item_count}>'
+
+
 class CommunityEvent(db.Model):
     """社区事件表"""
     __tablename__ = 'community_events'
@@ -585,5 +734,43 @@ class UserCommunityRule(db.Model):
         }
 
 
+
+# 用户搜索索引：昵称、姓名和脱敏手机号的 FTS5 三元组（trigram）外部内容索引，由触发器与 users 表同步（仅SQLite）
+USER_SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "nickname, name, phone_number, content='users', content_rowid='user_id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, nickname, name, phone_number) "
+    "VALUES (new.user_id, new.nickname, new.name, new.phone_number); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, nickname, name, phone_number) "
+    "VALUES ('delete', old.user_id, old.nickname, old.name, old.phone_number); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF nickname, name, phone_number ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, nickname, name, phone_number) "
+    "VALUES ('delete', old.user_id, old.nickname, old.name, old.phone_number); "
+    "INSERT INTO users_fts(rowid, nickname, name, phone_number) "
+    "VALUES (new.user_id, new.nickname, new.name, new.phone_number); END",
+)
+for _statement in USER_SEARCH_INDEX_DDL:
+    event.listen(User.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(User.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS users_fts').execute_if(dialect='sqlite'))
+
+# 搜索索引的虚拟表及其影子表（users_fts_data 等）由原生 DDL 创建，不在 metadata 中
+USER_SEARCH_INDEX_PREFIX = 'users_fts'
+
+
+def include_in_migrations(name, type_, parent_names):
+    """
+    Alembic include_name 钩子：自动生成迁移时跳过用户搜索索引，避免被当作多余的表删除
+    :param name: 数据库对象名称
+    :param type_: 对象类型（table、column、index 等）
+    :param parent_names: 所属 schema/表名称
+    :return: 是否参与比较
+    """
+    if type_ == 'table' and name and name.startswith(USER_SEARCH_INDEX_PREFIX):
+        return False
+    return True
+
+
 # 导出 Base 供 Alembic 使用
 Base = db.Model
\ No newline at end of file
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+打卡记录每日唯一约束的一次性迁移脚本
+升级到按 (用户, 规则, 计划日期) 唯一的打卡记录前，在停服状态下对旧数据库执行一次：
+
+    ENV_TYPE=prod python migrate_checkin_daily_unique.py
+
+同一天的重复记录会先复制到 checkin_records_archive 并在日志中记录ID，再从打卡记录表删除
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+
+
+def main():
+    """执行迁移，返回进程退出码"""
+    flask_app = create_app()
+    with flask_app.app_context():
+        from wxcloudrun.checkin_record_service import CheckinRecordService
+        result = CheckinRecordService.migrate_daily_unique()
+    print(f"移入归档表 {result['removed']} 条, 回填计划日期 {result['backfilled']} 条")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
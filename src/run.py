@@ -120,6 +120,10 @@ def main():
                 migration_logger.error("数据库迁移失败，程序退出")
                 sys.exit(1)
         
+        # 旧数据库按需创建用户搜索索引
+        from wxcloudrun.user_search_service import UserSearchService
+        UserSearchService.ensure_index()
+
         # 4. 初始化超级管理员和默认社区
         should_initialize = False
         
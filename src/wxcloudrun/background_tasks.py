@@ -1,44 +1,502 @@
+import atexit
+import heapq
+import multiprocessing
 import os
 import threading
 import time as time_module
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, time, timedelta
 
-from flask import current_app
+from flask import Flask, current_app
+from sqlalchemy import and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.extensions import db
-from database.flask_models import CheckinRule, CheckinRecord, User
+from database.flask_models import (
+    CheckinRule, CheckinRecord, CommunityCheckinRule, User, UserCommunityRule
+)
 from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.checkin_statistics_service import CheckinStatisticsService
+from wxcloudrun.task_lease_service import TaskLeaseService
+from wxcloudrun.utils import schedule
+from wxcloudrun.utils.timeutil import day_range
 
+# 后台miss扫描使用的租约名称
+MISS_LEASE_NAME = 'missing-mark'
 
-def _should_check_today(rule, today):
-    if rule.frequency_type == 1:
-        weekday = today.weekday()
-        return bool(rule.week_days & (1 << weekday))
-    if rule.frequency_type == 2:
-        return today.weekday() < 5
-    if rule.frequency_type == 3:
-        if rule.custom_start_date and rule.custom_end_date:
-            return rule.custom_start_date <= today <= rule.custom_end_date
-        return False
-    return True
+# 本进程最近一次执行归档的日期
+_archived_for = None
+
+# 本进程最近一次校正社区人数计数的日期
+_reconciled_for = None
 
 
 def _planned_time_for_rule(rule, today):
-    if rule.time_slot_type == 4 and rule.custom_time:
-        return datetime.combine(today, rule.custom_time)
-    if rule.time_slot_type == 1:
-        return datetime.combine(today, time(9, 0))
-    if rule.time_slot_type == 2:
-        return datetime.combine(today, time(14, 0))
-    return datetime.combine(today, time(20, 0))
+    return datetime.combine(today, schedule.slot_time(rule.time_slot_type, rule.custom_time))
 
 
 def _process_missed_for_today(now):
+    """
+    标记今日已过宽限期但仍未打卡的规则为 miss
+    MISS_SCAN_MODE=bulk（默认）使用集合查询批量扫描个人规则和社区规则，legacy 使用逐条规则扫描
+    MISS_SCAN_WORKERS>1 时按 user_id 分片，在进程池中并行扫描；
+    只有 MISS_SCHEDULER_MODE=interval 的全量扫描走这里，deadline 模式按到期规则定向扫描，不使用进程池
+    """
+    scan_mode = os.getenv('MISS_SCAN_MODE', 'bulk')
+    if scan_mode == 'legacy':
+        return _process_missed_for_today_per_rule(now)
+
+    workers = int(os.getenv('MISS_SCAN_WORKERS', '1'))
+    if workers > 1:
+        return _scan_missed_for_today_parallel(now, workers)
+    return _scan_missed_shard(now)
+
+
+def _scan_missed_shard(now, shard=None, batch_size=None):
+    """扫描一个分片（shard为None时为全部）的个人规则和社区规则"""
+    return _merge_scan_reports(
+        _scan_missed_for_today_bulk(now, batch_size=batch_size, shard=shard),
+        _scan_community_missed_for_today_bulk(now, batch_size=batch_size, shard=shard)
+    )
+
+
+def _scan_missed_for_today_parallel(now, workers):
+    """
+    按 user_id 取模分成 workers 个分片，每个分片在独立进程中使用自己的数据库引擎扫描
+    内存数据库无法跨进程共享，退化为单进程扫描
+    :param now: 当前时间
+    :param workers: 分片数（即进程数）
+    :return: 合并后的扫描报告
+    """
+    database_uri = current_app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    if ':memory:' in database_uri:
+        current_app.logger.warning("[missing-mark] 内存数据库不支持多进程分片扫描，改为单进程扫描")
+        return _scan_missed_shard(now)
+
+    engine_options = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    batch_size = int(os.getenv('MISS_SCAN_BATCH_SIZE', '1000'))
+    # 使用spawn，避免子进程继承父进程的数据库连接
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [
+            executor.submit(_scan_shard_in_process, database_uri, engine_options,
+                            now, (index, workers), batch_size)
+            for index in range(workers)
+        ]
+        reports = [future.result() for future in futures]
+
+    report = _merge_scan_reports(*reports)
+    if report['inserted']:
+        # 子进程只能失效自己的缓存，由本进程清除统计缓存
+        CheckinStatisticsService.clear_cache()
+    current_app.logger.info(
+        f"[missing-mark] {workers} 个分片并行扫描完成: 扫描 {report['scanned']} 行，"
+        f"标记miss {report['inserted']} 条，批次 {report['batches']}"
+    )
+    return report
+
+
+def _scan_shard_in_process(database_uri, engine_options, now, shard, batch_size):
+    """子进程入口：创建只含数据库扩展的最小应用，扫描一个分片"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        try:
+            return _scan_missed_shard(now, shard=shard, batch_size=batch_size)
+        finally:
+            db.session.remove()
+            db.engine.dispose()
+
+
+def _merge_scan_reports(*reports):
+    """合并多个扫描报告"""
+    merged = {'scanned': 0, 'inserted': 0, 'batches': 0}
+    for report in reports:
+        for key in merged:
+            merged[key] += report.get(key, 0)
+    return merged
+
+
+def _due_unmarked_rules_query(today):
+    """
+    构建今日需要打卡且尚无打卡/miss记录的规则查询（反连接）
+    :param today: 今天的日期
+    :return: 查询对象，返回 rule_id, user_id, time_slot_type, custom_time 列
+    """
+    day_start, day_end = day_range(today)
+
+    # 今日已存在的打卡(1)或miss(0)记录，已撤销(2)的不算
+    marked = db.session.query(CheckinRecord.record_id).filter(
+        CheckinRecord.rule_id == CheckinRule.rule_id,
+        CheckinRecord.planned_time >= day_start,
+        CheckinRecord.planned_time < day_end,
+        CheckinRecord.status.in_([0, 1])
+    ).exists()
+
+    return db.session.query(
+        CheckinRule.rule_id,
+        CheckinRule.user_id,
+        CheckinRule.time_slot_type,
+        CheckinRule.custom_time
+    ).join(
+        User, User.user_id == CheckinRule.user_id
+    ).filter(
+        # 只处理启用的规则；到期时按数据库中的当前状态和排期重新判断，
+        # 其他进程停用/删除/改期但尚未同步到调度器的规则不会被误标记
+        CheckinRule.status == 1,
+        schedule.due_condition(CheckinRule, today),
+        ~marked
+    )
+
+
+def _due_community_rules_query(today):
+    """
+    今日需要打卡的已启用社区规则（规则级，用于调度器）
+    :return: 查询对象，返回 community_rule_id, time_slot_type, custom_time 列
+    """
+    return db.session.query(
+        CommunityCheckinRule.community_rule_id,
+        CommunityCheckinRule.time_slot_type,
+        CommunityCheckinRule.custom_time
+    ).filter(
+        CommunityCheckinRule.status == 1,
+        schedule.due_condition(CommunityCheckinRule, today)
+    )
+
+
+def _due_unmarked_community_query(today):
+    """
+    社区规则扇出：激活的用户映射 × 今日需要打卡的已启用社区规则，排除已有记录的成员（反连接）
+    :param today: 今天的日期
+    :return: 查询对象，返回 mapping_id, user_id, community_rule_id, time_slot_type, custom_time 列
+    """
+    day_start, day_end = day_range(today)
+
+    marked = db.session.query(CheckinRecord.record_id).filter(
+        CheckinRecord.community_rule_id == UserCommunityRule.community_rule_id,
+        CheckinRecord.solo_user_id == UserCommunityRule.user_id,
+        CheckinRecord.planned_time >= day_start,
+        CheckinRecord.planned_time < day_end,
+        CheckinRecord.status.in_([0, 1])
+    ).exists()
+
+    return db.session.query(
+        UserCommunityRule.mapping_id,
+        UserCommunityRule.user_id,
+        CommunityCheckinRule.community_rule_id,
+        CommunityCheckinRule.time_slot_type,
+        CommunityCheckinRule.custom_time
+    ).join(
+        CommunityCheckinRule,
+        CommunityCheckinRule.community_rule_id == UserCommunityRule.community_rule_id
+    ).join(
+        # 只处理仍在规则所属社区的成员
+        User, and_(User.user_id == UserCommunityRule.user_id,
+                   User.community_id == CommunityCheckinRule.community_id)
+    ).filter(
+        UserCommunityRule.is_active == True,
+        CommunityCheckinRule.status == 1,
+        schedule.due_condition(CommunityCheckinRule, today),
+        ~marked
+    )
+
+
+def _shard_filter(query, user_column, shard):
+    """
+    按 user_id 取模过滤出一个分片
+    :param shard: (分片序号, 分片总数)，为None时不过滤
+    """
+    if shard is None:
+        return query
+    index, count = shard
+    return query.filter(user_column % count == index)
+
+
+def _keyset_batches(query, key_column, batch_size):
+    """按主键游标分批读取查询结果"""
+    last_key = 0
+    while True:
+        rows = query.filter(key_column > last_key).order_by(key_column).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_key = getattr(rows[-1], key_column.key)
+
+
+def _id_chunk_batches(query, id_column, ids, batch_size):
+    """按指定ID分块读取查询结果"""
+    ids = sorted(ids)
+    for i in range(0, len(ids), batch_size):
+        rows = query.filter(id_column.in_(ids[i:i + batch_size])).all()
+        if rows:
+            yield rows
+
+
+def _run_bulk_scan(batches, today, now, to_record, label):
+    """
+    消费分批结果，为已过宽限期的行批量插入miss记录
+    :param batches: 行批次迭代器
+    :param to_record: (row, planned_dt) -> 记录字典
+    :param label: 日志标签
+    :return: 扫描报告字典 {'scanned': 扫描行数, 'inserted': 插入行数, 'batches': 批次数}
+    """
+    grace_delta = timedelta(minutes=int(os.getenv('MISS_GRACE_MINUTES', '0')))
+    report = {'scanned': 0, 'inserted': 0, 'batches': 0}
+
+    try:
+        for rows in batches:
+            report['scanned'] += len(rows)
+            report['batches'] += 1
+            report['inserted'] += _insert_missed_batch(rows, today, now, grace_delta, to_record)
+    except Exception as e:
+        # 如果数据库表不存在，跳过本次检查
+        if "no such table" in str(e).lower():
+            current_app.logger.warning(f"[missing-mark] 数据库表尚未创建，跳过检查。如果此日志仅出现一次，属于正常状态。")
+            db.session.rollback()
+            return report
+        raise
+
+    current_app.logger.info(
+        f"[missing-mark] {label}批量扫描完成: 扫描 {report['scanned']} 行，"
+        f"标记miss {report['inserted']} 条，批次 {report['batches']}"
+    )
+    return report
+
+
+def _scan_missed_for_today_bulk(now, batch_size=None, rule_ids=None, day=None, shard=None):
+    """
+    集合式扫描个人规则：一次反连接查询找出待标记规则，每批一条批量插入语句
+    :param now: 当前时间
+    :param batch_size: 每批处理的规则数，默认读取 MISS_SCAN_BATCH_SIZE
+    :param rule_ids: 仅扫描指定规则ID（调度器到期规则），为None时扫描全部规则
+    :param day: 扫描的计划日期，默认为 now 所在日期
+    :param shard: (分片序号, 分片总数)，仅扫描 user_id 落在该分片的规则
+    :return: 扫描报告字典 {'scanned': 扫描行数, 'inserted': 插入行数, 'batches': 批次数}
+    """
+    today = day or now.date()
+    if batch_size is None:
+        batch_size = int(os.getenv('MISS_SCAN_BATCH_SIZE', '1000'))
+
+    query = _shard_filter(_due_unmarked_rules_query(today), CheckinRule.user_id, shard)
+    if rule_ids is not None:
+        batches = _id_chunk_batches(query, CheckinRule.rule_id, rule_ids, batch_size)
+    else:
+        batches = _keyset_batches(query, CheckinRule.rule_id, batch_size)
+
+    def to_record(row, planned_dt):
+        return {
+            'rule_id': row.rule_id,
+            'user_id': row.user_id,
+            'checkin_time': None,
+            'planned_time': planned_dt,
+            'status': 0
+        }
+
+    return _run_bulk_scan(batches, today, now, to_record, '个人规则')
+
+
+def _scan_community_missed_for_today_bulk(now, batch_size=None, community_rule_ids=None, day=None, shard=None):
+    """
+    集合式扫描社区规则：按 UserCommunityRule 映射扇出，分块批量插入成员的miss记录
+    :param now: 当前时间
+    :param batch_size: 每批处理的映射数，默认读取 MISS_SCAN_BATCH_SIZE
+    :param community_rule_ids: 仅扫描指定社区规则ID，为None时扫描全部社区规则
+    :param day: 扫描的计划日期，默认为 now 所在日期
+    :param shard: (分片序号, 分片总数)，仅扫描 user_id 落在该分片的成员
+    :return: 扫描报告字典 {'scanned': 扫描行数, 'inserted': 插入行数, 'batches': 批次数}
+    """
+    today = day or now.date()
+    if batch_size is None:
+        batch_size = int(os.getenv('MISS_SCAN_BATCH_SIZE', '1000'))
+
+    query = _shard_filter(_due_unmarked_community_query(today), UserCommunityRule.user_id, shard)
+    if community_rule_ids is not None:
+        query = query.filter(CommunityCheckinRule.community_rule_id.in_(community_rule_ids))
+    batches = _keyset_batches(query, UserCommunityRule.mapping_id, batch_size)
+
+    def to_record(row, planned_dt):
+        return {
+            'community_rule_id': row.community_rule_id,
+            'solo_user_id': row.user_id,
+            'user_id': row.user_id,
+            'checkin_time': None,
+            'planned_time': planned_dt,
+            'status': 0
+        }
+
+    return _run_bulk_scan(batches, today, now, to_record, '社区规则')
+
+
+def _insert_missed_batch(rows, today, now, grace_delta, to_record):
+    """
+    为已过宽限期的行批量写入miss记录（单条 INSERT ... ON CONFLICT 语句）
+    :return: 插入或更新的记录数
+    """
+    missed_rows = []
+    for row in rows:
+        planned_dt = _planned_time_for_rule(row, today)
+        if now < planned_dt + grace_delta:
+            continue
+        missed_rows.append(to_record(row, planned_dt))
+
+    if not missed_rows:
+        return 0
+
+    # 当天已有撤销记录时改为miss；已打卡或已被并发标记的记录保持不变
+    if 'community_rule_id' in missed_rows[0]:
+        conflict_columns = ['user_id', 'community_rule_id', 'planned_date']
+    else:
+        conflict_columns = ['user_id', 'rule_id', 'planned_date']
+    stmt = sqlite_insert(CheckinRecord.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=conflict_columns,
+        set_={'status': stmt.excluded.status, 'updated_at': stmt.excluded.updated_at},
+        where=CheckinRecord.__table__.c.status == 2
+    )
+
+    try:
+        result = db.session.execute(stmt, missed_rows)
+        db.session.commit()
+        # miss记录计入完成率和连续天数，相关用户的统计缓存失效
+        CheckinStatisticsService.invalidate_users({row['user_id'] for row in missed_rows})
+        return result.rowcount if result.rowcount >= 0 else len(missed_rows)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"[missing-mark] 批量标记miss失败（{len(missed_rows)} 条）: {str(e)}", exc_info=True)
+        return 0
+
+
+class MissDeadlineScheduler:
+    """
+    基于截止时间的miss调度器
+    用最小堆保存今日待检查规则的截止时间（planned_time + MISS_GRACE_MINUTES），
+    只在有规则到期时唤醒处理；零点重建，规则增删改时由 CheckinRuleService 增量修补。
+    个人规则和社区规则分别以 rule_source 区分，社区规则在到期时再按成员扇出
+    """
+
+    def __init__(self, grace_minutes=0):
+        self.grace_delta = timedelta(minutes=grace_minutes)
+        self.built_for = None
+        self.built_at = None
+        self._heap = []
+        self._deadlines = {}  # (rule_source, rule_id, day) -> deadline，堆中不一致的条目视为已失效
+        self._changed = False
+        self._condition = threading.Condition()
+
+    def deadline_for(self, rule, day):
+        """计算规则在指定日期的miss截止时间"""
+        return _planned_time_for_rule(rule, day) + self.grace_delta
+
+    def rebuild(self, today):
+        """
+        重建今日的截止时间堆（保留前一日尚未到期的跨零点条目）
+        :return: 今日待检查的规则数
+        """
+        personal_rows = _due_unmarked_rules_query(today).all()
+        community_rows = _due_community_rules_query(today).all()
+        with self._condition:
+            self._deadlines = {k: v for k, v in self._deadlines.items() if k[2] != today}
+            for row in personal_rows:
+                self._deadlines[('personal', row.rule_id, today)] = self.deadline_for(row, today)
+            for row in community_rows:
+                self._deadlines[('community', row.community_rule_id, today)] = self.deadline_for(row, today)
+            self._heap = [(deadline,) + key for key, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+            self.built_for = today
+            self.built_at = datetime.now()
+            self._changed = True
+            self._condition.notify_all()
+        return len(personal_rows) + len(community_rows)
+
+    def schedule(self, rule_id, deadline, day, rule_source='personal'):
+        """新增或修改规则的截止时间"""
+        with self._condition:
+            self._deadlines[(rule_source, rule_id, day)] = deadline
+            heapq.heappush(self._heap, (deadline, rule_source, rule_id, day))
+            self._changed = True
+            self._condition.notify_all()
+
+    def discard(self, rule_id, day, rule_source='personal'):
+        """移除规则的截止时间（堆中条目惰性失效）"""
+        with self._condition:
+            self._deadlines.pop((rule_source, rule_id, day), None)
+
+    def pop_due(self, now):
+        """
+        弹出所有已到期的规则
+        :return: {(rule_source, 计划日期): [rule_id, ...]}
+        """
+        due = {}
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, rule_source, rule_id, day = heapq.heappop(self._heap)
+                key = (rule_source, rule_id, day)
+                if self._deadlines.get(key) != deadline:
+                    continue  # 已被修改或移除
+                del self._deadlines[key]
+                due.setdefault((rule_source, day), []).append(rule_id)
+        return due
+
+    def next_deadline(self):
+        """返回最近的有效截止时间，没有则返回None"""
+        with self._condition:
+            while self._heap:
+                deadline = self._heap[0][0]
+                if self._deadlines.get(self._heap[0][1:]) == deadline:
+                    return deadline
+                heapq.heappop(self._heap)
+            return None
+
+    def pending_count(self):
+        with self._condition:
+            return len(self._deadlines)
+
+    def wait(self, timeout):
+        """等待到超时或调度变更（避免在计算超时期间的变更丢失）"""
+        with self._condition:
+            if not self._changed:
+                self._condition.wait(timeout)
+            self._changed = False
+
+
+# 当前进程中运行的调度器，未启用deadline模式时为None
+_deadline_scheduler = None
+
+
+def notify_rule_changed(rule, rule_source='personal'):
+    """
+    规则创建/修改/删除（社区规则启用/停用）后修补调度器中的今日截止时间
+    :param rule: CheckinRule 或 CommunityCheckinRule 对象
+    :param rule_source: 规则来源（personal/community）
+    """
+    scheduler = _deadline_scheduler
+    if scheduler is None or rule is None:
+        return
+    rule_id = rule.community_rule_id if rule_source == 'community' else rule.rule_id
+    try:
+        today = datetime.now().date()
+        # 个人规则和社区规则都只处理启用状态
+        active = rule.status == 1
+        if not active or not schedule.is_due(rule, today):
+            scheduler.discard(rule_id, today, rule_source)
+        else:
+            scheduler.schedule(rule_id, scheduler.deadline_for(rule, today), today, rule_source)
+    except Exception as e:
+        current_app.logger.error(f"[missing-mark] 更新规则 {rule_id} 的调度失败: {str(e)}", exc_info=True)
+
+
+def _process_missed_for_today_per_rule(now):
     today = now.date()
     grace_minutes = int(os.getenv('MISS_GRACE_MINUTES', '0'))
     grace_delta = timedelta(minutes=grace_minutes)
 
     try:
-        rules = CheckinRule.query.filter(CheckinRule.status != 2).all()  # 排除已删除的规则
+        rules = CheckinRule.query.filter(CheckinRule.status == 1).all()  # 排除停用和已删除的规则
     except Exception as e:
         # 如果数据库表不存在，跳过本次检查
         if "no such table" in str(e).lower():
@@ -54,7 +512,7 @@ def _process_missed_for_today(now):
                 continue
             # 所有用户都可以有打卡规则，不需要特殊检查
 
-            if not _should_check_today(rule, today):
+            if not schedule.is_due(rule, today):
                 continue
 
             planned_dt = _planned_time_for_rule(rule, today)
@@ -85,37 +543,216 @@ def _process_missed_for_today(now):
             )
 
 
-def _run_loop():
+class LeaderLease:
+    """
+    后台任务选主：基于 TaskLeaseService 的数据库租约
+    只有持有租约的进程执行扫描，按 ttl/3 心跳续约；持有者失联后其他进程最迟在 ttl + 心跳间隔内接管
+    """
+
+    def __init__(self, lease_name, ttl_seconds, holder_id=None):
+        self.lease_name = lease_name
+        self.ttl_seconds = ttl_seconds
+        self.holder_id = holder_id or TaskLeaseService.generate_holder_id()
+        self.is_leader = False
+
+    @property
+    def heartbeat_seconds(self):
+        return max(1.0, self.ttl_seconds / 3)
+
+    def refresh(self):
+        """
+        获取或续约租约
+        :return: 当前进程是否为leader
+        """
+        acquired = TaskLeaseService.try_acquire(self.lease_name, self.holder_id, self.ttl_seconds)
+        if acquired and not self.is_leader:
+            current_app.logger.info(f"[missing-mark] {self.holder_id} 成为后台扫描leader")
+        elif self.is_leader and not acquired:
+            current_app.logger.warning(f"[missing-mark] {self.holder_id} 失去后台扫描leader租约")
+        self.is_leader = acquired
+        return acquired
+
+    def release(self):
+        if self.is_leader:
+            TaskLeaseService.release(self.lease_name, self.holder_id)
+            self.is_leader = False
+
+
+def _create_leader_lease():
+    """创建后台扫描租约，有效期由 MISS_LEASE_TTL_SECONDS 配置（默认90秒）"""
+    ttl_seconds = max(3, int(os.getenv('MISS_LEASE_TTL_SECONDS', '90')))
+    return LeaderLease(MISS_LEASE_NAME, ttl_seconds)
+
+
+def _run_loop(lease):
     interval_minutes = int(os.getenv('MISS_CHECK_INTERVAL_MINUTES', '5'))
     interval_seconds = max(1, interval_minutes * 60)
     current_app.logger.info(
         f"[missing-mark] 后台服务启动，检查间隔 {interval_minutes} 分钟"
     )
 
+    last_run = None
     while True:
         try:
             with current_app.app_context():
                 now = datetime.now()
-                _process_missed_for_today(now)
+                if not lease.refresh():
+                    last_run = None  # 接管后立即执行一次
+                elif last_run is None or (now - last_run).total_seconds() >= interval_seconds:
+                    _ensure_daily_plan(now.date())
+                    _archive_old_records(now.date())
+                    _reconcile_community_counters(now.date())
+                    _process_missed_for_today(now)
+                    last_run = now
         except Exception as e:
             current_app.logger.error(f"[missing-mark] 后台服务循环错误: {str(e)}", exc_info=True)
         finally:
-            time_module.sleep(interval_seconds)
+            # 按心跳间隔醒来续约，扫描仍按检查间隔执行
+            time_module.sleep(min(interval_seconds, lease.heartbeat_seconds))
+
+
+def _run_deadline_loop(scheduler, lease):
+    """
+    按截止时间驱动的循环：空闲时阻塞等待，到期后只处理到期规则；非leader只续约等待。
+    其他进程的规则变更只修补各自进程的调度器，leader 按 MISS_RESYNC_MINUTES（默认5分钟）重建以同步新增和改期的规则
+    """
+    retry_seconds = max(1, int(os.getenv('MISS_CHECK_INTERVAL_MINUTES', '5')) * 60)
+    resync_minutes = int(os.getenv('MISS_RESYNC_MINUTES', '5'))
+    resync_delta = timedelta(minutes=resync_minutes) if resync_minutes > 0 else None
+    current_app.logger.info(
+        f"[missing-mark] 后台服务启动（截止时间调度），宽限 {scheduler.grace_delta}，重新同步间隔 {resync_minutes} 分钟"
+    )
+
+    while True:
+        timeout = retry_seconds
+        try:
+            if not lease.refresh():
+                # 非leader不处理规则，接管后需要重建以同步leader期间的修改
+                scheduler.built_for = None
+                scheduler.wait(lease.heartbeat_seconds)
+                continue
+
+            now = datetime.now()
+            _ensure_daily_plan(now.date())
+            _archive_old_records(now.date())
+            _reconcile_community_counters(now.date())
+            # 零点或周期性重建（同步其他进程对规则的修改）
+            if (scheduler.built_for != now.date()
+                    or (resync_delta and now - scheduler.built_at >= resync_delta)):
+                pending = scheduler.rebuild(now.date())
+                current_app.logger.info(f"[missing-mark] 调度器已重建，今日待检查规则 {pending} 条")
+
+            for (rule_source, day), rule_ids in scheduler.pop_due(now).items():
+                if rule_source == 'community':
+                    _scan_community_missed_for_today_bulk(now, community_rule_ids=rule_ids, day=day)
+                else:
+                    _scan_missed_for_today_bulk(now, rule_ids=rule_ids, day=day)
+
+            now = datetime.now()
+            wake_at = datetime.combine(now.date() + timedelta(days=1), time.min)
+            if resync_delta:
+                wake_at = min(wake_at, scheduler.built_at + resync_delta)
+            next_deadline = scheduler.next_deadline()
+            if next_deadline:
+                wake_at = min(wake_at, next_deadline)
+            # 最迟在下次心跳时醒来续约
+            timeout = min(max(0.0, (wake_at - now).total_seconds()), lease.heartbeat_seconds)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"[missing-mark] 截止时间调度循环错误: {str(e)}", exc_info=True)
+        scheduler.wait(timeout)
+
+
+def _ensure_daily_plan(today):
+    """零点后构建当天的每日打卡计划（已构建时只做一次主键查询）"""
+    from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+    try:
+        if DailyCheckinPlanService.ensure_built(today):
+            current_app.logger.info(f"[missing-mark] 已构建 {today} 的每日打卡计划")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"[missing-mark] 构建每日打卡计划失败: {str(e)}", exc_info=True)
+
+
+def _archive_old_records(today):
+    """每天一次把超过保留期的打卡记录迁移到归档表，并清理过期的打卡幂等键"""
+    global _archived_for
+    if _archived_for == today:
+        return
+    from wxcloudrun.checkin_archive_service import CheckinArchiveService
+    try:
+        archived = CheckinArchiveService.archive_records(CheckinArchiveService.archive_cutoff(today))
+        purged = CheckinRecordService.purge_idempotency_keys()
+        _archived_for = today
+        if archived:
+            current_app.logger.info(f"[missing-mark] 已归档 {archived} 条历史打卡记录")
+        if purged:
+            current_app.logger.info(f"[missing-mark] 已清理 {purged} 条过期打卡幂等键")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"[missing-mark] 归档历史打卡记录失败: {str(e)}", exc_info=True)
+
+
+def _reconcile_community_counters(today):
+    """每天一次按实时统计校正社区人数计数表"""
+    global _reconciled_for
+    if _reconciled_for == today:
+        return
+    from wxcloudrun.community_counter_service import CommunityCounterService
+    try:
+        repaired = CommunityCounterService.reconcile()
+        _reconciled_for = today
+        if repaired:
+            current_app.logger.info(f"[missing-mark] 已校正 {repaired} 个社区的人数计数")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"[missing-mark] 校正社区人数计数失败: {str(e)}", exc_info=True)
 
 
 def start_missing_check_service(app):
-    """启动缺失检查服务"""
+    """启动缺失检查服务（每个进程都启动线程，通过数据库租约保证只有一个进程执行扫描）"""
     try:
+        with app.app_context():
+            TaskLeaseService.ensure_table()
+        lease = _create_leader_lease()
+
+        # MISS_SCHEDULER_MODE=deadline（默认）按截止时间调度，interval 按固定间隔全量扫描
+        scheduler_mode = os.getenv('MISS_SCHEDULER_MODE', 'deadline')
+        if scheduler_mode == 'interval':
+            target, args = _run_loop_with_context, (app, lease)
+        else:
+            if int(os.getenv('MISS_SCAN_WORKERS', '1')) > 1:
+                app.logger.warning("[missing-mark] MISS_SCAN_WORKERS 仅在 MISS_SCHEDULER_MODE=interval 时生效，"
+                                   "截止时间调度按到期规则定向扫描，不使用进程池")
+            global _deadline_scheduler
+            _deadline_scheduler = MissDeadlineScheduler(int(os.getenv('MISS_GRACE_MINUTES', '0')))
+            target, args = _run_deadline_loop_with_context, (app, _deadline_scheduler, lease)
+
         # 创建后台线程
-        t = threading.Thread(target=_run_loop_with_context, daemon=True, args=(app,))
+        t = threading.Thread(target=target, daemon=True, args=args)
         t.start()
-        app.logger.info("[missing-mark] 后台服务线程已启动")
+        atexit.register(_release_lease_with_context, app, lease)
+        app.logger.info(f"[missing-mark] 后台服务线程已启动，调度模式: {scheduler_mode}，租约持有者标识: {lease.holder_id}")
     except Exception as e:
         app.logger.error(f"[missing-mark] 启动后台服务失败: {str(e)}")
 
 
-def _run_loop_with_context(app):
+def _run_loop_with_context(app, lease):
     """在线程中运行循环，保持应用上下文"""
     with app.app_context():
-        _run_loop()
+        _run_loop(lease)
+
+
+def _run_deadline_loop_with_context(app, scheduler, lease):
+    """在线程中运行截止时间调度循环，保持应用上下文"""
+    with app.app_context():
+        _run_deadline_loop(scheduler, lease)
 
+
+def _release_lease_with_context(app, lease):
+    """进程退出时释放租约，使其他进程立即接管"""
+    try:
+        with app.app_context():
+            lease.release()
+    except Exception:
+        pass
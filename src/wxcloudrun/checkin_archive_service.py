@@ -0,0 +1,104 @@
+"""
+打卡记录归档服务模块
+超过保留期的打卡记录按批迁移到 checkin_records_archive，热表只保留近期数据；
+历史和统计查询通过 record_source 同时读取热表和归档表
+"""
+
+import logging
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import and_, insert, select, union_all
+from sqlalchemy.orm import aliased
+from database.flask_models import db, CheckinRecord, CheckinRecordArchive
+from .utils.timeutil import day_range
+
+logger = logging.getLogger('CheckinArchiveService')
+
+
+class CheckinArchiveService:
+    """打卡记录归档服务类"""
+
+    # 每批迁移的记录数
+    ARCHIVE_BATCH_SIZE = 1000
+
+    @staticmethod
+    def retention_days():
+        """热表保留天数，由 CHECKIN_ARCHIVE_DAYS 配置（默认180天，0表示不归档）"""
+        return int(os.getenv('CHECKIN_ARCHIVE_DAYS', '180'))
+
+    @staticmethod
+    def archive_cutoff(today=None):
+        """
+        计算归档分界时间：计划时间早于该时间的记录会被归档
+        :param today: 当前日期，默认今天
+        :return: datetime，不归档时返回None
+        """
+        days = CheckinArchiveService.retention_days()
+        if days <= 0:
+            return None
+        return day_range((today or date.today()) - timedelta(days=days))[0]
+
+    @staticmethod
+    def archive_records(cutoff=None, batch_size=None):
+        """
+        将计划时间早于分界时间的记录按批迁移到归档表，每批单独提交
+        :param cutoff: 归档分界时间，默认按保留天数计算
+        :param batch_size: 每批记录数，默认 CHECKIN_ARCHIVE_BATCH_SIZE 或 ARCHIVE_BATCH_SIZE
+        :return: 迁移的记录数
+        """
+        cutoff = cutoff or CheckinArchiveService.archive_cutoff()
+        if cutoff is None:
+            return 0
+        batch_size = batch_size or int(os.getenv(
+            'CHECKIN_ARCHIVE_BATCH_SIZE', str(CheckinArchiveService.ARCHIVE_BATCH_SIZE)))
+        column_names = CheckinRecord.__table__.columns.keys()
+
+        archived = 0
+        try:
+            while True:
+                record_ids = [row.record_id for row in db.session.query(CheckinRecord.record_id).filter(
+                    CheckinRecord.planned_time < cutoff
+                ).order_by(CheckinRecord.record_id).limit(batch_size).all()]
+                if not record_ids:
+                    break
+
+                db.session.execute(insert(CheckinRecordArchive).from_select(
+                    column_names,
+                    select(*CheckinRecord.__table__.columns).where(CheckinRecord.record_id.in_(record_ids))
+                ))
+                db.session.query(CheckinRecord).filter(
+                    CheckinRecord.record_id.in_(record_ids)
+                ).delete(synchronize_session=False)
+                db.session.commit()
+                archived += len(record_ids)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"归档打卡记录失败: 已归档 {archived} 条, {str(e)}")
+            raise
+
+        if archived:
+            logger.info(f"归档打卡记录完成: 分界时间={cutoff}, 记录数={archived}")
+        return archived
+
+    @staticmethod
+    def record_source(where=None, start_time=None):
+        """
+        返回用于读取打卡记录的实体：区间起点不早于归档分界时只读热表，否则为热表和归档表的 UNION ALL
+        :param where: 函数，接收表模型返回过滤条件列表，分别下推到两张表
+        :param start_time: 查询区间的开始时间，为None表示不限
+        :return: CheckinRecord 或映射到合并子查询的 CheckinRecord 别名
+        """
+        cutoff = CheckinArchiveService.archive_cutoff()
+        if cutoff is not None and start_time is not None and start_time >= cutoff:
+            return CheckinRecord
+
+        column_names = CheckinRecord.__table__.columns.keys()
+        selects = []
+        for model in (CheckinRecord, CheckinRecordArchive):
+            stmt = select(*[model.__table__.columns[name] for name in column_names])
+            conditions = where(model) if where else []
+            if conditions:
+                stmt = stmt.where(and_(*conditions))
+            selects.append(stmt)
+        return aliased(CheckinRecord, union_all(*selects).subquery('checkin_records_all'))
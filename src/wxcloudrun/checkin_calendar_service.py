@@ -0,0 +1,179 @@
+"""
+打卡月历服务模块
+一个月内每条规则的应打卡/已打卡/miss/待打卡日期用31位掩码表示（第 i 位对应当月第 i+1 天），
+打卡记录的按日分组和规则的排期字段由一条查询得到，应打卡日由排期计算展开
+"""
+
+import calendar
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, and_, case, func, literal, select, union, union_all
+from database.flask_models import db, CheckinRule, CommunityCheckinRule, User, UserCommunityRule
+from .checkin_archive_service import CheckinArchiveService
+from .utils import schedule
+from .utils.timeutil import date_number, day_number, day_range
+
+logger = logging.getLogger('CheckinCalendarService')
+
+
+class CheckinCalendarService:
+    """打卡月历服务类"""
+
+    @staticmethod
+    def parse_month(value, today=None):
+        """
+        解析 YYYY-MM 格式的月份
+        :param value: 月份字符串，为空时为当月
+        :param today: 当前日期，默认今天
+        :return: 当月1日
+        :raises ValueError: 格式错误时
+        """
+        if not value:
+            return (today or date.today()).replace(day=1)
+        try:
+            return datetime.strptime(value, '%Y-%m').date()
+        except ValueError as e:
+            raise ValueError(f'无效的月份格式: {value}') from e
+
+    @staticmethod
+    def get_month_calendar(user_id, month=None, today=None):
+        """
+        获取用户一个月的打卡月历
+        :param user_id: 用户ID
+        :param month: 月份（YYYY-MM），默认当月
+        :param today: 当前日期，默认今天（待打卡只包含今天及以后）
+        :return: 字典，rules 中每项包含 rule_source、rule_id、rule_name、icon_url、
+                 due_mask、checked_mask、missed_mask、pending_mask
+        :raises ValueError: 月份格式错误时
+        """
+        today = today or date.today()
+        month_start = CheckinCalendarService.parse_month(month, today)
+        days = calendar.monthrange(month_start.year, month_start.month)[1]
+        month_end = month_start + timedelta(days=days - 1)
+
+        rows = CheckinCalendarService._query_month(user_id, month_start, month_end)
+
+        all_days = (1 << days) - 1
+        if today < month_start:
+            open_days = all_days
+        elif today > month_end:
+            open_days = 0
+        else:
+            open_days = all_days & ~((1 << (today - month_start).days) - 1)
+
+        rules = []
+        for row in rows:
+            checked = int(row.checked_mask or 0)
+            missed = int(row.missed_mask or 0) & ~checked
+            due = 0
+            if row.active:
+                due = schedule.due_mask(row, month_start, month_end)
+                # 个人规则创建之前、社区规则分配给用户之前的日期不需要打卡
+                if row.created_at and row.created_at.date() > month_start:
+                    due &= ~((1 << (row.created_at.date() - month_start).days) - 1)
+            # 有记录的日期一定是应打卡日（规则排期修改或已停用时以记录为准）
+            due |= checked | missed
+            rules.append({
+                'rule_source': row.rule_source,
+                'rule_id': row.rule_id,
+                'rule_name': row.rule_name,
+                'icon_url': row.icon_url,
+                'due_mask': due,
+                'checked_mask': checked,
+                'missed_mask': missed,
+                'pending_mask': due & ~(checked | missed) & open_days
+            })
+
+        return {
+            'month': month_start.strftime('%Y-%m'),
+            'days': days,
+            'rules': rules
+        }
+
+    @staticmethod
+    def _query_month(user_id, month_start, month_end):
+        """
+        一条查询得到当月有记录或当前有效的规则，以及每条规则的打卡/miss日期掩码和排期字段
+        """
+        window_start, _ = day_range(month_start)
+        _, window_end = day_range(month_end)
+
+        # 撤销的记录不计入月历
+        def where(model):
+            return [
+                model.user_id == user_id,
+                model.planned_time >= window_start,
+                model.planned_time < window_end,
+                model.status.in_([0, 1])
+            ]
+
+        records = CheckinArchiveService.record_source(where, window_start)
+        rule_source = case((records.community_rule_id.isnot(None), 'community'), else_='personal')
+        rule_key = func.coalesce(records.community_rule_id, records.rule_id)
+        day_index = day_number(records.planned_time) - date_number(month_start)
+
+        # 每条规则每天一行，再把日期折叠为位掩码
+        per_day = select(
+            rule_source.label('rule_source'),
+            rule_key.label('rule_id'),
+            day_index.label('day_index'),
+            func.max(case((records.status == 1, 1), else_=0)).label('checked'),
+            func.max(case((records.status == 0, 1), else_=0)).label('missed')
+        ).where(and_(*where(records))).group_by(rule_source, rule_key, day_index).subquery('calendar_days')
+        day_bit = literal(1, Integer).op('<<', return_type=Integer)(per_day.c.day_index)
+        masks = select(
+            per_day.c.rule_source,
+            per_day.c.rule_id,
+            func.sum(case((per_day.c.checked == 1, day_bit), else_=0)).label('checked_mask'),
+            func.sum(case((per_day.c.missed == 1, day_bit), else_=0)).label('missed_mask')
+        ).group_by(per_day.c.rule_source, per_day.c.rule_id).subquery('calendar_masks')
+
+        # 当前有效的规则：已启用的个人规则，以及仍在所属社区且已启用的社区规则；
+        # 应打卡的起始时间个人规则取规则创建时间，社区规则取分配给该用户的时间
+        active = union_all(
+            select(literal('personal').label('rule_source'), CheckinRule.rule_id.label('rule_id'),
+                   CheckinRule.created_at.label('created_at')).where(
+                CheckinRule.user_id == user_id,
+                CheckinRule.status == 1
+            ),
+            select(literal('community'), UserCommunityRule.community_rule_id, UserCommunityRule.created_at).join(
+                CommunityCheckinRule,
+                CommunityCheckinRule.community_rule_id == UserCommunityRule.community_rule_id
+            ).join(
+                User, and_(User.user_id == UserCommunityRule.user_id,
+                           User.community_id == CommunityCheckinRule.community_id)
+            ).where(
+                UserCommunityRule.user_id == user_id,
+                UserCommunityRule.is_active == True,
+                CommunityCheckinRule.status == 1
+            )
+        ).subquery('calendar_active_rules')
+        keys = union(
+            select(masks.c.rule_source, masks.c.rule_id),
+            select(active.c.rule_source, active.c.rule_id)
+        ).subquery('calendar_rules')
+
+        return db.session.query(
+            keys.c.rule_source,
+            keys.c.rule_id,
+            active.c.rule_id.isnot(None).label('active'),
+            func.coalesce(CommunityCheckinRule.rule_name, CheckinRule.rule_name).label('rule_name'),
+            func.coalesce(CommunityCheckinRule.icon_url, CheckinRule.icon_url).label('icon_url'),
+            func.coalesce(CommunityCheckinRule.frequency_type, CheckinRule.frequency_type).label('frequency_type'),
+            func.coalesce(CommunityCheckinRule.week_days, CheckinRule.week_days).label('week_days'),
+            func.coalesce(CommunityCheckinRule.custom_start_date, CheckinRule.custom_start_date).label('custom_start_date'),
+            func.coalesce(CommunityCheckinRule.custom_end_date, CheckinRule.custom_end_date).label('custom_end_date'),
+            active.c.created_at,
+            masks.c.checked_mask,
+            masks.c.missed_mask
+        ).select_from(keys).outerjoin(
+            masks, and_(masks.c.rule_source == keys.c.rule_source, masks.c.rule_id == keys.c.rule_id)
+        ).outerjoin(
+            active, and_(active.c.rule_source == keys.c.rule_source, active.c.rule_id == keys.c.rule_id)
+        ).outerjoin(
+            CheckinRule, and_(keys.c.rule_source == 'personal', CheckinRule.rule_id == keys.c.rule_id)
+        ).outerjoin(
+            CommunityCheckinRule,
+            and_(keys.c.rule_source == 'community', CommunityCheckinRule.community_rule_id == keys.c.rule_id)
+        ).order_by(keys.c.rule_source.desc(), keys.c.rule_id).all()
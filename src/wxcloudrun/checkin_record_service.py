@@ -3,12 +3,20 @@
 处理打卡记录相关的核心业务逻辑
 """
 
+import base64
+import json
 import logging
 from datetime import datetime, date, time, timedelta
+from sqlalchemy import UniqueConstraint, delete, insert, inspect, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import OperationalError
-from sqlalchemy import func
+from .checkin_archive_service import CheckinArchiveService
 from .checkin_rule_service import CheckinRuleService
-from database.flask_models import CheckinRecord, SupervisionRuleRelation, db
+from .checkin_statistics_service import CheckinStatisticsService
+from .utils.timeutil import day_range
+from database.flask_models import (
+    CheckinIdempotencyKey, CheckinRecord, CheckinRecordArchive, SupervisionRuleRelation, db
+)
 
 logger = logging.getLogger('CheckinRecordService')
 
@@ -19,16 +27,96 @@ class CheckinRecordService:
     # 撤销打卡的时间限制（分钟）
     CANCEL_TIME_LIMIT_MINUTES = 30
 
+    # 批量打卡单次最多事项数
+    BATCH_CHECKIN_MAX_ITEMS = 50
+
+    # 打卡历史每页默认/最大条数，以及流式输出时每批读取的条数
+    HISTORY_PAGE_SIZE = 20
+    HISTORY_MAX_PAGE_SIZE = 100
+    HISTORY_STREAM_BATCH_SIZE = 500
+
+    # Idempotency-Key 的保留时长（小时）
+    IDEMPOTENCY_TTL_HOURS = 24
+
+    @staticmethod
+    def migrate_daily_unique(batch_size=500):
+        """
+        一次性迁移：让旧数据库满足每日唯一约束（由 migrate_checkin_daily_unique.py 显式执行，可重复执行）。
+        补齐 planned_date 列；打卡记录表中同一用户同一规则同一天的重复记录只保留一条（优先已打卡，其次最新），
+        其余记录先复制到归档表并记录ID再删除；随后回填两张表的 planned_date，最后补建唯一索引。
+        归档表没有唯一约束，其中的记录只回填不删除
+        :param batch_size: 每批复制/删除的记录数
+        :return: 移入归档表的重复记录数和回填的记录数
+        """
+        records = CheckinRecord.__table__
+        archive = CheckinRecordArchive.__table__
+        removed = backfilled = 0
+        with db.engine.begin() as conn:
+            inspector = inspect(conn)
+            for table in (records, archive):
+                if 'planned_date' not in {column['name'] for column in inspector.get_columns(table.name)}:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN planned_date DATE'))
+
+            # 重复记录只可能出现在尚未回填 planned_date 的旧数据中
+            duplicate_ids = [row.record_id for row in conn.execute(text(f"""
+                SELECT record_id FROM (
+                    SELECT record_id, planned_date, ROW_NUMBER() OVER (
+                        PARTITION BY user_id, rule_id, community_rule_id, date(planned_time)
+                        ORDER BY CASE WHEN status = 1 THEN 0 ELSE 1 END, record_id DESC
+                    ) AS row_number
+                    FROM {records.name}
+                    WHERE EXISTS (SELECT 1 FROM {records.name} WHERE planned_date IS NULL)
+                ) WHERE row_number > 1 ORDER BY record_id
+            """))]
+            if duplicate_ids:
+                logger.warning(f"打卡记录每日唯一迁移: 重复记录 {len(duplicate_ids)} 条移入归档表, "
+                               f"record_id={duplicate_ids}")
+            for start in range(0, len(duplicate_ids), batch_size):
+                batch = duplicate_ids[start:start + batch_size]
+                conn.execute(insert(archive).from_select(
+                    records.columns.keys(),
+                    select(*records.columns).where(records.c.record_id.in_(batch))
+                ))
+                removed += conn.execute(delete(records).where(records.c.record_id.in_(batch))).rowcount
+
+            for table in (records, archive):
+                backfilled += conn.execute(text(
+                    f'UPDATE {table.name} SET planned_date = date(planned_time) WHERE planned_date IS NULL'
+                )).rowcount
+
+            # 按模型建表时唯一约束已存在；旧表新增列后补建同名唯一索引，ON CONFLICT 同样可以依赖唯一索引
+            inspector = inspect(conn)
+            existing = {tuple(constraint['column_names'])
+                        for constraint in inspector.get_unique_constraints(records.name)}
+            existing.update(tuple(index['column_names'])
+                            for index in inspector.get_indexes(records.name) if index['unique'])
+            for constraint in records.constraints:
+                if isinstance(constraint, UniqueConstraint) and tuple(constraint.columns.keys()) not in existing:
+                    conn.execute(text(
+                        f"CREATE UNIQUE INDEX IF NOT EXISTS {constraint.name} "
+                        f"ON {records.name} ({', '.join(constraint.columns.keys())})"
+                    ))
+
+        logger.info(f"打卡记录每日唯一迁移完成: 移入归档表 {removed} 条, 回填计划日期 {backfilled} 条")
+        return {'removed': removed, 'backfilled': backfilled}
+
     @staticmethod
-    def perform_checkin(rule_id, user_id, rule_source='personal'):
+    def perform_checkin(rule_id, user_id, rule_source='personal', idempotency_key=None):
         """
-        执行打卡操作
+        执行打卡操作：一条 INSERT ... ON CONFLICT 语句写入当天记录，
+        由 (用户, 规则, 计划日期) 唯一约束保证每天只有一条记录
         :param rule_id: 规则ID
         :param user_id: 用户ID
         :param rule_source: 规则来源（personal/community）
+        :param idempotency_key: 客户端请求的幂等键，相同的键直接返回首次打卡结果
         :return: 打卡记录信息字典
         :raises ValueError: 当规则不存在、无权限或今日已打卡时
         """
+        if idempotency_key:
+            replay = CheckinRecordService._load_idempotent_result(user_id, idempotency_key)
+            if replay is not None:
+                return replay
+
         if rule_source == 'community':
             # 验证社区规则是否存在且用户有权限
             from .community_checkin_rule_service import CommunityCheckinRuleService
@@ -50,44 +138,147 @@ class CheckinRecordService:
             if not rule or rule.user_id != user_id:  # 更新字段名
                 raise ValueError('打卡规则不存在或无权限')
 
-        # 检查今天是否已有打卡记录
+        # 新建记录，或把当天未打卡/已撤销的记录改为已打卡；已打卡时不修改并返回None
+        # 幂等键与打卡记录在同一事务内写入，并发的相同请求只会有一个成功写入记录
         today = date.today()
-        existing_records = CheckinRecordService._query_records_by_rule_and_date(
-            rule_id, today, rule_source)
-
-        # 查找当天已有的打卡记录
-        for record in existing_records:
-            if record.status == 1:  # 已打卡
-                raise ValueError('今日该事项已打卡，请勿重复打卡')
-
-        # 记录打卡时间
         checkin_time = datetime.now()
-
-        # 检查是否有未打卡状态的记录可以更新
-        existing_unchecked = None
-        for record in existing_records:
-            if record.status == 0:  # 未打卡
-                existing_unchecked = record
-                break
-
-        if existing_unchecked:
-            # 更新已有记录
-            record_id = CheckinRecordService._update_record_status(
-                existing_unchecked.record_id, checkin_time, 1)
-        else:
-            # 创建新的打卡记录
-            planned_time = CheckinRecordService._calculate_planned_time(rule, today)
-            record_id = CheckinRecordService._create_record(
-                rule_id, user_id, checkin_time, planned_time, status=1, rule_source=rule_source)
-
-        logger.info(f"用户 {user_id} 打卡成功，规则ID: {rule_id}, 记录ID: {record_id}")
-
-        return {
+        planned_time = CheckinRecordService._calculate_planned_time(rule, today)
+        record_id = CheckinRecordService._upsert_daily_record(
+            rule_id, user_id, rule_source, planned_time, checkin_time, status=1, commit=False)
+        if record_id is None:
+            db.session.rollback()
+            if idempotency_key:
+                # 相同幂等键的并发请求已先一步完成打卡时返回其结果
+                replay = CheckinRecordService._load_idempotent_result(user_id, idempotency_key)
+                if replay is not None:
+                    return replay
+            raise ValueError('今日该事项已打卡，请勿重复打卡')
+
+        result = {
             'rule_id': rule_id,
             'record_id': record_id,
             'checkin_time': checkin_time.strftime('%Y-%m-%d %H:%M:%S'),
             'message': '打卡成功'
         }
+        try:
+            if idempotency_key:
+                CheckinRecordService._save_idempotent_result(user_id, idempotency_key, result, checkin_time)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"写入打卡记录失败: {str(e)}")
+            raise
+
+        logger.info(f"用户 {user_id} 打卡成功，规则ID: {rule_id}, 记录ID: {record_id}")
+        CheckinRecordService._sync_daily_plan(rule_id, user_id, rule_source, today)
+        return result
+
+    @staticmethod
+    def perform_batch_checkin(user_id, rule_ids=None, community_rule_ids=None, idempotency_key=None):
+        """
+        批量打卡：每种来源一次权限查询，每项按每日唯一约束写入当天记录，所有写入一次提交
+        :param user_id: 用户ID
+        :param rule_ids: 个人规则ID列表
+        :param community_rule_ids: 社区规则ID列表
+        :param idempotency_key: 客户端请求的幂等键，相同的键直接返回首次批量结果
+        :return: 批量结果字典，results 中每项包含 rule_id、rule_source、success、record_id、message
+        :raises ValueError: 当没有事项或事项数超过上限时
+        """
+        from database.flask_models import CheckinRule, CommunityCheckinRule, User, UserCommunityRule
+        from sqlalchemy import and_
+
+        # 去重并保持顺序
+        rule_ids = list(dict.fromkeys(rule_ids or []))
+        community_rule_ids = list(dict.fromkeys(community_rule_ids or []))
+        item_count = len(rule_ids) + len(community_rule_ids)
+        if item_count == 0:
+            raise ValueError('缺少打卡事项')
+        if item_count > CheckinRecordService.BATCH_CHECKIN_MAX_ITEMS:
+            raise ValueError(f'单次最多批量打卡{CheckinRecordService.BATCH_CHECKIN_MAX_ITEMS}个事项')
+
+        if idempotency_key:
+            replay = CheckinRecordService._load_idempotent_result(user_id, idempotency_key)
+            if replay is not None:
+                return replay
+
+        today = date.today()
+
+        # 每种来源一次权限查询
+        personal_rules = {}
+        if rule_ids:
+            personal_rules = {rule.rule_id: rule for rule in db.session.query(CheckinRule).filter(
+                CheckinRule.rule_id.in_(rule_ids),
+                CheckinRule.user_id == user_id,
+                CheckinRule.status != 2
+            ).all()}
+
+        community_rules = {}
+        if community_rule_ids:
+            community_rules = {rule.community_rule_id: rule for rule in db.session.query(CommunityCheckinRule).join(
+                UserCommunityRule,
+                and_(UserCommunityRule.community_rule_id == CommunityCheckinRule.community_rule_id,
+                     UserCommunityRule.user_id == user_id,
+                     UserCommunityRule.is_active == True)
+            ).join(
+                User, and_(User.user_id == user_id, User.community_id == CommunityCheckinRule.community_id)
+            ).filter(
+                CommunityCheckinRule.community_rule_id.in_(community_rule_ids),
+                CommunityCheckinRule.status == 1
+            ).all()}
+
+        checkin_time = datetime.now()
+        items = [('personal', rule_id, personal_rules.get(rule_id)) for rule_id in rule_ids]
+        items += [('community', rule_id, community_rules.get(rule_id)) for rule_id in community_rule_ids]
+
+        # 每项一条 INSERT ... ON CONFLICT 语句，并发打卡同一事项时不会因唯一约束冲突回滚整批，所有写入一次提交
+        results = []
+        written = []
+        try:
+            for rule_source, rule_id, rule in items:
+                result = {'rule_id': rule_id, 'rule_source': rule_source, 'success': False, 'record_id': None}
+                results.append(result)
+
+                if rule is None:
+                    result['message'] = '打卡规则不存在或无权限'
+                    continue
+
+                record_id = CheckinRecordService._upsert_daily_record(
+                    rule_id, user_id, rule_source, CheckinRecordService._calculate_planned_time(rule, today),
+                    checkin_time, status=1, commit=False)
+                if record_id is None:
+                    result['message'] = '今日该事项已打卡，请勿重复打卡'
+                    continue
+                result.update(success=True, record_id=record_id, message='打卡成功')
+                written.append(result)
+
+            success_count = len(written)
+            response = {
+                'checkin_time': checkin_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'success_count': success_count,
+                'failed_count': item_count - success_count,
+                'results': results
+            }
+            if idempotency_key:
+                if not written:
+                    # 相同幂等键的并发请求已先一步完成打卡时返回其结果
+                    db.session.rollback()
+                    replay = CheckinRecordService._load_idempotent_result(user_id, idempotency_key)
+                    if replay is not None:
+                        return replay
+                CheckinRecordService._save_idempotent_result(user_id, idempotency_key, response, checkin_time)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"批量打卡失败，用户ID: {user_id}: {str(e)}")
+            raise
+
+        if success_count:
+            from .daily_checkin_plan_service import DailyCheckinPlanService
+            DailyCheckinPlanService.refresh_user(user_id, today)
+            CheckinStatisticsService.invalidate(user_id)
+
+        logger.info(f"用户 {user_id} 批量打卡完成，成功 {success_count} 项，失败 {item_count - success_count} 项")
+        return response
 
     @staticmethod
     def mark_missed(rule_id, user_id):
@@ -103,20 +294,16 @@ class CheckinRecordService:
         if not rule or rule.user_id != user_id:  # 更新字段名
             raise ValueError('打卡规则不存在或无权限')
 
-        # 检查今天是否已打卡
+        # 新建 missed 记录或更新当天已有记录，今日已打卡时不修改
         today = date.today()
-        records = CheckinRecordService._query_records_by_rule_and_date(rule_id, today)
-
-        for record in records:
-            if record.status == 1:  # 已打卡
-                raise ValueError('今日该事项已打卡，无需标记miss')
-
-        # 创建 missed 记录
         planned_time = CheckinRecordService._calculate_planned_time(rule, today)
-        record_id = CheckinRecordService._create_record(
-            rule_id, user_id, None, planned_time, status=0)
+        record_id = CheckinRecordService._upsert_daily_record(
+            rule_id, user_id, 'personal', planned_time, None, status=0)
+        if record_id is None:
+            raise ValueError('今日该事项已打卡，无需标记miss')
 
         logger.info(f"用户 {user_id} 标记miss成功，规则ID: {rule_id}, 记录ID: {record_id}")
+        CheckinRecordService._sync_daily_plan(rule_id, user_id, 'personal', today)
 
         return {
             'record_id': record_id,
@@ -151,6 +338,12 @@ class CheckinRecordService:
         CheckinRecordService._update_record_status(record_id, None, 2)
 
         logger.info(f"用户 {user_id} 撤销打卡成功，记录ID: {record_id}")
+        if record.community_rule_id is not None:
+            CheckinRecordService._sync_daily_plan(
+                record.community_rule_id, record.solo_user_id, 'community', record.planned_time.date())
+        else:
+            CheckinRecordService._sync_daily_plan(
+                record.rule_id, record.user_id, 'personal', record.planned_time.date())
 
         return {
             'record_id': record_id,
@@ -158,39 +351,153 @@ class CheckinRecordService:
         }
 
     @staticmethod
-    def get_checkin_history(user_id, start_date, end_date):
+    def _load_idempotent_result(user_id, idempotency_key, now=None):
+        """
+        读取幂等键对应的首次打卡结果
+        :param user_id: 用户ID
+        :param idempotency_key: 客户端请求的幂等键
+        :param now: 当前时间，默认 datetime.now()
+        :return: 首次打卡结果字典，不存在或已过期时返回None
+        """
+        response = db.session.query(CheckinIdempotencyKey.response).filter(
+            CheckinIdempotencyKey.user_id == user_id,
+            CheckinIdempotencyKey.idempotency_key == idempotency_key,
+            CheckinIdempotencyKey.expires_at > (now or datetime.now())
+        ).scalar()
+        return json.loads(response) if response is not None else None
+
+    @staticmethod
+    def _save_idempotent_result(user_id, idempotency_key, result, now):
         """
-        获取打卡历史记录
+        保存幂等键对应的打卡结果（不提交，与打卡记录在同一事务内；覆盖已过期的同名键）
         :param user_id: 用户ID
-        :param start_date: 开始日期
-        :param end_date: 结束日期
-        :return: 历史记录字典
+        :param idempotency_key: 客户端请求的幂等键
+        :param result: 打卡结果字典
+        :param now: 打卡时间
+        """
+        expires_at = now + timedelta(hours=CheckinRecordService.IDEMPOTENCY_TTL_HOURS)
+        stmt = sqlite_insert(CheckinIdempotencyKey).values(
+            user_id=user_id, idempotency_key=idempotency_key, response=json.dumps(result, ensure_ascii=False),
+            created_at=now, expires_at=expires_at
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'idempotency_key'],
+            set_={'response': stmt.excluded.response, 'created_at': now, 'expires_at': expires_at},
+            where=CheckinIdempotencyKey.expires_at <= now
+        ))
+
+    @staticmethod
+    def purge_idempotency_keys(now=None):
+        """
+        删除已过期的幂等键（后台任务每天调用）
+        :param now: 当前时间，默认 datetime.now()
+        :return: 删除的条数
         """
         try:
-            # 获取打卡记录
-            records = CheckinRecordService._query_records_by_user_and_date_range(
-                user_id, start_date, end_date)
-
-            # 转换为响应格式
-            history_data = []
-            for record in records:
-                history_data.append({
-                    'record_id': record.record_id,
-                    'rule_id': record.rule_id,
-                    'rule_name': record.rule.rule_name,
-                    'icon_url': record.rule.icon_url,
-                    'planned_time': record.planned_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'checkin_time': record.checkin_time.strftime('%Y-%m-%d %H:%M:%S') if record.checkin_time else None,
-                    'status': record.status_name,
-                    'created_at': record.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                })
-
-            logger.info(f"获取打卡历史成功，用户ID: {user_id}, 记录数量: {len(history_data)}")
+            deleted = db.session.query(CheckinIdempotencyKey).filter(
+                CheckinIdempotencyKey.expires_at <= (now or datetime.now())
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            return deleted
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"清理过期幂等键失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def _upsert_daily_record(rule_id, user_id, rule_source, planned_time, checkin_time, status, commit=True):
+        """
+        写入用户某规则当天的唯一记录（单条 INSERT ... ON CONFLICT DO UPDATE 语句）
+        已有记录且未打卡时更新状态和打卡时间；已打卡的记录保持不变
+        :param rule_id: 规则ID（社区规则为community_rule_id）
+        :param user_id: 用户ID
+        :param rule_source: 规则来源（personal/community）
+        :param planned_time: 计划时间
+        :param checkin_time: 打卡时间（可为None）
+        :param status: 写入的状态（0-未打卡，1-已打卡）
+        :param commit: 是否立即提交，为False时由调用方在同一事务内提交
+        :return: 记录ID，当天记录已打卡时返回None
+        """
+        now = datetime.now()
+        values = {
+            'user_id': user_id,
+            'planned_time': planned_time,
+            'planned_date': planned_time.date(),
+            'checkin_time': checkin_time,
+            'status': status,
+            'created_at': now,
+            'updated_at': now
+        }
+        if rule_source == 'community':
+            values.update(community_rule_id=rule_id, solo_user_id=user_id)
+            conflict_columns = ['user_id', 'community_rule_id', 'planned_date']
+        else:
+            values['rule_id'] = rule_id
+            conflict_columns = ['user_id', 'rule_id', 'planned_date']
+
+        stmt = sqlite_insert(CheckinRecord).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={
+                'status': stmt.excluded.status,
+                'checkin_time': stmt.excluded.checkin_time,
+                'updated_at': stmt.excluded.updated_at
+            },
+            where=CheckinRecord.status != 1
+        ).returning(CheckinRecord.record_id)
+
+        try:
+            record_id = db.session.execute(stmt).scalar()
+            if commit:
+                db.session.commit()
+            return record_id
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"写入打卡记录失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def _sync_daily_plan(rule_id, user_id, rule_source, day):
+        """
+        打卡记录变更后修补每日打卡计划中对应事项的状态，并清除该用户的统计缓存
+        :param rule_id: 规则ID（社区规则为community_rule_id）
+        :param user_id: 打卡用户ID
+        :param rule_source: 规则来源（personal/community）
+        :param day: 计划日期
+        """
+        from .daily_checkin_plan_service import DailyCheckinPlanService
+        DailyCheckinPlanService.sync_record(rule_id, user_id, rule_source, day)
+        CheckinStatisticsService.invalidate(user_id)
+
+    @staticmethod
+    def get_checkin_history(user_id, start_date, end_date, cursor=None, limit=None):
+        """
+        获取打卡历史记录（按 (planned_time, record_id) 倒序的游标分页）
+        :param user_id: 用户ID
+        :param start_date: 开始日期（含），为None时不限
+        :param end_date: 结束日期（含），为None时不限
+        :param cursor: 上一页返回的 next_cursor，为None时从最新记录开始
+        :param limit: 每页条数，默认 HISTORY_PAGE_SIZE，最大 HISTORY_MAX_PAGE_SIZE
+        :return: 历史记录字典，包含 history、has_more、next_cursor
+        :raises ValueError: 当游标无效时
+        """
+        limit = min(limit or CheckinRecordService.HISTORY_PAGE_SIZE, CheckinRecordService.HISTORY_MAX_PAGE_SIZE)
+        after = CheckinRecordService._decode_history_cursor(cursor)
+
+        try:
+            # 多取一条判断是否还有下一页
+            rows = CheckinRecordService._query_history_page(user_id, start_date, end_date, after, limit + 1)
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+
+            logger.info(f"获取打卡历史成功，用户ID: {user_id}, 记录数量: {len(rows)}")
 
             return {
-                'start_date': start_date.strftime('%Y-%m-%d'),
-                'end_date': end_date.strftime('%Y-%m-%d'),
-                'history': history_data
+                'start_date': start_date.strftime('%Y-%m-%d') if start_date else None,
+                'end_date': end_date.strftime('%Y-%m-%d') if end_date else None,
+                'history': [CheckinRecordService._history_item(row) for row in rows],
+                'has_more': has_more,
+                'next_cursor': CheckinRecordService._encode_history_cursor(rows[-1]) if has_more else None
             }
 
         except Exception as e:
@@ -198,128 +505,221 @@ class CheckinRecordService:
             raise
 
     @staticmethod
-    def get_supervised_records(supervisor_user_id, start_date, end_date, session=None):
+    def iter_checkin_history(user_id, start_date, end_date, cursor=None, batch_size=None):
         """
-        获取监护人可查看的被监护人打卡记录
-        :param supervisor_user_id: 监护人用户ID
-        :param start_date: 开始日期
-        :param end_date: 结束日期
-        :param session: 数据库会话，如果为None则创建新会话
-        :return: 打卡记录列表
+        逐条生成打卡历史记录，内部按游标分批读取，用于流式响应
+        :param user_id: 用户ID
+        :param start_date: 开始日期（含），为None时不限
+        :param end_date: 结束日期（含），为None时不限
+        :param cursor: 起始游标，为None时从最新记录开始
+        :param batch_size: 每批读取条数，默认 HISTORY_STREAM_BATCH_SIZE
+        :return: 历史记录字典的生成器
+        :raises ValueError: 当游标无效时（调用时立即校验）
         """
-        try:
-            # 如果session为None，使用Flask-SQLAlchemy的session
-            if session is None:
-                # 获取监督关系
-                relations = db.session.query(SupervisionRuleRelation).filter(
-                    SupervisionRuleRelation.supervisor_user_id == supervisor_user_id,
-                    SupervisionRuleRelation.status == 2  # 已同意
-                ).all()
-
-                if not relations:
-                    return []
-
-                # 分离可以监督所有规则的用户和特定规则的关系
-                all_rules_users = set()
-                specific_rules = []
-
-                for relation in relations:
-                    if relation.rule_id is None:
-                        all_rules_users.add(relation.solo_user_id)
-                    else:
-                        specific_rules.append({
-                            'user_id': relation.solo_user_id,
-                            'rule_id': relation.rule_id
-                        })
-
-                # 查询打卡记录
-                records = []
-
-                # 查询可以监督所有规则的用户的记录
-                if all_rules_users:
-                    all_rules_records = db.session.query(CheckinRecord).filter(
-                        CheckinRecord.user_id.in_(all_rules_users),
-                        CheckinRecord.planned_time >= start_date,
-                        CheckinRecord.planned_time <= end_date
-                    ).all()
-                    records.extend(all_rules_records)
-
-                # 查询特定规则的记录
-                for spec in specific_rules:
-                    spec_records = db.session.query(CheckinRecord).filter(
-                        CheckinRecord.user_id == spec['user_id'],
-                        CheckinRecord.rule_id == spec['rule_id'],
-                        CheckinRecord.planned_time >= start_date,
-                        CheckinRecord.planned_time <= end_date
-                    ).all()
-                    records.extend(spec_records)
+        batch_size = batch_size or CheckinRecordService.HISTORY_STREAM_BATCH_SIZE
+        after = CheckinRecordService._decode_history_cursor(cursor)
 
-                # 去重并排序
-                unique_records = list({r.record_id: r for r in records}.values())
-                unique_records.sort(key=lambda x: x.planned_time, reverse=True)
+        def generate(after):
+            while True:
+                rows = CheckinRecordService._query_history_page(user_id, start_date, end_date, after, batch_size)
+                for row in rows:
+                    yield CheckinRecordService._history_item(row)
+                if len(rows) < batch_size:
+                    return
+                after = (rows[-1].planned_time, rows[-1].record_id)
 
-                # Flask-SQLAlchemy 会自动处理对象状态，不需要 expunge
+        return generate(after)
 
-                logger.info(f"获取监督记录成功，监护人ID: {supervisor_user_id}, 记录数量: {len(unique_records)}")
-                return unique_records
-            else:
-                # 使用传入的session
-                # 获取监督关系
-                relations = session.query(SupervisionRuleRelation).filter(
-                    SupervisionRuleRelation.supervisor_user_id == supervisor_user_id,
-                    SupervisionRuleRelation.status == 2  # 已同意
-                ).all()
-
-                if not relations:
-                    return []
-
-                # 分离可以监督所有规则的用户和特定规则的关系
-                all_rules_users = set()
-                specific_rules = []
-
-                for relation in relations:
-                    if relation.rule_id is None:
-                        all_rules_users.add(relation.solo_user_id)
-                    else:
-                        specific_rules.append({
-                            'user_id': relation.solo_user_id,
-                            'rule_id': relation.rule_id
-                        })
-
-                # 查询打卡记录
-                records = []
-
-                # 查询可以监督所有规则的用户的记录
-                if all_rules_users:
-                    all_rules_records = session.query(CheckinRecord).filter(
-                        CheckinRecord.user_id.in_(all_rules_users),
-                        CheckinRecord.planned_time >= start_date,
-                        CheckinRecord.planned_time <= end_date
-                    ).all()
-                    records.extend(all_rules_records)
-
-                # 查询特定规则的记录
-                for spec in specific_rules:
-                    spec_records = session.query(CheckinRecord).filter(
-                        CheckinRecord.user_id == spec['user_id'],
-                        CheckinRecord.rule_id == spec['rule_id'],
-                        CheckinRecord.planned_time >= start_date,
-                        CheckinRecord.planned_time <= end_date
-                    ).all()
-                    records.extend(spec_records)
+    @staticmethod
+    def _query_history_page(user_id, start_date, end_date, after, limit):
+        """
+        读取一页打卡历史，规则名称和图标在同一查询中关联；区间早于归档分界时同时读取归档表
+        :param after: (planned_time, record_id) 游标，只返回其之后（更早）的记录
+        :return: 行列表
+        """
+        from database.flask_models import CheckinRule, CommunityCheckinRule
+        from sqlalchemy import func
+
+        def where(model):
+            conditions = [model.user_id == user_id]
+            # 半开区间 [开始日期0点, 结束日期次日0点)
+            if start_date:
+                conditions.append(model.planned_time >= day_range(start_date)[0])
+            if end_date:
+                conditions.append(model.planned_time < day_range(end_date)[1])
+            if after:
+                conditions.append(CheckinRecordService._after_cursor(model, after))
+            return conditions
+
+        records = CheckinArchiveService.record_source(
+            where, day_range(start_date)[0] if start_date else None)
+        query = db.session.query(
+            records.record_id,
+            records.rule_id,
+            records.community_rule_id,
+            records.planned_time,
+            records.checkin_time,
+            records.status,
+            records.created_at,
+            func.coalesce(CheckinRule.rule_name, CommunityCheckinRule.rule_name).label('rule_name'),
+            func.coalesce(CheckinRule.icon_url, CommunityCheckinRule.icon_url).label('icon_url')
+        ).outerjoin(
+            CheckinRule, CheckinRule.rule_id == records.rule_id
+        ).outerjoin(
+            CommunityCheckinRule, CommunityCheckinRule.community_rule_id == records.community_rule_id
+        ).filter(*where(records))
+
+        return query.order_by(
+            records.planned_time.desc(), records.record_id.desc()
+        ).limit(limit).all()
 
-                # 去重并排序
-                unique_records = list({r.record_id: r for r in records}.values())
-                unique_records.sort(key=lambda x: x.planned_time, reverse=True)
+    @staticmethod
+    def _history_item(row):
+        """将历史查询行转换为响应格式"""
+        return {
+            'record_id': row.record_id,
+            'rule_id': row.rule_id,
+            'community_rule_id': row.community_rule_id,
+            'rule_source': 'community' if row.community_rule_id is not None else 'personal',
+            'rule_name': row.rule_name,
+            'icon_url': row.icon_url,
+            'planned_time': row.planned_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'checkin_time': row.checkin_time.strftime('%Y-%m-%d %H:%M:%S') if row.checkin_time else None,
+            'status': CheckinRecord.STATUS_MAPPING.get(row.status, 'unknown'),
+            'created_at': row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None
+        }
 
-                # 注意：使用外部传入的session时，不进行expunge操作
-                logger.info(f"获取监督记录成功，监护人ID: {supervisor_user_id}, 记录数量: {len(unique_records)}")
-                return unique_records
+    @staticmethod
+    def _encode_history_cursor(row):
+        """将 (planned_time, record_id) 编码为不透明游标"""
+        raw = f"{row.planned_time.isoformat()}|{row.record_id}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
 
+    @staticmethod
+    def _decode_history_cursor(cursor):
+        """
+        解码游标
+        :return: (planned_time, record_id)，cursor为空时返回None
+        :raises ValueError: 当游标无效时
+        """
+        if not cursor:
+            return None
+        try:
+            planned_time, record_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+            return datetime.fromisoformat(planned_time), int(record_id)
+        except (ValueError, UnicodeError):
+            raise ValueError('无效的分页游标')
+
+    @staticmethod
+    def get_supervised_records(supervisor_user_id, start_date, end_date, session=None, cursor=None, limit=None):
+        """
+        获取监护人可查看的被监护人打卡记录（按 (planned_time, record_id) 倒序）
+        :param supervisor_user_id: 监护人用户ID
+        :param start_date: 开始时间（datetime为闭区间；date为当天0点起）
+        :param end_date: 结束时间（datetime为闭区间；date包含当天）
+        :param session: 数据库会话，如果为None则使用Flask-SQLAlchemy的session
+        :param cursor: 上一页最后一条记录的游标，为None时从最新记录开始
+        :param limit: 最多返回条数，为None时不限
+        :return: 打卡记录列表
+        :raises ValueError: 当游标无效时
+        """
+        after = CheckinRecordService._decode_history_cursor(cursor)
+        try:
+            records = CheckinRecordService._query_supervised_records(
+                session or db.session, supervisor_user_id, start_date, end_date, after, limit)
+            logger.info(f"获取监督记录成功，监护人ID: {supervisor_user_id}, 记录数量: {len(records)}")
+            return records
         except Exception as e:
             logger.error(f"获取监督记录失败: {str(e)}")
             return []
 
+    @staticmethod
+    def get_supervised_records_page(supervisor_user_id, start_date, end_date, cursor=None, limit=None, options=None):
+        """
+        分页获取监护人可查看的打卡记录
+        :param supervisor_user_id: 监护人用户ID
+        :param start_date: 开始时间
+        :param end_date: 结束时间
+        :param cursor: 上一页返回的 next_cursor
+        :param limit: 每页条数，默认 HISTORY_PAGE_SIZE，最大 HISTORY_MAX_PAGE_SIZE
+        :param options: 函数，接收记录实体返回附加的查询选项（如 joinedload），用于随记录一起加载关联对象
+        :return: 字典，包含 records（CheckinRecord 列表）、has_more、next_cursor
+        :raises ValueError: 当游标无效时
+        """
+        limit = min(limit or CheckinRecordService.HISTORY_PAGE_SIZE, CheckinRecordService.HISTORY_MAX_PAGE_SIZE)
+        after = CheckinRecordService._decode_history_cursor(cursor)
+
+        # 多取一条判断是否还有下一页
+        records = CheckinRecordService._query_supervised_records(
+            db.session, supervisor_user_id, start_date, end_date, after, limit + 1, options)
+        has_more = len(records) > limit
+        records = records[:limit]
+        return {
+            'records': records,
+            'has_more': has_more,
+            'next_cursor': CheckinRecordService._encode_history_cursor(records[-1]) if has_more else None
+        }
+
+    @staticmethod
+    def _query_supervised_records(session, supervisor_user_id, start_date, end_date, after, limit, options=None):
+        """
+        一次查询监护人可查看的记录：被监护人的全部规则关系或对应规则的关系存在即可见，
+        用 EXISTS 匹配避免多条关系导致的重复，排序和分页在数据库端完成；区间早于归档分界时同时读取归档表
+        :param options: 函数，接收记录实体返回附加的查询选项（如 joinedload）
+        """
+        from sqlalchemy import and_, or_
+
+        relation = SupervisionRuleRelation
+        accepted = and_(
+            relation.supervisor_user_id == supervisor_user_id,
+            relation.status == 2  # 已同意
+        )
+        supervised_users = session.query(relation.solo_user_id).filter(accepted).scalar_subquery()
+
+        start_time = None
+        if start_date:
+            start_time = start_date if isinstance(start_date, datetime) else day_range(start_date)[0]
+
+        def where(model):
+            conditions = [
+                model.user_id.in_(supervised_users),
+                session.query(relation.relation_id).filter(
+                    accepted,
+                    relation.solo_user_id == model.user_id,
+                    or_(relation.rule_id.is_(None), relation.rule_id == model.rule_id)
+                ).exists()
+            ]
+            if start_time:
+                conditions.append(model.planned_time >= start_time)
+            if end_date:
+                if isinstance(end_date, datetime):
+                    conditions.append(model.planned_time <= end_date)
+                else:
+                    conditions.append(model.planned_time < day_range(end_date)[1])
+            if after:
+                conditions.append(CheckinRecordService._after_cursor(model, after))
+            return conditions
+
+        records = CheckinArchiveService.record_source(where, start_time)
+        query = session.query(records)
+        if options:
+            query = query.options(*options(records))
+        query = query.filter(*where(records)).order_by(records.planned_time.desc(), records.record_id.desc())
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    @staticmethod
+    def _after_cursor(model, after):
+        """(planned_time, record_id) 倒序中位于游标之后的过滤条件"""
+        from sqlalchemy import and_, or_
+
+        after_time, after_id = after
+        return or_(
+            model.planned_time < after_time,
+            and_(model.planned_time == after_time, model.record_id < after_id)
+        )
+
     # ========== 私有辅助方法 ==========
 
     @staticmethod
@@ -355,19 +755,23 @@ class CheckinRecordService:
         :return: 打卡记录列表
         """
         try:
+            # 半开区间过滤，使用 (rule_id, planned_time) / (community_rule_id, planned_time) 索引
+            day_start, day_end = day_range(checkin_date)
             # 如果session为None，使用Flask-SQLAlchemy的session
             if session is None:
                 if rule_source == 'community':
                     # 查询社区规则打卡记录
                     records = db.session.query(CheckinRecord).filter(
                         CheckinRecord.community_rule_id == rule_id,
-                        func.date(CheckinRecord.planned_time) == checkin_date
+                        CheckinRecord.planned_time >= day_start,
+                        CheckinRecord.planned_time < day_end
                     ).all()
                 else:
                     # 查询个人规则打卡记录
                     records = db.session.query(CheckinRecord).filter(
                         CheckinRecord.rule_id == rule_id,
-                        func.date(CheckinRecord.planned_time) == checkin_date
+                        CheckinRecord.planned_time >= day_start,
+                        CheckinRecord.planned_time < day_end
                     ).all()
                 return records
             else:
@@ -376,13 +780,15 @@ class CheckinRecordService:
                     # 查询社区规则打卡记录
                     records = session.query(CheckinRecord).filter(
                         CheckinRecord.community_rule_id == rule_id,
-                        func.date(CheckinRecord.planned_time) == checkin_date
+                        CheckinRecord.planned_time >= day_start,
+                        CheckinRecord.planned_time < day_end
                     ).all()
                 else:
                     # 查询个人规则打卡记录
                     records = session.query(CheckinRecord).filter(
                         CheckinRecord.rule_id == rule_id,
-                        func.date(CheckinRecord.planned_time) == checkin_date
+                        CheckinRecord.planned_time >= day_start,
+                        CheckinRecord.planned_time < day_end
                     ).all()
                 # 注意：使用外部传入的session时，不进行expunge操作
                 return records
@@ -390,38 +796,6 @@ class CheckinRecordService:
             logger.error(f"查询打卡记录失败: {str(e)}")
             return []
 
-    @staticmethod
-    def _query_records_by_user_and_date_range(user_id, start_date, end_date, session=None):
-        """
-        根据用户ID和日期范围查询打卡记录
-        :param user_id: 用户ID
-        :param start_date: 开始日期
-        :param end_date: 结束日期
-        :param session: 数据库会话，如果为None则创建新会话
-        :return: 打卡记录列表
-        """
-        try:
-            # 如果session为None，使用Flask-SQLAlchemy的session
-            if session is None:
-                records = db.session.query(CheckinRecord).filter(
-                    CheckinRecord.user_id == user_id,
-                    CheckinRecord.planned_time >= start_date,
-                    CheckinRecord.planned_time <= end_date
-                ).order_by(CheckinRecord.planned_time.desc()).all()
-                return records
-            else:
-                # 使用传入的session
-                records = session.query(CheckinRecord).filter(
-                    CheckinRecord.user_id == user_id,
-                    CheckinRecord.planned_time >= start_date,
-                    CheckinRecord.planned_time <= end_date
-                ).order_by(CheckinRecord.planned_time.desc()).all()
-                # 注意：使用外部传入的session时，不进行expunge操作
-                return records
-        except OperationalError as e:
-            logger.error(f"查询打卡记录失败: {str(e)}")
-            return []
-
     @staticmethod
     def _calculate_planned_time(rule, target_date):
         """
@@ -490,6 +864,7 @@ class CheckinRecordService:
                 new_record = CheckinRecord(
                     community_rule_id=rule_id,
                     solo_user_id=user_id,
+                    user_id=user_id,
                     checkin_time=checkin_time,
                     status=status,
                     planned_time=planned_time
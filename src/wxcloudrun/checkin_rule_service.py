@@ -7,7 +7,8 @@ import logging
 from datetime import datetime, date, time
 from sqlalchemy.exc import OperationalError
 from database.flask_models import CheckinRule, CheckinRecord, db
-from wxcloudrun.utils.timeutil import parse_time_only, parse_date_only
+from wxcloudrun.utils import schedule
+from wxcloudrun.utils.timeutil import parse_time_only, parse_date_only, day_range
 
 logger = logging.getLogger('CheckinRuleService')
 
@@ -67,7 +68,8 @@ class CheckinRuleService:
         创建打卡规则
         :param rule_data: 规则数据字典
         :param user_id: 用户ID
-        :param session: 可选的数据库会话，如果为None则创建新会话
+        :param session: 可选的数据库会话，如果为None则创建新会话；
+                        传入时由调用者提交事务，提交后需调用 refresh_daily_plan(user_id) 更新今日计划
         :return: 创建的规则实体
         :raises ValueError: 当参数验证失败时
         """
@@ -121,14 +123,17 @@ class CheckinRuleService:
                 # Flask-SQLAlchemy 会自动处理对象状态，不需要 expunge
 
                 logger.info(f"创建打卡规则成功: 用户ID={user_id}, 规则ID={new_rule.rule_id}")
+                CheckinRuleService._notify_rule_scheduler(new_rule)
+                CheckinRuleService.refresh_daily_plan(new_rule.user_id)
                 return new_rule
             else:
                 session.add(new_rule)
-                # 注意：当使用外部传入的session时，由调用者负责提交事务
+                # 注意：当使用外部传入的session时，由调用者负责提交事务并刷新今日计划
                 # 这里只刷新对象，不提交
                 session.flush()
                 session.refresh(new_rule)
                 logger.info(f"创建打卡规则成功（使用外部会话）: 用户ID={user_id}, 规则ID={new_rule.rule_id}")
+                CheckinRuleService._notify_rule_scheduler(new_rule)
                 return new_rule
 
         except Exception as e:
@@ -142,7 +147,8 @@ class CheckinRuleService:
         :param rule_id: 规则ID
         :param rule_data: 更新的规则数据字典
         :param user_id: 用户ID（用于权限验证）
-        :param session: 可选的数据库会话，如果为None则创建新会话
+        :param session: 可选的数据库会话，如果为None则创建新会话；
+                        传入时由调用者提交事务，提交后需调用 refresh_daily_plan(user_id) 更新今日计划
         :return: 更新后的规则实体
         :raises ValueError: 当规则不存在或无权限时
         """
@@ -200,6 +206,8 @@ class CheckinRuleService:
                 # Flask-SQLAlchemy 会自动处理对象状态，不需要 expunge
 
                 logger.info(f"更新打卡规则成功: 规则ID={rule_id}")
+                CheckinRuleService._notify_rule_scheduler(rule)
+                CheckinRuleService.refresh_daily_plan(rule.user_id)
                 return rule
             else:
                 rule = session.query(CheckinRule).get(rule_id)
@@ -248,12 +256,13 @@ class CheckinRuleService:
                     if rule.custom_end_date < rule.custom_start_date:
                         raise ValueError('结束日期不能早于开始日期')
 
-                # 注意：当使用外部传入的session时，由调用者负责提交事务
+                # 注意：当使用外部传入的session时，由调用者负责提交事务并刷新今日计划
                 # 这里只刷新对象，不提交
                 session.flush()
                 session.refresh(rule)
 
                 logger.info(f"更新打卡规则成功（使用外部会话）: 规则ID={rule_id}")
+                CheckinRuleService._notify_rule_scheduler(rule)
                 return rule
 
         except ValueError:
@@ -268,7 +277,8 @@ class CheckinRuleService:
         软删除打卡规则
         :param rule_id: 规则ID
         :param user_id: 用户ID（用于权限验证）
-        :param session: 可选的数据库会话，如果为None则创建新会话
+        :param session: 可选的数据库会话，如果为None则创建新会话；
+                        传入时由调用者提交事务，提交后需调用 refresh_daily_plan(user_id) 更新今日计划
         :return: True 删除成功
         :raises ValueError: 当规则不存在或无权限时
         """
@@ -290,6 +300,8 @@ class CheckinRuleService:
                 db.session.commit()
 
                 logger.info(f"删除打卡规则成功: 规则ID={rule_id}")
+                CheckinRuleService._notify_rule_scheduler(rule)
+                CheckinRuleService.refresh_daily_plan(rule.user_id)
                 return True
             else:
                 rule = session.query(CheckinRule).get(rule_id)
@@ -305,10 +317,11 @@ class CheckinRuleService:
                 rule.status = 2  # 已删除
                 rule.deleted_at = datetime.now()
 
-                # 注意：当使用外部传入的session时，由调用者负责提交事务
+                # 注意：当使用外部传入的session时，由调用者负责提交事务并刷新今日计划
                 # 这里只标记删除，不提交
 
                 logger.info(f"删除打卡规则成功（使用外部会话）: 规则ID={rule_id}")
+                CheckinRuleService._notify_rule_scheduler(rule)
                 return True
 
         except ValueError:
@@ -317,44 +330,49 @@ class CheckinRuleService:
             logger.error(f"删除打卡规则失败: {str(e)}")
             raise
 
+    @staticmethod
+    def _notify_rule_scheduler(rule):
+        """
+        通知后台miss调度器规则已变更（创建/修改/删除）
+        :param rule: 打卡规则实体
+        """
+        from wxcloudrun.background_tasks import notify_rule_changed
+        notify_rule_changed(rule)
+
+    @staticmethod
+    def refresh_daily_plan(user_id):
+        """
+        规则变更提交后重新生成用户今日的打卡计划
+        使用外部会话创建/修改/删除规则时，调用者提交事务后需自行调用
+        :param user_id: 用户ID
+        """
+        from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+        DailyCheckinPlanService.refresh_user(user_id)
+
     @staticmethod
     def get_today_checkin_plan(user_id, session=None):
         """
-        获取用户今日打卡计划
+        获取用户今日打卡计划（读取物化的每日打卡计划中的个人规则事项）
         :param user_id: 用户ID
-        :param session: 可选的数据库会话，如果为None则创建新会话
+        :param session: 保留参数，计划读取统一使用 db.session
         :return: 今日打卡事项列表
         """
         try:
-            # 获取用户的打卡规则
-            checkin_rules = CheckinRuleService.query_rules_by_user_id(user_id, session)
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
 
-            # 生成今天的打卡计划
             today = date.today()
-            checkin_items = []
-
-            for rule in checkin_rules:
-                # 判断今天是否需要打卡
-                if not CheckinRuleService._should_checkin_today(rule, today):
-                    continue
-
-                # 查询今天该规则的打卡记录
-                today_records = CheckinRuleService._query_today_records(rule.rule_id, today, session)
-
-                # 计算计划打卡时间
-                planned_time = CheckinRuleService._calculate_planned_time(rule, today)
-
-                # 确定打卡状态
-                status_info = CheckinRuleService._determine_checkin_status(today_records)
+            plan_items = DailyCheckinPlanService.get_user_plan_items(user_id, today, rule_source='personal')
 
+            checkin_items = []
+            for item in plan_items:
                 checkin_items.append({
-                    'rule_id': rule.rule_id,
-                    'record_id': status_info['record_id'],
-                    'rule_name': rule.rule_name,
-                    'icon_url': rule.icon_url,
-                    'planned_time': planned_time.strftime('%H:%M:%S'),
-                    'status': status_info['status'],
-                    'checkin_time': status_info['checkin_time']
+                    'rule_id': item.rule_id,
+                    'record_id': item.record_id,
+                    'rule_name': item.rule_name,
+                    'icon_url': item.icon_url,
+                    'planned_time': item.planned_time.strftime('%H:%M:%S'),
+                    'status': item.status,
+                    'checkin_time': item.checkin_time.strftime('%H:%M:%S') if item.checkin_time else None
                 })
 
             return {
@@ -408,22 +426,7 @@ class CheckinRuleService:
         :param today: 今天的日期
         :return: Boolean
         """
-        frequency_type = CheckinRuleService._get_rule_attr(rule, 'frequency_type')
-        week_days = CheckinRuleService._get_rule_attr(rule, 'week_days')
-        custom_start_date = CheckinRuleService._get_rule_attr(rule, 'custom_start_date')
-        custom_end_date = CheckinRuleService._get_rule_attr(rule, 'custom_end_date')
-
-        if frequency_type == 1:  # 每周
-            today_weekday = today.weekday()  # 0是周一，6是周日
-            return bool(week_days & (1 << today_weekday))
-        elif frequency_type == 2:  # 工作日
-            return today.weekday() < 5  # 周一到周五
-        elif frequency_type == 3:  # 自定义日期范围
-            if custom_start_date and custom_end_date:
-                return custom_start_date <= today <= custom_end_date
-            return False
-        else:  # 每天 (frequency_type == 0)
-            return True
+        return schedule.is_due(rule, today)
 
     @staticmethod
     def _query_today_records(rule_id, today, session=None, rule_source='personal'):
@@ -436,10 +439,12 @@ class CheckinRuleService:
         :return: 打卡记录列表
         """
         try:
-            from sqlalchemy import func
+            # 半开区间过滤，使用 (rule_id, planned_time) / (community_rule_id, planned_time) 索引
+            day_start, day_end = day_range(today)
             if session is None:
                 query = db.session.query(CheckinRecord).filter(
-                    func.date(CheckinRecord.planned_time) == today
+                    CheckinRecord.planned_time >= day_start,
+                    CheckinRecord.planned_time < day_end
                 )
 
                 # 根据规则来源过滤
@@ -455,7 +460,8 @@ class CheckinRuleService:
                 return records
             else:
                 query = session.query(CheckinRecord).filter(
-                    func.date(CheckinRecord.planned_time) == today
+                    CheckinRecord.planned_time >= day_start,
+                    CheckinRecord.planned_time < day_end
                 )
 
                 if rule_source == 'community':
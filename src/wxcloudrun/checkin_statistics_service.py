@@ -0,0 +1,242 @@
+"""
+打卡统计服务模块
+在数据库端按 GROUP BY 计算完成率和miss次数，连续打卡天数按规则排期的应打卡日序列计算，
+结果按用户缓存，用户下一次打卡（或撤销、标记miss）时失效
+"""
+
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy import and_, case, func
+from database.flask_models import db, CheckinRule, CommunityCheckinRule
+from .checkin_archive_service import CheckinArchiveService
+from .utils import schedule
+from .utils.timeutil import date_number, day_number, day_range, parse_date_only
+from .utils.user_cache import UserCache
+
+logger = logging.getLogger('CheckinStatisticsService')
+
+# 按 (开始日期, 结束日期) 缓存的统计结果，当天结束时过期
+statistics_cache = UserCache('checkin_statistics')
+
+
+class CheckinStatisticsService:
+    """打卡统计服务类"""
+
+    # 统计周期对应的天数
+    PERIOD_DAYS = {'week': 7, 'month': 30}
+
+    # 自定义统计区间最多天数
+    MAX_WINDOW_DAYS = 366
+
+    @staticmethod
+    def get_statistics(user_id, period='week', start_date=None, end_date=None):
+        """
+        获取用户在统计区间内的打卡统计
+        :param user_id: 用户ID
+        :param period: 统计周期（week/month），未指定起止日期时使用
+        :param start_date: 开始日期（含），字符串 YYYY-MM-DD
+        :param end_date: 结束日期（含），字符串 YYYY-MM-DD，默认今天
+        :return: 统计字典，包含总体完成率、连续打卡天数、每日统计和按规则统计
+        :raises ValueError: 当周期或日期无效时
+        """
+        today = date.today()
+        start, end = CheckinStatisticsService._resolve_window(period, start_date, end_date, today)
+        key = (start, end)
+
+        cached = statistics_cache.get(user_id, key)
+        if cached is not None:
+            return dict(cached, period=period)
+
+        statistics = CheckinStatisticsService._compute(user_id, start, end, today)
+        statistics_cache.set(user_id, statistics, key)
+        logger.info(f"计算用户打卡统计: 用户ID={user_id}, 区间={start}~{end}")
+        return dict(statistics, period=period)
+
+    @staticmethod
+    def invalidate(user_id):
+        """
+        清除用户的统计缓存（打卡、撤销打卡、标记miss后调用）
+        :param user_id: 用户ID
+        """
+        statistics_cache.invalidate(user_id)
+
+    @staticmethod
+    def invalidate_users(user_ids):
+        """
+        清除多个用户的统计缓存（后台批量标记miss后调用）
+        :param user_ids: 用户ID列表
+        """
+        statistics_cache.invalidate_users(user_ids)
+
+    @staticmethod
+    def clear_cache():
+        """清除所有用户的统计缓存"""
+        statistics_cache.clear()
+
+    @staticmethod
+    def _resolve_window(period, start_date, end_date, today):
+        """解析统计区间，返回 (开始日期, 结束日期)"""
+        if period not in CheckinStatisticsService.PERIOD_DAYS:
+            raise ValueError(f'无效的统计周期: {period}')
+        end = parse_date_only(end_date) or today
+        start = parse_date_only(start_date) or end - timedelta(days=CheckinStatisticsService.PERIOD_DAYS[period] - 1)
+        if start > end:
+            raise ValueError('开始日期不能晚于结束日期')
+        if (end - start).days >= CheckinStatisticsService.MAX_WINDOW_DAYS:
+            raise ValueError(f'统计区间不能超过{CheckinStatisticsService.MAX_WINDOW_DAYS}天')
+        return start, end
+
+    @staticmethod
+    def _compute(user_id, start, end, today):
+        """执行统计查询并组装结果"""
+        window_start, _ = day_range(start)
+        _, window_end = day_range(end)
+
+        # 撤销的记录不参与统计：status 1 为已打卡，status 0 为未打卡/miss
+        def where(model):
+            return [
+                model.user_id == user_id,
+                model.planned_time >= window_start,
+                model.planned_time < window_end,
+                model.status.in_([0, 1])
+            ]
+
+        # 统计区间早于归档分界时同时读取归档表
+        records = CheckinArchiveService.record_source(where, window_start)
+        base_filter = and_(*where(records))
+        rule_source = case((records.community_rule_id.isnot(None), 'community'), else_='personal')
+        rule_key = func.coalesce(records.community_rule_id, records.rule_id)
+        record_day = day_number(records.planned_time)
+        completed = func.sum(case((records.status == 1, 1), else_=0))
+        total = func.count(records.record_id)
+
+        # 1. 每日统计
+        daily_rows = db.session.query(
+            record_day.label('day_number'),
+            total.label('total'),
+            completed.label('completed')
+        ).filter(base_filter).group_by(record_day).order_by(record_day).all()
+
+        # 2. 按规则统计
+        rule_rows = db.session.query(
+            rule_source.label('rule_source'),
+            rule_key.label('rule_id'),
+            func.max(func.coalesce(CommunityCheckinRule.rule_name, CheckinRule.rule_name)).label('rule_name'),
+            func.max(func.coalesce(CommunityCheckinRule.frequency_type, CheckinRule.frequency_type)).label('frequency_type'),
+            func.max(func.coalesce(CommunityCheckinRule.week_days, CheckinRule.week_days)).label('week_days'),
+            func.max(func.coalesce(CommunityCheckinRule.custom_start_date, CheckinRule.custom_start_date)).label('custom_start_date'),
+            func.max(func.coalesce(CommunityCheckinRule.custom_end_date, CheckinRule.custom_end_date)).label('custom_end_date'),
+            total.label('total'),
+            completed.label('completed')
+        ).outerjoin(
+            CheckinRule, CheckinRule.rule_id == records.rule_id
+        ).outerjoin(
+            CommunityCheckinRule, CommunityCheckinRule.community_rule_id == records.community_rule_id
+        ).filter(base_filter).group_by(rule_source, rule_key).order_by(rule_source, rule_key).all()
+
+        # 3. 每条规则每天是否完成（连续天数按排期的应打卡日序列计算，不能只看相邻的日历日）
+        rule_day_rows = db.session.query(
+            rule_source.label('rule_source'),
+            rule_key.label('rule_id'),
+            record_day.label('day_number'),
+            func.max(records.status).label('status')
+        ).filter(base_filter).group_by(rule_source, rule_key, record_day).all()
+
+        start_number = date_number(start)
+        rule_days = {}
+        for row in rule_day_rows:
+            rule_days.setdefault((row.rule_source, row.rule_id), {})[row.day_number - start_number] = row.status == 1
+
+        daily_stats = []
+        for row in daily_rows:
+            row_completed = int(row.completed or 0)
+            daily_stats.append({
+                'date': (start + timedelta(days=row.day_number - start_number)).strftime('%Y-%m-%d'),
+                'total_rules': row.total,
+                'completed_rules': row_completed,
+                'missed_rules': row.total - row_completed,
+                'checkin_rate': CheckinStatisticsService._rate(row_completed, row.total)
+            })
+
+        # 区间内每条规则按排期应打卡的天数
+        scheduled_masks = schedule.expand(rule_rows, start, end)
+
+        # 统计截止今天时，今天尚未完成不打断连续天数
+        today_offset = (today - start).days if end == today else None
+        full_days = {}
+        rules = []
+        for row, scheduled_mask in zip(rule_rows, scheduled_masks):
+            row_completed = int(row.completed or 0)
+            sequence = CheckinStatisticsService._due_sequence(
+                scheduled_mask, rule_days.get((row.rule_source, row.rule_id), {}))
+            current, longest = CheckinStatisticsService._streaks(sequence, today_offset)
+            # 某天所有应打卡的规则都完成时，该天计入全部事项的连续天数
+            for offset, done in sequence:
+                full_days[offset] = full_days.get(offset, True) and done
+            rules.append({
+                'rule_source': row.rule_source,
+                'rule_id': row.rule_id,
+                'rule_name': row.rule_name,
+                'scheduled_days': bin(scheduled_mask).count('1'),
+                'total_checkins': row.total,
+                'completed_checkins': row_completed,
+                'missed_checkins': row.total - row_completed,
+                'completion_rate': CheckinStatisticsService._rate(row_completed, row.total),
+                'current_streak': current,
+                'longest_streak': longest
+            })
+        current_streak, longest_streak = CheckinStatisticsService._streaks(sorted(full_days.items()), today_offset)
+
+        total_checkins = sum(day['total_rules'] for day in daily_stats)
+        completed_checkins = sum(day['completed_rules'] for day in daily_stats)
+        return {
+            'start_date': start.strftime('%Y-%m-%d'),
+            'end_date': end.strftime('%Y-%m-%d'),
+            'total_days': (end - start).days + 1,
+            'checkin_days': len([day for day in daily_stats if day['completed_rules'] > 0]),
+            'checkin_rate': CheckinStatisticsService._rate(completed_checkins, total_checkins),
+            'total_rules': len(rules),
+            'completed_checkins': completed_checkins,
+            'missed_checkins': total_checkins - completed_checkins,
+            'current_streak': current_streak,
+            'longest_streak': longest_streak,
+            'daily_stats': daily_stats,
+            'rules': rules
+        }
+
+    @staticmethod
+    def _due_sequence(scheduled_mask, day_states):
+        """
+        规则的应打卡日序列：排期位掩码中自首条记录起的应打卡日，加上有记录的日期（排期变更前的记录）
+        :param scheduled_mask: schedule.expand 得到的位掩码，第 i 位对应区间起始日之后第 i 天
+        :param day_states: {日偏移: 是否完成}，来自区间内的打卡/miss记录
+        :return: [(日偏移, 是否完成)]，按日偏移升序；首条记录之前的日期规则可能尚未创建，不计入
+        """
+        if not day_states:
+            return []
+        first = min(day_states)
+        due = {offset for offset in range(first, scheduled_mask.bit_length()) if scheduled_mask >> offset & 1}
+        return [(offset, day_states.get(offset, False)) for offset in sorted(due | day_states.keys())]
+
+    @staticmethod
+    def _streaks(sequence, today_offset=None):
+        """
+        按应打卡日序列计算连续完成天数（gaps-and-islands：相邻的应打卡日都完成即为连续）
+        :param sequence: [(日偏移, 是否完成)]，按日偏移升序
+        :param today_offset: 今天的日偏移，今天尚未完成时不打断连续
+        :return: (当前连续天数, 最长连续天数)
+        """
+        current = longest = 0
+        for offset, done in sequence:
+            if done:
+                current += 1
+                longest = max(longest, current)
+            elif offset != today_offset:
+                current = 0
+        return current, longest
+
+    @staticmethod
+    def _rate(completed, total):
+        """完成率（百分比，保留一位小数）"""
+        return round(completed / total * 100, 1) if total else 0.0
@@ -4,7 +4,8 @@
 """
 import logging
 from datetime import datetime
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, func, literal, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
 from database.flask_models import db, CommunityCheckinRule, UserCommunityRule, User, Community
 from wxcloudrun.community_service import CommunityService
@@ -16,6 +17,9 @@ logger = logging.getLogger('CommunityCheckinRuleService')
 class CommunityCheckinRuleService:
     """社区打卡规则服务类"""
 
+    # 启用/停用规则时每批处理的用户映射数
+    MAPPING_BATCH_SIZE = 1000
+
     @staticmethod
     def create_community_rule(rule_data, community_id, created_by):
         """
@@ -221,30 +225,8 @@ class CommunityCheckinRuleService:
                 logger.warning(f"用户无权限启用规则: user_id={enabled_by_int}, community_id={rule.community_id}")
                 raise ValueError('无权限启用此规则')
 
-            # 获取社区所有用户
-            community_users = db.session.query(User).filter_by(community_id=rule.community_id).all()
-
-            # 为每个用户创建或更新映射记录
-            for user in community_users:
-                # 查找是否已有映射记录
-                existing_mapping = db.session.query(UserCommunityRule).filter_by(
-                    user_id=user.user_id,
-                    community_rule_id=rule_id
-                ).first()
-                
-                if existing_mapping:
-                    # 如果已有记录，更新为激活状态
-                    existing_mapping.is_active = True
-                else:
-                    # 如果没有记录，创建新记录
-                    mapping = UserCommunityRule(
-                        user_id=user.user_id,
-                        community_rule_id=rule_id,
-                        is_active=True,
-                        created_at=datetime.now()
-                    )
-                    db.session.add(mapping)
-                    db.session.flush()  # 确保新记录立即生效
+            # 为社区所有用户分批创建或激活映射记录（规则启用前映射不生效）
+            affected = CommunityCheckinRuleService._activate_mappings(rule_id, rule.community_id)
 
             # 更新规则状态
             rule.status = 1  # 设置为启用状态
@@ -253,11 +235,17 @@ class CommunityCheckinRuleService:
             rule.updated_at = datetime.now()
 
             db.session.commit()
+
+            # 修补后台miss调度器和成员的今日打卡计划
+            from wxcloudrun.background_tasks import notify_rule_changed
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+            notify_rule_changed(rule, 'community')
+            DailyCheckinPlanService.refresh_community_rule(rule_id)
             
             # 将对象转换为字典
             rule_dict = rule.to_dict()
 
-            logger.info(f"启用社区规则成功: 规则ID={rule_id}, 启用人={enabled_by_int}, 影响用户数={len(community_users)}")
+            logger.info(f"启用社区规则成功: 规则ID={rule_id}, 启用人={enabled_by_int}, 影响用户数={affected}")
             return rule_dict
 
         except SQLAlchemyError as e:
@@ -302,17 +290,21 @@ class CommunityCheckinRuleService:
             if rule.status != 1:
                 raise ValueError('规则未启用')
 
-            # 更新所有用户映射为停用状态
-            db.session.query(UserCommunityRule).filter_by(
-                community_rule_id=rule_id
-            ).update({'is_active': False})
-
-            # 更新规则状态
+            # 更新规则状态（先提交，规则立即停用）
             rule.status = 0  # 设置为停用状态
             rule.disabled_at = datetime.now()
             rule.disabled_by = disabled_by_int
             rule.updated_at = datetime.now()
             db.session.commit()
+
+            # 分批将所有用户映射更新为停用状态
+            CommunityCheckinRuleService._deactivate_mappings(rule_id)
+
+            # 修补后台miss调度器和成员的今日打卡计划
+            from wxcloudrun.background_tasks import notify_rule_changed
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+            notify_rule_changed(rule, 'community')
+            DailyCheckinPlanService.refresh_community_rule(rule_id)
             
             # 将对象转换为字典
             rule_dict = rule.to_dict()
@@ -324,6 +316,71 @@ class CommunityCheckinRuleService:
             logger.error(f"停用社区规则失败: {str(e)}")
             raise
 
+    @staticmethod
+    def _activate_mappings(rule_id, community_id, batch_size=None):
+        """
+        按用户ID分批为社区成员创建或激活规则映射，每批一条
+        INSERT ... SELECT ... ON CONFLICT DO UPDATE 并单独提交，避免长时间占用写锁
+        :param rule_id: 社区规则ID
+        :param community_id: 社区ID
+        :param batch_size: 每批用户数，默认 MAPPING_BATCH_SIZE
+        :return: 新建或重新激活的映射数
+        """
+        batch_size = batch_size or CommunityCheckinRuleService.MAPPING_BATCH_SIZE
+        affected = 0
+        last_user_id = 0
+        while True:
+            batch = select(User.user_id).where(
+                User.community_id == community_id,
+                User.user_id > last_user_id
+            ).order_by(User.user_id).limit(batch_size).subquery()
+            upper_user_id = db.session.query(func.max(batch.c.user_id)).scalar()
+            if upper_user_id is None:
+                break
+
+            statement = sqlite_insert(UserCommunityRule.__table__).from_select(
+                ['user_id', 'community_rule_id', 'is_active', 'created_at'],
+                select(User.user_id, literal(rule_id), literal(True), literal(datetime.now())).where(
+                    User.community_id == community_id,
+                    User.user_id > last_user_id,
+                    User.user_id <= upper_user_id
+                )
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id', 'community_rule_id'],
+                set_={'is_active': True},
+                where=UserCommunityRule.is_active.isnot(True)
+            )
+            affected += db.session.execute(statement).rowcount
+            db.session.commit()
+            last_user_id = upper_user_id
+        return affected
+
+    @staticmethod
+    def _deactivate_mappings(rule_id, batch_size=None):
+        """
+        分批停用规则的所有用户映射，每批一条 UPDATE 并单独提交
+        :param rule_id: 社区规则ID
+        :param batch_size: 每批映射数，默认 MAPPING_BATCH_SIZE
+        :return: 停用的映射数
+        """
+        batch_size = batch_size or CommunityCheckinRuleService.MAPPING_BATCH_SIZE
+        deactivated = 0
+        while True:
+            batch = select(UserCommunityRule.mapping_id).where(
+                UserCommunityRule.community_rule_id == rule_id,
+                UserCommunityRule.is_active.isnot(False)
+            ).limit(batch_size).scalar_subquery()
+            count = db.session.execute(
+                update(UserCommunityRule).where(UserCommunityRule.mapping_id.in_(batch)).values(is_active=False),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            db.session.commit()
+            deactivated += count
+            if count < batch_size:
+                break
+        return deactivated
+
     @staticmethod
     def get_community_rules(community_id, include_disabled=False):
         """
@@ -561,6 +618,9 @@ class CommunityCheckinRuleService:
 
             db.session.commit()
 
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+            DailyCheckinPlanService.refresh_user(user_id)
+
             logger.info(f"用户社区变更规则同步成功: 用户ID={user_id}, 旧社区={old_community_id}, 新社区={new_community_id}")
             return True
 
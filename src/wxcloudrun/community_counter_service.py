@@ -0,0 +1,182 @@
+"""
+社区人数计数服务模块
+community_counters 为每个社区保存主管、专员、普通成员和全部归属用户的数量：
+成员加入/移出、工作人员增删时在同一事务内按增量更新，列表和详情直接按主键读取；
+计数行缺失时回退为实时统计，后台任务定期整体重算并修正偏差
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, select, union_all, update
+from database.flask_models import db, Community, CommunityCounter, CommunityStaff, User
+
+logger = logging.getLogger('CommunityCounterService')
+
+COUNT_FIELDS = ('manager_count', 'staff_count', 'member_count', 'resident_count')
+
+
+class CommunityCounterService:
+    """社区人数计数服务类"""
+
+    @staticmethod
+    def compute(community_ids=None):
+        """
+        实时统计社区人数（一条 GROUP BY 查询）
+        :param community_ids: 社区ID列表，为None时统计全部社区
+        :return: {community_id: {'manager_count', 'staff_count', 'member_count', 'resident_count'}}
+        """
+        if community_ids is None:
+            community_ids = [cid for (cid,) in db.session.query(Community.community_id).all()]
+            staff_filter, user_filter = [], [User.community_id.isnot(None)]
+        else:
+            community_ids = list(set(community_ids))
+            staff_filter = [CommunityStaff.community_id.in_(community_ids)]
+            user_filter = [User.community_id.in_(community_ids)]
+        counts = {community_id: dict.fromkeys(COUNT_FIELDS, 0) for community_id in community_ids}
+        if not community_ids:
+            return counts
+
+        # 工作人员按角色各一行，归属用户按是否为本社区工作人员各一行，合并后按社区分组计数
+        is_staff = select(CommunityStaff.id).where(
+            CommunityStaff.community_id == User.community_id,
+            CommunityStaff.user_id == User.user_id
+        ).exists()
+        rows = union_all(
+            select(CommunityStaff.community_id.label('community_id'), CommunityStaff.role.label('kind')).where(
+                *staff_filter
+            ),
+            select(User.community_id, case((is_staff, literal('resident_staff')), else_=literal('member'))).where(
+                *user_filter
+            )
+        ).subquery('community_people')
+
+        for row in db.session.query(
+            rows.c.community_id,
+            func.sum(case((rows.c.kind == 'manager', 1), else_=0)).label('manager_count'),
+            func.sum(case((rows.c.kind == 'staff', 1), else_=0)).label('staff_count'),
+            func.sum(case((rows.c.kind == 'member', 1), else_=0)).label('member_count'),
+            func.sum(case((rows.c.kind.in_(['member', 'resident_staff']), 1), else_=0)).label('resident_count')
+        ).group_by(rows.c.community_id).all():
+            if row.community_id in counts:
+                counts[row.community_id] = {field: int(getattr(row, field) or 0) for field in COUNT_FIELDS}
+        return counts
+
+    @staticmethod
+    def get_counts(community_ids):
+        """
+        读取社区人数（一次 IN 查询；没有计数行的社区回退为实时统计）
+        :param community_ids: 社区ID列表
+        :return: {community_id: {'manager_count', 'staff_count', 'member_count', 'resident_count'}}
+        """
+        community_ids = list(set(community_ids))
+        if not community_ids:
+            return {}
+        counts = {
+            counter.community_id: {field: getattr(counter, field) for field in COUNT_FIELDS}
+            for counter in db.session.query(CommunityCounter).filter(
+                CommunityCounter.community_id.in_(community_ids)
+            ).all()
+        }
+        missing = [community_id for community_id in community_ids if community_id not in counts]
+        if missing:
+            counts.update(CommunityCounterService.compute(missing))
+        return counts
+
+    @staticmethod
+    def init_community(community_id):
+        """
+        为新建的社区写入计数行（不提交事务；覆盖已删除社区遗留的同ID计数行）
+        :param community_id: 社区ID
+        """
+        db.session.merge(CommunityCounter(community_id=community_id, updated_at=datetime.now(),
+                                          **CommunityCounterService.compute([community_id])[community_id]))
+
+    @staticmethod
+    def adjust(community_id, **deltas):
+        """
+        在当前事务内增减社区计数（单条 UPDATE，没有计数行时不做处理，由实时统计和校正任务兜底）
+        :param community_id: 社区ID
+        :param deltas: 字段名到增量的映射
+        """
+        values = {field: getattr(CommunityCounter, field) + delta for field, delta in deltas.items() if delta}
+        if community_id is None or not values:
+            return
+        values['updated_at'] = datetime.now()
+        db.session.execute(
+            update(CommunityCounter).where(CommunityCounter.community_id == community_id).values(**values)
+        )
+
+    @staticmethod
+    def user_moved(user_id, old_community_id, new_community_id):
+        """
+        用户社区归属变更后更新两侧计数（在变更工作人员关系之前调用）
+        :param user_id: 用户ID
+        :param old_community_id: 原社区ID（可能为None）
+        :param new_community_id: 新社区ID（可能为None）
+        """
+        if old_community_id == new_community_id:
+            return
+        staff_of = {cid for (cid,) in db.session.query(CommunityStaff.community_id).filter(
+            CommunityStaff.user_id == user_id,
+            CommunityStaff.community_id.in_([old_community_id, new_community_id])
+        ).all()}
+        CommunityCounterService.adjust(
+            old_community_id, resident_count=-1, member_count=0 if old_community_id in staff_of else -1)
+        CommunityCounterService.adjust(
+            new_community_id, resident_count=1, member_count=0 if new_community_id in staff_of else 1)
+
+    @staticmethod
+    def staff_added(community_id, user_id, role):
+        """
+        添加工作人员后更新计数：对应角色加一，若用户归属本社区则普通成员减一
+        :param community_id: 社区ID
+        :param user_id: 用户ID
+        :param role: 角色（'manager' 或 'staff'）
+        """
+        CommunityCounterService._staff_changed(community_id, user_id, role, 1)
+
+    @staticmethod
+    def staff_removed(community_id, user_id, role):
+        """
+        移除工作人员后更新计数：对应角色减一，若用户归属本社区则普通成员加一
+        :param community_id: 社区ID
+        :param user_id: 用户ID
+        :param role: 角色（'manager' 或 'staff'）
+        """
+        CommunityCounterService._staff_changed(community_id, user_id, role, -1)
+
+    @staticmethod
+    def _staff_changed(community_id, user_id, role, delta):
+        field = {'manager': 'manager_count', 'staff': 'staff_count'}.get(role)
+        deltas = {field: delta} if field else {}
+        user = db.session.get(User, user_id)
+        if user and user.community_id == community_id:
+            deltas['member_count'] = -delta
+        CommunityCounterService.adjust(community_id, **deltas)
+
+    @staticmethod
+    def reconcile():
+        """
+        按实时统计整体校正计数表：修正有偏差的行，补齐缺失的行，删除已不存在社区的行
+        :return: 修正的行数
+        """
+        actual = CommunityCounterService.compute()
+        counters = {counter.community_id: counter for counter in db.session.query(CommunityCounter).all()}
+        now = datetime.now()
+
+        added, fixes = [], []
+        for community_id, counts in actual.items():
+            counter = counters.pop(community_id, None)
+            if counter is None:
+                added.append(CommunityCounter(community_id=community_id, updated_at=now, **counts))
+            elif any(getattr(counter, field) != value for field, value in counts.items()):
+                fixes.append({'community_id': community_id, 'updated_at': now, **counts})
+                logger.info(f"社区 {community_id} 人数计数偏差已修正: {counts}")
+        db.session.add_all(added)
+        if fixes:
+            db.session.bulk_update_mappings(CommunityCounter, fixes)
+        for counter in counters.values():
+            db.session.delete(counter)
+        db.session.commit()
+        return len(added) + len(fixes) + len(counters)
@@ -8,7 +8,9 @@ import os
 import json
 from datetime import datetime
 from hashlib import sha256
-from database.flask_models import db, User, Community, CommunityApplication, UserAuditLog
+from database.flask_models import db, User, Community, CommunityApplication, CommunityCounter, UserAuditLog
+from .community_counter_service import CommunityCounterService
+from .user_search_service import UserSearchService
 from const_default import DEFAULT_COMMUNITY_NAME,DEFAULT_COMMUNITY_ID,DEFAULT_BLACK_ROOM_NAME,DEFAULT_BLACK_ROOM_ID
 logger = logging.getLogger('CommunityService')
 
@@ -27,8 +29,10 @@ class CommunityService:
             raise ValueError(f"社区不存在: {community_name}")
 
         # 更新用户的社区ID
+        old_community_id = user.community_id
         user.community_id = community.community_id
         db.session.merge(user)
+        CommunityCounterService.user_moved(user.user_id, old_community_id, community.community_id)
         db.session.commit()
 
         logger.info(f"用户 {user.user_id} 已分配到社区 {community.community_id}")
@@ -77,6 +81,8 @@ class CommunityService:
         )
 
         db.session.add(community)
+        db.session.flush()
+        CommunityCounterService.init_community(community.community_id)
         db.session.commit()
         db.session.refresh(community)
 
@@ -110,6 +116,7 @@ class CommunityService:
             role=staff_role
         )
         db.session.add(staff_record)
+        CommunityCounterService.staff_added(community_id, user_id, staff_role)
 
         # 记录审计日志
         audit_log = UserAuditLog(
@@ -139,6 +146,7 @@ class CommunityService:
 
         # 删除工作人员记录
         db.session.delete(staff_record)
+        CommunityCounterService.staff_removed(community_id, user_id, staff_record.role)
 
         # 记录审计日志
         audit_log = UserAuditLog(
@@ -188,7 +196,9 @@ class CommunityService:
 
             # 将用户加入社区
             user = db.session.get(User, application.user_id)
+            old_community_id = user.community_id
             user.community_id = application.target_community_id
+            CommunityCounterService.user_moved(user.user_id, old_community_id, application.target_community_id)
 
             # 同步社区打卡规则到用户
             from wxcloudrun.community_staff_service import CommunityStaffService
@@ -224,6 +234,11 @@ class CommunityService:
             logger.info(f"社区申请拒绝: 申请ID={application_id}, 理由={rejection_reason}")
 
         db.session.commit()
+
+        if approve:
+            # 社区规则映射已变更，重新生成今日打卡计划
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+            DailyCheckinPlanService.refresh_user(application.user_id)
         return application
 
     @staticmethod
@@ -246,12 +261,14 @@ class CommunityService:
                 phone_hash = sha256(f"{phone_secret}:{keyword}".encode('utf-8')).hexdigest()
                 query = query.filter_by(phone_hash=phone_hash)
             else:
-                # 昵称模糊搜索
-                query = query.filter(User.nickname.like(f"%{keyword}%"))
+                # 昵称模糊搜索（走用户搜索索引）
+                query = UserSearchService.filter_keyword(query, keyword, ('nickname',))
 
         # 分页 - 使用offset和limit实现
         total = query.count()
         offset = (page - 1) * per_page
+        if keyword:
+            query = UserSearchService.order_by_relevance(query, keyword)
         users = query.offset(offset).limit(per_page).all()
 
         # 在会话关闭前将User对象转换为字典，避免会话分离问题
@@ -541,6 +558,7 @@ class CommunityService:
                     role=role
                 )
                 db.session.add(staff)
+                CommunityCounterService.staff_added(community_id, user_id, role)
                 added_count += 1
 
             except Exception as e:
@@ -578,58 +596,90 @@ class CommunityService:
 
         # 删除记录
         db.session.delete(staff)
+        CommunityCounterService.staff_removed(community_id, user_id, staff.role)
         db.session.commit()
 
+    @staticmethod
+    def get_communities_member_stats(community_ids):
+        """
+        批量获取社区的主管、专员和普通成员数量（读取社区计数表，一次 IN 查询）
+        :param community_ids: 社区ID列表
+        :return: {community_id: {'manager_count', 'staff_count', 'user_count'}}，
+                 user_count 为不含工作人员的普通成员数
+        """
+        return {
+            community_id: {
+                'manager_count': counts['manager_count'],
+                'staff_count': counts['staff_count'],
+                'user_count': counts['member_count']
+            }
+            for community_id, counts in CommunityCounterService.get_counts(community_ids).items()
+        }
+
     @staticmethod
     def get_community_members(community_id, page=1, page_size=20):
-        """获取社区成员列表（只返回普通成员，不包括工作人员）"""
-        from database.flask_models import CheckinRecord, CommunityStaff
+        """
+        获取社区成员列表（只返回普通成员，不包括工作人员）及每人今日未完成的打卡事项
+        成员分页和总数一次查询，该页所有成员的今日未打卡记录连同规则名称一次查询
+        """
+        from database.flask_models import CheckinRecord, CheckinRule, CommunityCheckinRule, CommunityStaff
         from datetime import date
-
-        # 获取该社区所有工作人员的用户ID列表
-        staff_user_ids = [s.user_id for s in db.session.query(CommunityStaff).filter_by(
-            community_id=community_id
-        ).all()]
-
-        # 分页查询社区成员 - 使用User表查询，排除工作人员
+        from sqlalchemy import func
+        from wxcloudrun.utils.timeutil import day_range
+
+        # 分页查询社区成员（排除工作人员），总数由窗口函数随页返回
+        is_staff = db.session.query(CommunityStaff.id).filter(
+            CommunityStaff.community_id == community_id,
+            CommunityStaff.user_id == User.user_id
+        ).exists()
+        member_filter = (User.community_id == community_id, ~is_staff)
         offset = (page - 1) * page_size
-        query = db.session.query(User).filter_by(community_id=community_id)
-        
-        # 排除工作人员
-        if staff_user_ids:
-            query = query.filter(User.user_id.notin_(staff_user_ids))
-        
-        total = query.count()
-        members = query.order_by(User.community_joined_at.desc()).offset(offset).limit(page_size).all()
+        rows = db.session.query(User, func.count().over().label('total')).filter(
+            *member_filter
+        ).order_by(User.community_joined_at.desc(), User.user_id.desc()).offset(offset).limit(page_size).all()
+        if rows:
+            total = rows[0].total
+        else:
+            total = db.session.query(func.count(User.user_id)).filter(*member_filter).scalar()
+        members = [row.User for row in rows]
+
+        # 该页成员今日的未打卡(miss)记录，按 (user_id, planned_time) 索引读取
+        unchecked_by_user = {member.user_id: [] for member in members}
+        if members:
+            today_start, today_end = day_range(date.today())
+            records = db.session.query(
+                CheckinRecord.user_id,
+                CheckinRecord.rule_id,
+                CheckinRecord.community_rule_id,
+                CheckinRecord.planned_time,
+                func.coalesce(CommunityCheckinRule.rule_name, CheckinRule.rule_name).label('rule_name')
+            ).outerjoin(
+                CheckinRule, CheckinRule.rule_id == CheckinRecord.rule_id
+            ).outerjoin(
+                CommunityCheckinRule, CommunityCheckinRule.community_rule_id == CheckinRecord.community_rule_id
+            ).filter(
+                CheckinRecord.user_id.in_(list(unchecked_by_user)),
+                CheckinRecord.planned_time >= today_start,
+                CheckinRecord.planned_time < today_end,
+                CheckinRecord.status == 0  # 0-missed(未打卡)
+            ).order_by(CheckinRecord.user_id, CheckinRecord.planned_time).all()
+
+            for record in records:
+                if record.rule_name is None:
+                    continue
+                is_community = record.community_rule_id is not None
+                unchecked_by_user[record.user_id].append({
+                    'rule_id': str(record.community_rule_id if is_community else record.rule_id),
+                    'rule_source': 'community' if is_community else 'personal',
+                    'rule_name': record.rule_name,
+                    'planned_time': record.planned_time.strftime('%H:%M:%S') if record.planned_time else None
+                })
 
         # 格式化响应数据
         members_data = []
-        today = date.today()
-
         for member_user in members:
-            if not member_user:
-                continue
-
-            # 获取今日未完成打卡数和详情
-            from sqlalchemy import and_, func
-            unchecked_records = db.session.query(CheckinRecord).filter(
-                and_(
-                    CheckinRecord.user_id == member_user.user_id,
-                    func.date(CheckinRecord.planned_time) == today,
-                    CheckinRecord.status == 0  # 0-missed(未打卡)
-                )
-            ).all()
-
-            unchecked_items = []
-            for record in unchecked_records:
-                if record.rule:
-                    unchecked_items.append({
-                        'rule_id': str(record.rule_id),
-                        'rule_name': record.rule.rule_name,
-                        'planned_time': record.rule.planned_time.strftime('%H:%M:%S') if record.rule.planned_time else None
-                    })
-
-            user_data = {
+            unchecked_items = unchecked_by_user[member_user.user_id]
+            members_data.append({
                 'user_id': str(member_user.user_id),
                 'nickname': member_user.nickname,
                 'avatar_url': member_user.avatar_url,
@@ -637,9 +687,7 @@ class CommunityService:
                 'join_time': member_user.community_joined_at.isoformat() if member_user.community_joined_at else None,
                 'unchecked_count': len(unchecked_items),
                 'unchecked_items': unchecked_items
-            }
-
-            members_data.append(user_data)
+            })
 
         return members_data, total
 
@@ -654,6 +702,7 @@ class CommunityService:
             raise ValueError("社区不存在")
 
         added_count = 0
+        added_user_ids = []
         failed = []
 
         for user_id in user_ids:
@@ -670,14 +719,17 @@ class CommunityService:
                     continue
 
                 # 更新用户社区信息
+                old_community_id = target_user.community_id
                 target_user.community_id = community_id
                 target_user.community_joined_at = datetime.now()
+                CommunityCounterService.user_moved(user_id, old_community_id, community_id)
 
                 # 同步社区打卡规则到用户
                 from wxcloudrun.community_staff_service import CommunityStaffService
                 CommunityStaffService._activate_new_community_rules(user_id, community_id)
 
                 added_count += 1
+                added_user_ids.append(user_id)
 
             except Exception as e:
                 logger.error(f'添加用户失败 user_id={user_id}: {str(e)}')
@@ -685,6 +737,10 @@ class CommunityService:
 
         db.session.commit()
 
+        # 社区规则映射已变更，重新生成今日打卡计划
+        from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+        DailyCheckinPlanService.refresh_users(added_user_ids)
+
         if added_count == 0:
             raise ValueError({'added_count': added_count, 'failed': failed}, '添加失败')
 
@@ -710,6 +766,7 @@ class CommunityService:
 
         # 特殊社区逻辑处理
         moved_to = None
+        old_community_id = target_user.community_id
 
         # 获取特殊社区ID
         anka_family = db.session.query(Community).filter_by(name=DEFAULT_COMMUNITY_NAME).first()
@@ -742,7 +799,7 @@ class CommunityService:
                     User.community_id != community_id,
                     User.community_id.isnot(None)
                 )
-            ).join(Community).filter(
+            ).join(Community, Community.community_id == User.community_id).filter(
                 Community.name.notin_([DEFAULT_COMMUNITY_NAME, DEFAULT_BLACK_ROOM_NAME])
             ).count()
 
@@ -758,6 +815,7 @@ class CommunityService:
                 target_user.community_id = None
                 target_user.community_joined_at = None
 
+        CommunityCounterService.user_moved(user_id, old_community_id, target_user.community_id)
         db.session.commit()
 
         return {'moved_to': moved_to}
@@ -790,6 +848,7 @@ class CommunityService:
         # 删除相关数据
         db.session.query(CommunityStaff).filter_by(community_id=community_id).delete()
         db.session.query(CommunityApplication).filter_by(target_community_id=community_id).delete()
+        db.session.query(CommunityCounter).filter_by(community_id=community_id).delete()
 
         # 删除社区
         db.session.delete(community)
@@ -819,28 +878,20 @@ class CommunityService:
     @staticmethod
     def search_users(keyword, community_id=None):
         """搜索用户"""
-        from database.flask_models import CommunityStaff
+        # 搜索用户 (按昵称、姓名或手机号，走用户搜索索引)
+        users_query = UserSearchService.filter_keyword(db.session.query(User), keyword)
+        users = UserSearchService.order_by_relevance(users_query, keyword).limit(20).all()
 
-        # 搜索用户 (按昵称或手机号)
-        users_query = db.session.query(User).filter(
-            (User.nickname.like(f'%{keyword}%')) |
-            (User.phone_number.like(f'%{keyword}%'))
-        ).limit(20)
-
-        users = users_query.all()
-
-        # 格式化响应
+        # 格式化响应（整页用户的任职记录一次查询）
+        staff_flags = UserSearchService.annotate_staff([u.user_id for u in users])
         result = []
         for u in users:
-            # 检查是否已是任何社区的工作人员
-            is_staff = db.session.query(CommunityStaff).filter_by(user_id=u.user_id).first() is not None
-
             user_data = {
                 'user_id': str(u.user_id),
                 'nickname': u.nickname,
                 'avatar_url': u.avatar_url,
                 'phone_number': u.phone_number,
-                'is_staff': is_staff
+                'is_staff': staff_flags[u.user_id]['is_staff']
             }
 
             # 如果指定了community_id,检查是否已在该社区
@@ -861,20 +912,18 @@ class CommunityService:
         blackroom_community = db.session.query(Community).filter_by(name=DEFAULT_BLACK_ROOM_NAME).first()
         blackroom_community_id = blackroom_community.community_id if blackroom_community else None
 
-        # 搜索用户 (按昵称或手机号)
-        users_query = db.session.query(User).filter(
-            (User.nickname.like(f'%{keyword}%')) |
-            (User.phone_number.like(f'%{keyword}%'))
-        )
+        # 搜索用户 (按昵称、姓名或手机号，走用户搜索索引)
+        users_query = db.session.query(User)
 
         # 排除黑名单房间的用户
         if blackroom_community_id:
             users_query = users_query.filter(User.community_id != blackroom_community_id)
+        users_query = UserSearchService.filter_keyword(users_query, keyword)
 
         # 分页
         total = users_query.count()
         offset = (page - 1) * per_page
-        users = users_query.offset(offset).limit(per_page).all()
+        users = UserSearchService.order_by_relevance(users_query, keyword).offset(offset).limit(per_page).all()
 
         return {
             'users': users,
@@ -888,39 +937,24 @@ class CommunityService:
     def get_manageable_communities(user, page=1, per_page=7):
         """获取用户可管理的社区列表"""
         from database.flask_models import CommunityStaff
-        from const_default import DEFAULT_COMMUNITY_ID, DEFAULT_BLACK_ROOM_ID
 
         if user.role == 4:  # 超级管理员
-            query = db.session.query(Community).filter_by(status=1)  # 只显示启用状态
-            
-            # 确保特殊社区（安卡大家庭和黑屋）包含在结果中
-            # 获取特殊社区
-            special_communities = db.session.query(Community).filter(
-                Community.community_id.in_([DEFAULT_COMMUNITY_ID, DEFAULT_BLACK_ROOM_ID]),
-                Community.status == 1
-            ).all()
-            
-            # 获取特殊社区ID列表
-            special_community_ids = [c.community_id for c in special_communities]
-            
-            # 如果特殊社区没有被包含在正常查询中，需要确保它们出现在结果中
-            all_communities = query.all()
-            existing_ids = [c.community_id for c in all_communities]
-            
-            # 添加缺失的特殊社区
-            for special_community in special_communities:
-                if special_community.community_id not in existing_ids:
-                    all_communities.append(special_community)
-            
-            # 按创建时间排序
-            all_communities.sort(key=lambda x: x.created_at, reverse=True)
-            
-            # 手动分页
-            total = len(all_communities)
+            # 只显示启用状态的社区，启用的特殊社区（安卡大家庭和黑屋）同样在其中；
+            # 在 SQL 中排序分页，总数由窗口函数随页返回
+            from sqlalchemy import func
+
             offset = (page - 1) * per_page
-            communities = all_communities[offset:offset + per_page]
-            
-            return communities, total
+            rows = db.session.query(Community, func.count().over().label('total')).filter(
+                Community.status == 1
+            ).order_by(
+                Community.created_at.desc(), Community.community_id.desc()
+            ).offset(offset).limit(per_page).all()
+            if rows:
+                total = rows[0].total
+            else:
+                total = db.session.query(func.count(Community.community_id)).filter(Community.status == 1).scalar()
+
+            return [row.Community for row in rows], total
         else:
             # 获取用户作为工作人员的社区
             staff_communities = db.session.query(CommunityStaff).filter_by(
@@ -7,6 +7,7 @@ import json
 from datetime import datetime
 from hashlib import sha256
 from wxcloudrun.user_service import UserService
+from wxcloudrun.community_counter_service import CommunityCounterService
 from database.flask_models import db, User, Community, CommunityStaff, CommunityApplication, UserAuditLog
 from const_default import DEFAULT_COMMUNITY_NAME, DEFAULT_COMMUNITY_ID
 logger = logging.getLogger('CommunityService')
@@ -178,6 +179,7 @@ class CommunityStaffService:
                     role=role
                 )
                 db.session.add(staff)
+                CommunityCounterService.staff_added(community_id, uid, role)
                 
                 # 记录审计日志
                 audit_log = UserAuditLog(
@@ -262,6 +264,7 @@ class CommunityStaffService:
             role=role
         )
         db.session.add(staff)
+        CommunityCounterService.staff_added(community_id, user_id, role)
         
         # 记录审计日志
         audit_log = UserAuditLog(
@@ -297,6 +300,7 @@ class CommunityStaffService:
             raise ValueError("用户不是该社区的工作人员")
         
         db.session.delete(staff)
+        CommunityCounterService.staff_removed(community_id, user_id, staff.role)
         
         # 记录审计日志
         audit_log = UserAuditLog(
@@ -354,6 +358,7 @@ class CommunityStaffService:
             user.community_id = new_community_id
             if new_community_id != old_user_community_id:
                 user.community_joined_at = datetime.now()
+            CommunityCounterService.user_moved(user_id, old_user_community_id, new_community_id)
             
             # 1. 停用旧社区的社区规则
             deactivated_count = 0
@@ -370,10 +375,12 @@ class CommunityStaffService:
             # 3. 处理工作人员关系
             # 移除旧社区的工作人员关系
             if old_community_id:
-                db.session.query(CommunityStaff).filter_by(
+                for old_staff in db.session.query(CommunityStaff).filter_by(
                     community_id=old_community_id,
                     user_id=user_id
-                ).delete()
+                ).all():
+                    db.session.delete(old_staff)
+                    CommunityCounterService.staff_removed(old_community_id, user_id, old_staff.role)
             
             # 如果新社区存在，检查是否需要添加工作人员关系
             if new_community_id:
@@ -384,8 +391,13 @@ class CommunityStaffService:
                         role='manager' if user.role >= 3 else 'staff'
                     )
                     db.session.add(staff)
+                    CommunityCounterService.staff_added(new_community_id, user_id, staff.role)
             
             db.session.commit()
+
+            # 社区规则映射已变更，重新生成今日打卡计划
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+            DailyCheckinPlanService.refresh_user(user_id)
             
             logger.info(f"用户{user_id}社区切换完成: 停用{deactivated_count}个旧规则，激活{activated_count}个新规则")
             
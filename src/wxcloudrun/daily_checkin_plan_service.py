@@ -0,0 +1,380 @@
+"""
+每日打卡计划服务模块
+零点后批量物化当天所有用户的打卡事项，规则变更和打卡时增量修补，
+今日打卡计划接口只需按用户读取一次
+"""
+
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database.flask_models import (
+    db, CheckinRecord, CheckinRule, Community, CommunityCheckinRule,
+    DailyCheckinPlan, DailyCheckinPlanBuild, DailyCheckinPlanVersion, UserCommunityRule
+)
+from .checkin_rule_service import CheckinRuleService
+from .utils import schedule
+from .utils.timeutil import day_range
+from .utils.user_cache import UserCache
+
+logger = logging.getLogger('DailyCheckinPlanService')
+
+# 今日打卡计划接口的响应缓存，计划事项变更时按用户失效，当天结束时过期；
+# 读取前比对 plan_stamp（当天构建时间 + 用户计划版本），其他进程的变更也能使本进程的条目失效
+today_plan_cache = UserCache('today_plan')
+
+
+class DailyCheckinPlanService:
+    """每日打卡计划服务类"""
+
+    # 批量插入计划事项的每批行数
+    INSERT_BATCH_SIZE = 1000
+
+    @staticmethod
+    def build_plans(day=None):
+        """
+        批量构建某天所有用户的打卡计划（零点后由后台任务调用）
+        :param day: 计划日期，默认今天
+        :return: 构建的事项数
+        """
+        day = day or date.today()
+        try:
+            db.session.query(DailyCheckinPlan).filter(
+                DailyCheckinPlan.plan_date == day
+            ).delete(synchronize_session=False)
+            item_count = DailyCheckinPlanService._insert_items(day)
+            db.session.merge(DailyCheckinPlanBuild(plan_date=day, item_count=item_count, built_at=datetime.now()))
+            db.session.commit()
+            today_plan_cache.clear()
+            logger.info(f"构建每日打卡计划成功: 日期={day}, 事项数={item_count}")
+            return item_count
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"构建每日打卡计划失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def ensure_built(day=None):
+        """
+        当天计划尚未构建时执行构建
+        :param day: 计划日期，默认今天
+        :return: 是否执行了构建
+        """
+        day = day or date.today()
+        if DailyCheckinPlanService.is_built(day):
+            return False
+        DailyCheckinPlanService.build_plans(day)
+        return True
+
+    @staticmethod
+    def is_built(day):
+        """
+        判断某天的计划是否已完成批量构建
+        :param day: 计划日期
+        :return: Boolean
+        """
+        return db.session.get(DailyCheckinPlanBuild, day) is not None
+
+    @staticmethod
+    def plan_stamp(user_id, day=None):
+        """
+        读取用户某天计划的版本戳（一次查询），用于判断进程内缓存是否已被其他进程的变更失效
+        :param user_id: 用户ID
+        :param day: 计划日期，默认今天
+        :return: (当天批量构建时间, 用户计划版本号)
+        """
+        day = day or date.today()
+        built_at = select(DailyCheckinPlanBuild.built_at).where(
+            DailyCheckinPlanBuild.plan_date == day
+        ).scalar_subquery()
+        version = select(DailyCheckinPlanVersion.version).where(
+            DailyCheckinPlanVersion.user_id == user_id
+        ).scalar_subquery()
+        row = db.session.execute(select(built_at, version)).one()
+        return (row[0], row[1] or 0)
+
+    @staticmethod
+    def bump_versions(user_ids):
+        """
+        递增用户的计划版本号（不提交，与计划变更在同一事务内）
+        :param user_ids: 用户ID列表
+        """
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        now = datetime.now()
+        stmt = sqlite_insert(DailyCheckinPlanVersion).values(
+            [{'user_id': user_id, 'version': 1, 'updated_at': now} for user_id in user_ids]
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[DailyCheckinPlanVersion.user_id],
+            set_={'version': DailyCheckinPlanVersion.version + 1, 'updated_at': now}
+        ))
+
+    @staticmethod
+    def get_user_plan_items(user_id, day=None, rule_source=None):
+        """
+        按用户读取某天的计划事项（按计划时间排序）
+        当天尚未批量构建且该用户没有计划行时，按规则和打卡记录即时计算（不写入，读请求不产生写操作）
+        :param user_id: 用户ID
+        :param day: 计划日期，默认今天
+        :param rule_source: 仅返回指定来源（personal/community），为None时返回全部
+        :return: DailyCheckinPlan 列表
+        """
+        day = day or date.today()
+        items = DailyCheckinPlanService._query_user_items(user_id, day)
+        if not items and not DailyCheckinPlanService.is_built(day):
+            items = sorted((DailyCheckinPlan(**item) for item in DailyCheckinPlanService._compute_items(
+                day, user_id=user_id)), key=lambda item: item.planned_time)
+
+        if rule_source:
+            items = [item for item in items if item.rule_source == rule_source]
+        return items
+
+    @staticmethod
+    def refresh_user(user_id, day=None):
+        """
+        重新生成一个用户某天的计划（个人规则变更、社区规则映射变更时调用）
+        :param user_id: 用户ID
+        :param day: 计划日期，默认今天
+        :return: 生成的事项数
+        """
+        day = day or date.today()
+        today_plan_cache.invalidate(user_id)
+        try:
+            db.session.query(DailyCheckinPlan).filter(
+                DailyCheckinPlan.plan_date == day,
+                DailyCheckinPlan.user_id == user_id
+            ).delete(synchronize_session=False)
+            item_count = DailyCheckinPlanService._insert_items(day, user_id=user_id)
+            DailyCheckinPlanService.bump_versions([user_id])
+            db.session.commit()
+            return item_count
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"更新用户每日打卡计划失败: 用户ID={user_id}, {str(e)}")
+            return 0
+
+    @staticmethod
+    def refresh_users(user_ids, day=None):
+        """
+        批量重新生成多个用户某天的计划
+        :param user_ids: 用户ID列表
+        :param day: 计划日期，默认今天
+        """
+        for user_id in set(user_ids):
+            DailyCheckinPlanService.refresh_user(user_id, day)
+
+    @staticmethod
+    def refresh_community_rule(community_rule_id, day=None):
+        """
+        重新生成某条社区规则在所有成员计划中的事项（社区规则启用/停用时调用）
+        :param community_rule_id: 社区规则ID
+        :param day: 计划日期，默认今天
+        :return: 生成的事项数
+        """
+        day = day or date.today()
+        try:
+            rule_items = db.session.query(DailyCheckinPlan).filter(
+                DailyCheckinPlan.plan_date == day,
+                DailyCheckinPlan.rule_source == 'community',
+                DailyCheckinPlan.rule_id == community_rule_id
+            )
+            # 停用前、启用后计划中包含该规则的用户都需要失效缓存
+            affected_users = {row.user_id for row in rule_items.with_entities(DailyCheckinPlan.user_id)}
+            rule_items.delete(synchronize_session=False)
+            item_count = DailyCheckinPlanService._insert_items(day, community_rule_id=community_rule_id)
+            affected_users.update(row.user_id for row in rule_items.with_entities(DailyCheckinPlan.user_id))
+            DailyCheckinPlanService.bump_versions(affected_users)
+            db.session.commit()
+            today_plan_cache.invalidate_users(affected_users)
+            return item_count
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"更新社区规则每日打卡计划失败: 规则ID={community_rule_id}, {str(e)}")
+            return 0
+
+    @staticmethod
+    def sync_record(rule_id, user_id, rule_source='personal', day=None):
+        """
+        打卡、撤销打卡、标记miss后，按当天记录更新对应计划事项的状态
+        :param rule_id: 规则ID（社区规则为community_rule_id）
+        :param user_id: 打卡用户ID
+        :param rule_source: 规则来源（personal/community）
+        :param day: 计划日期，默认今天
+        """
+        day = day or date.today()
+        today_plan_cache.invalidate(user_id)
+        try:
+            if rule_source == 'community':
+                condition = (CheckinRecord.community_rule_id == rule_id) & (CheckinRecord.solo_user_id == user_id)
+            else:
+                condition = CheckinRecord.rule_id == rule_id
+            states = DailyCheckinPlanService._record_states(day, condition)
+            state = states.get((rule_source, rule_id, user_id), DailyCheckinPlanService._unchecked_state())
+
+            db.session.query(DailyCheckinPlan).filter(
+                DailyCheckinPlan.plan_date == day,
+                DailyCheckinPlan.user_id == user_id,
+                DailyCheckinPlan.rule_source == rule_source,
+                DailyCheckinPlan.rule_id == rule_id
+            ).update(state, synchronize_session=False)
+            DailyCheckinPlanService.bump_versions([user_id])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"同步每日打卡计划状态失败: 规则ID={rule_id}, 用户ID={user_id}, {str(e)}")
+
+    @staticmethod
+    def _query_user_items(user_id, day):
+        """按 (user_id, plan_date, planned_time) 索引读取用户某天的计划事项"""
+        return db.session.query(DailyCheckinPlan).filter(
+            DailyCheckinPlan.user_id == user_id,
+            DailyCheckinPlan.plan_date == day
+        ).order_by(DailyCheckinPlan.planned_time, DailyCheckinPlan.plan_id).all()
+
+    @staticmethod
+    def _insert_items(day, user_id=None, community_rule_id=None):
+        """
+        计算某天需要打卡的事项并批量插入（不提交）
+        :param day: 计划日期
+        :param user_id: 仅生成该用户的事项
+        :param community_rule_id: 仅生成该社区规则的事项
+        :return: 插入的事项数
+        """
+        items = DailyCheckinPlanService._compute_items(day, user_id=user_id, community_rule_id=community_rule_id)
+
+        # 使用表级 INSERT 一次 executemany；ORM 批量插入会按非空列分组，已打卡/未打卡交替时退化为逐行执行
+        batch_size = DailyCheckinPlanService.INSERT_BATCH_SIZE
+        for i in range(0, len(items), batch_size):
+            db.session.execute(insert(DailyCheckinPlan.__table__), items[i:i + batch_size])
+        return len(items)
+
+    @staticmethod
+    def _compute_items(day, user_id=None, community_rule_id=None):
+        """
+        计算某天需要打卡的事项（只读）
+        :param day: 计划日期
+        :param user_id: 仅计算该用户的事项
+        :param community_rule_id: 仅计算该社区规则的事项
+        :return: 计划事项字典列表，键与 DailyCheckinPlan 的列一致
+        """
+        rows = []
+        record_conditions = []
+
+        if community_rule_id is None:
+            personal_query = db.session.query(
+                CheckinRule.rule_id,
+                CheckinRule.user_id,
+                CheckinRule.rule_name,
+                CheckinRule.icon_url,
+                CheckinRule.time_slot_type,
+                CheckinRule.custom_time
+            ).filter(
+                CheckinRule.status == 1,
+                schedule.due_condition(CheckinRule, day)
+            )
+            if user_id is not None:
+                personal_query = personal_query.filter(CheckinRule.user_id == user_id)
+                record_conditions.append(CheckinRecord.user_id == user_id)
+            rows.extend(('personal', row) for row in personal_query.all())
+
+        community_query = db.session.query(
+            CommunityCheckinRule.community_rule_id.label('rule_id'),
+            UserCommunityRule.user_id,
+            CommunityCheckinRule.rule_name,
+            CommunityCheckinRule.icon_url,
+            CommunityCheckinRule.time_slot_type,
+            CommunityCheckinRule.custom_time,
+            Community.name.label('community_name')
+        ).join(
+            CommunityCheckinRule,
+            CommunityCheckinRule.community_rule_id == UserCommunityRule.community_rule_id
+        ).outerjoin(
+            Community, Community.community_id == CommunityCheckinRule.community_id
+        ).filter(
+            UserCommunityRule.is_active == True,
+            CommunityCheckinRule.status == 1,
+            schedule.due_condition(CommunityCheckinRule, day)
+        )
+        if user_id is not None:
+            community_query = community_query.filter(UserCommunityRule.user_id == user_id)
+            record_conditions.append(CheckinRecord.solo_user_id == user_id)
+        if community_rule_id is not None:
+            community_query = community_query.filter(CommunityCheckinRule.community_rule_id == community_rule_id)
+            record_conditions.append(CheckinRecord.community_rule_id == community_rule_id)
+        rows.extend(('community', row) for row in community_query.all())
+
+        if not rows:
+            return []
+
+        # 当天的打卡记录一次读取，按 (来源, 规则, 用户) 归并状态
+        states = DailyCheckinPlanService._record_states(
+            day, or_(*record_conditions) if record_conditions else None)
+
+        items = []
+        for rule_source, row in rows:
+            item = {
+                'plan_date': day,
+                'user_id': row.user_id,
+                'rule_source': rule_source,
+                'rule_id': row.rule_id,
+                'rule_name': row.rule_name,
+                'icon_url': row.icon_url,
+                'community_name': getattr(row, 'community_name', None),
+                'planned_time': CheckinRuleService._calculate_planned_time(row, day),
+                'updated_at': datetime.now()
+            }
+            item.update(states.get((rule_source, row.rule_id, row.user_id),
+                                   DailyCheckinPlanService._unchecked_state()))
+            items.append(item)
+        return items
+
+    @staticmethod
+    def _record_states(day, condition=None):
+        """
+        读取某天的打卡/撤销记录并归并为计划状态：有已打卡记录即为 checked，否则保留最后一条撤销记录
+        :param day: 计划日期
+        :param condition: 额外的记录过滤条件
+        :return: {(rule_source, rule_id, user_id): 状态字典}
+        """
+        day_start, day_end = day_range(day)
+        query = db.session.query(
+            CheckinRecord.record_id,
+            CheckinRecord.rule_id,
+            CheckinRecord.community_rule_id,
+            CheckinRecord.user_id,
+            CheckinRecord.solo_user_id,
+            CheckinRecord.checkin_time,
+            CheckinRecord.status
+        ).filter(
+            CheckinRecord.planned_time >= day_start,
+            CheckinRecord.planned_time < day_end,
+            CheckinRecord.status.in_([1, 2])
+        )
+        if condition is not None:
+            query = query.filter(condition)
+
+        states = {}
+        for record in query.order_by(CheckinRecord.record_id).all():
+            if record.community_rule_id is not None:
+                key = ('community', record.community_rule_id, record.solo_user_id)
+            else:
+                key = ('personal', record.rule_id, record.user_id)
+
+            current = states.get(key)
+            if current and current['status'] == 'checked':
+                continue
+            if record.status == 1:
+                states[key] = {'status': 'checked', 'record_id': record.record_id,
+                               'checkin_time': record.checkin_time}
+            else:
+                states[key] = {'status': 'unchecked', 'record_id': record.record_id,
+                               'checkin_time': None}
+        return states
+
+    @staticmethod
+    def _unchecked_state():
+        """没有打卡/撤销记录时的计划状态"""
+        return {'status': 'unchecked', 'record_id': None, 'checkin_time': None}
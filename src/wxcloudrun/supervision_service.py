@@ -0,0 +1,161 @@
+"""
+监督关系服务模块
+查询监督关系列表和被监督人的打卡记录，监督数量、最近打卡时间在同一查询中聚合，
+用户资料随列表一起读取，一屏数据只需固定次数的查询
+"""
+
+import logging
+
+from sqlalchemy import case, distinct, func
+from sqlalchemy.orm import joinedload
+from database.flask_models import db, CheckinRecord, CommunityCheckinRule, SupervisionRuleRelation, User
+from .checkin_record_service import CheckinRecordService
+
+logger = logging.getLogger('SupervisionService')
+
+# 监督关系状态：已同意
+RELATION_STATUS_ACCEPTED = 2
+
+
+class SupervisionService:
+    """监督关系服务类"""
+
+    # 列表每页最多条数
+    MAX_PER_PAGE = 100
+
+    @staticmethod
+    def get_supervised_users(supervisor_user_id, page=1, per_page=20):
+        """
+        获取我监督的用户列表
+        :param supervisor_user_id: 监护人用户ID
+        :param page: 页码
+        :param per_page: 每页条数
+        :return: 字典，包含 supervised_users、total、page、per_page
+        """
+        users, total = SupervisionService._query_related_users(
+            SupervisionRuleRelation.supervisor_user_id, SupervisionRuleRelation.solo_user_id,
+            supervisor_user_id, page, per_page)
+        logger.info(f"获取监督用户列表成功: 监护人ID={supervisor_user_id}, 总数={total}")
+        return {
+            'supervised_users': users,
+            'total': total,
+            'page': page,
+            'per_page': per_page
+        }
+
+    @staticmethod
+    def get_guardians(user_id, page=1, per_page=20):
+        """
+        获取监督我的用户列表
+        :param user_id: 被监督人用户ID
+        :param page: 页码
+        :param per_page: 每页条数
+        :return: 字典，包含 guardians、total、page、per_page
+        """
+        guardians, total = SupervisionService._query_related_users(
+            SupervisionRuleRelation.solo_user_id, SupervisionRuleRelation.supervisor_user_id,
+            user_id, page, per_page)
+        logger.info(f"获取监督者列表成功: 用户ID={user_id}, 总数={total}")
+        return {
+            'guardians': guardians,
+            'total': total,
+            'page': page,
+            'per_page': per_page
+        }
+
+    @staticmethod
+    def get_supervision_records(supervisor, start_date=None, end_date=None, cursor=None, limit=None):
+        """
+        获取监护人可查看的打卡记录（游标分页）
+        :param supervisor: 监护人 User 对象
+        :param start_date: 开始日期（含）
+        :param end_date: 结束日期（含）
+        :param cursor: 上一页返回的 next_cursor
+        :param limit: 每页条数
+        :return: 字典，包含 records、has_more、next_cursor
+        :raises ValueError: 当游标无效时
+        """
+        page = CheckinRecordService.get_supervised_records_page(
+            supervisor.user_id, start_date, end_date, cursor=cursor, limit=limit,
+            options=lambda records: (joinedload(records.user), joinedload(records.rule)))
+        records = page['records']
+
+        # 社区规则没有关系映射，本页涉及的规则名称一次读取
+        community_rule_ids = {r.community_rule_id for r in records if r.community_rule_id is not None}
+        community_rule_names = {}
+        if community_rule_ids:
+            community_rule_names = dict(db.session.query(
+                CommunityCheckinRule.community_rule_id, CommunityCheckinRule.rule_name
+            ).filter(CommunityCheckinRule.community_rule_id.in_(community_rule_ids)).all())
+
+        items = []
+        for record in records:
+            if record.community_rule_id is not None:
+                rule_name = community_rule_names.get(record.community_rule_id)
+            else:
+                rule_name = record.rule.rule_name if record.rule else None
+            items.append({
+                'record_id': record.record_id,
+                'supervisor_id': supervisor.user_id,
+                'supervisor_nickname': supervisor.nickname,
+                'supervised_id': record.user_id,
+                'supervised_nickname': record.user.nickname if record.user else None,
+                'rule_id': record.rule_id,
+                'community_rule_id': record.community_rule_id,
+                'rule_name': rule_name,
+                'planned_time': record.planned_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'checkin_time': record.checkin_time.strftime('%Y-%m-%d %H:%M:%S') if record.checkin_time else None,
+                'status': record.status_name,
+                'created_at': record.created_at.strftime('%Y-%m-%d %H:%M:%S') if record.created_at else None
+            })
+
+        return {
+            'records': items,
+            'has_more': page['has_more'],
+            'next_cursor': page['next_cursor']
+        }
+
+    @staticmethod
+    def _query_related_users(self_column, other_column, user_id, page, per_page):
+        """
+        按监督关系查询对方用户：资料、监督数量和最近打卡时间在一次分组查询中得到，总数另用一次计数
+        :param self_column: 关系中当前用户所在的列
+        :param other_column: 关系中对方用户所在的列
+        :return: (用户字典列表, 总数)
+        """
+        page = max(page, 1)
+        per_page = max(min(per_page, SupervisionService.MAX_PER_PAGE), 1)
+        accepted = (self_column == user_id) & (SupervisionRuleRelation.status == RELATION_STATUS_ACCEPTED)
+
+        last_checkin = db.session.query(
+            func.max(CheckinRecord.checkin_time)
+        ).filter(
+            CheckinRecord.user_id == User.user_id,
+            CheckinRecord.status == 1
+        ).correlate(User).scalar_subquery()
+
+        rows = db.session.query(
+            User.user_id,
+            User.nickname,
+            User.avatar_url,
+            func.count(SupervisionRuleRelation.relation_id).label('supervision_count'),
+            func.max(case((SupervisionRuleRelation.rule_id.is_(None), 1), else_=0)).label('all_rules'),
+            last_checkin.label('last_checkin')
+        ).join(
+            SupervisionRuleRelation, other_column == User.user_id
+        ).filter(accepted).group_by(
+            User.user_id, User.nickname, User.avatar_url
+        ).order_by(User.user_id).offset((page - 1) * per_page).limit(per_page).all()
+
+        total = db.session.query(func.count(distinct(other_column))).filter(accepted).scalar()
+
+        users = [{
+            'user_id': row.user_id,
+            'nickname': row.nickname,
+            'avatar_url': row.avatar_url,
+            'supervision_count': row.supervision_count,
+            'supervise_all_rules': bool(row.all_rules),
+            'last_checkin': row.last_checkin.strftime('%Y-%m-%d %H:%M:%S') if row.last_checkin else None,
+            'status': 'active'
+        } for row in rows]
+        return users, total
@@ -0,0 +1,104 @@
+"""
+后台任务租约服务模块
+基于数据库表的租约选主，保证多个进程中只有一个执行后台周期任务
+"""
+
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import case, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database.flask_models import BackgroundTaskLease, db
+
+logger = logging.getLogger('TaskLeaseService')
+
+
+class TaskLeaseService:
+    """后台任务租约服务类"""
+
+    @staticmethod
+    def generate_holder_id():
+        """生成当前进程的持有者标识：主机名:进程号:随机串"""
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    @staticmethod
+    def ensure_table():
+        """确保租约表存在（旧数据库未迁移时按需创建）"""
+        BackgroundTaskLease.__table__.create(bind=db.engine, checkfirst=True)
+
+    @staticmethod
+    def try_acquire(lease_name, holder_id, ttl_seconds, now=None):
+        """
+        获取或续约租约（原子操作）
+        仅当租约由自己持有或已过期时才会成功，成功后过期时间顺延 ttl_seconds
+        :param lease_name: 租约名称
+        :param holder_id: 持有者标识
+        :param ttl_seconds: 租约有效期（秒）
+        :param now: 当前时间，默认 datetime.now()
+        :return: 是否持有租约
+        """
+        now = now or datetime.now()
+        try:
+            # 确保租约行存在（并发插入时只有一条生效），新行立即可被抢占
+            db.session.execute(
+                sqlite_insert(BackgroundTaskLease)
+                .values(lease_name=lease_name, holder_id=None, expires_at=now)
+                .on_conflict_do_nothing(index_elements=['lease_name'])
+            )
+
+            # 单条 UPDATE 完成抢占/续约，依靠数据库写锁保证只有一个进程成功
+            result = db.session.execute(
+                update(BackgroundTaskLease)
+                .where(
+                    BackgroundTaskLease.lease_name == lease_name,
+                    or_(BackgroundTaskLease.holder_id == holder_id,
+                        BackgroundTaskLease.expires_at <= now)
+                )
+                .values(
+                    acquired_at=case(
+                        (BackgroundTaskLease.holder_id == holder_id, BackgroundTaskLease.acquired_at),
+                        else_=now
+                    ),
+                    holder_id=holder_id,
+                    heartbeat_at=now,
+                    expires_at=now + timedelta(seconds=ttl_seconds)
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            return result.rowcount == 1
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"获取租约失败: lease={lease_name}, holder={holder_id}, 错误: {str(e)}")
+            return False
+
+    @staticmethod
+    def release(lease_name, holder_id, now=None):
+        """
+        释放自己持有的租约，使其他进程可以立即接管
+        :return: 是否释放成功
+        """
+        now = now or datetime.now()
+        try:
+            result = db.session.execute(
+                update(BackgroundTaskLease)
+                .where(
+                    BackgroundTaskLease.lease_name == lease_name,
+                    BackgroundTaskLease.holder_id == holder_id
+                )
+                .values(expires_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            return result.rowcount == 1
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"释放租约失败: lease={lease_name}, holder={holder_id}, 错误: {str(e)}")
+            return False
+
+    @staticmethod
+    def get_lease(lease_name):
+        """查询租约当前状态"""
+        return db.session.get(BackgroundTaskLease, lease_name)
@@ -2,13 +2,16 @@
 用户打卡规则服务模块
 处理用户规则查询和聚合逻辑（个人规则 + 社区规则）
 """
+import copy
 import logging
 from datetime import datetime
+from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 from database.flask_models import db, CheckinRule, CommunityCheckinRule, UserCommunityRule, User, CheckinRecord
 from wxcloudrun.checkin_rule_service import CheckinRuleService
 from wxcloudrun.community_checkin_rule_service import CommunityCheckinRuleService
 from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.checkin_statistics_service import CheckinStatisticsService
 
 logger = logging.getLogger('UserCheckinRuleService')
 
@@ -189,71 +192,54 @@ class UserCheckinRuleService:
             list: 今日打卡事项列表
         """
         try:
-            today_plan = []
-
-            # 获取个人规则的今日计划
-            personal_plan_result = CheckinRuleService.get_today_checkin_plan(user_id)
-            if isinstance(personal_plan_result, dict) and 'checkin_items' in personal_plan_result:
-                personal_plan = personal_plan_result['checkin_items']
-            else:
-                personal_plan = []
-            
-            for item in personal_plan:
-                item['rule_source'] = 'personal'
-                item['is_editable'] = True
-                today_plan.append(item)
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService, today_plan_cache
 
-            # 获取激活的社区规则的今日计划
-            community_rules = UserCheckinRuleService._get_user_active_community_rules(user_id)
+            # 计划事项变更时缓存会被失效（其他进程的变更通过版本戳识别），命中时直接返回
             today = datetime.now().date()
+            stamp = DailyCheckinPlanService.plan_stamp(user_id, today)
+            cached = today_plan_cache.get(user_id, stamp=stamp)
+            if cached is not None:
+                return copy.deepcopy(cached)
 
-            for rule in community_rules:
-                # 检查今天是否需要打卡
-                if not CheckinRuleService._should_checkin_today(rule, today):
-                    continue
-
-                # 获取今日打卡记录
-                from sqlalchemy import func
-                today_records = (db.session.query(CheckinRecord)
-                            .filter(
-                                CheckinRecord.rule_id == rule.community_rule_id,
-                                func.date(CheckinRecord.checkin_time) == today,  # 更新字段名
-                                CheckinRecord.user_id == user_id  # 更新字段名
-                            )
-                            .all())
-
-                # 计算计划时间 - 使用规则的时间设置
-                planned_time = CheckinRecordService._calculate_planned_time(rule, today)
-
-                # 确定打卡状态
-                status_info = CheckinRuleService._determine_checkin_status(today_records)
-
-                plan_item = {
-                    'rule_id': rule.community_rule_id,
-                    'rule_name': rule.rule_name,
-                    'icon_url': rule.icon_url,
-                    'planned_time': planned_time.isoformat() if planned_time else None,
-                    'status': status_info['status'],
-                    'checkin_time': status_info['checkin_time'],
-                    'rule_source': 'community',
-                    'is_editable': False,
-                    'community_name': rule.community.name if rule.community else None
-                }
-
-                today_plan.append(plan_item)
-
-            # 按计划时间排序
-            today_plan.sort(key=lambda x: x['planned_time'] or '')
+            # 个人规则和社区规则事项一次读取，已按计划时间排序
+            today_plan = []
+            for item in DailyCheckinPlanService.get_user_plan_items(user_id, today):
+                checkin_time = item.checkin_time.strftime('%H:%M:%S') if item.checkin_time else None
+                if item.rule_source == 'community':
+                    today_plan.append({
+                        'rule_id': item.rule_id,
+                        'rule_name': item.rule_name,
+                        'icon_url': item.icon_url,
+                        'planned_time': item.planned_time.isoformat(),
+                        'status': item.status,
+                        'checkin_time': checkin_time,
+                        'rule_source': 'community',
+                        'is_editable': False,
+                        'community_name': item.community_name
+                    })
+                else:
+                    today_plan.append({
+                        'rule_id': item.rule_id,
+                        'record_id': item.record_id,
+                        'rule_name': item.rule_name,
+                        'icon_url': item.icon_url,
+                        'planned_time': item.planned_time.strftime('%H:%M:%S'),
+                        'status': item.status,
+                        'checkin_time': checkin_time,
+                        'rule_source': 'personal',
+                        'is_editable': True
+                    })
 
             # 返回与checkin_rule_service.py相同格式的数据结构
             result = {
-                'date': datetime.now().strftime('%Y-%m-%d'),
+                'date': today.strftime('%Y-%m-%d'),
                 'total_items': len(today_plan),
                 'completed_items': len([item for item in today_plan if item.get('status') == 'completed']),
                 'pending_items': len([item for item in today_plan if item.get('status') != 'completed']),
                 'items': today_plan
             }
 
+            today_plan_cache.set(user_id, copy.deepcopy(result), stamp=stamp)
             logger.info(f"获取用户今日计划成功: 用户ID={user_id}, 事项数量={len(today_plan)}")
             return result
 
@@ -372,17 +358,27 @@ class UserCheckinRuleService:
             dict: 统计信息
         """
         try:
-            # 获取个人规则数量
-            personal_rules = CheckinRuleService.query_rules_by_user_id(user_id)
-            personal_count = len(personal_rules)
-
-            # 获取社区规则数量
-            community_rules = CommunityCheckinRuleService.get_user_community_rules(user_id)
-            community_count = len(community_rules)
+            from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+
+            # 规则数量在数据库端计数，不加载规则对象
+            personal_count = db.session.query(func.count(CheckinRule.rule_id)).filter(
+                CheckinRule.user_id == user_id,
+                CheckinRule.status == 1
+            ).scalar()
+            community_count = db.session.query(func.count(UserCommunityRule.mapping_id)).join(
+                CommunityCheckinRule,
+                CommunityCheckinRule.community_rule_id == UserCommunityRule.community_rule_id
+            ).join(
+                User, User.community_id == CommunityCheckinRule.community_id
+            ).filter(
+                User.user_id == user_id,
+                UserCommunityRule.user_id == user_id,
+                UserCommunityRule.is_active == True,
+                CommunityCheckinRule.status == 1
+            ).scalar()
 
-            # 获取今日需要打卡的规则数量
-            today_plan = UserCheckinRuleService.get_today_checkin_plan(user_id)
-            today_count = len(today_plan)
+            # 今日需要打卡的事项数直接取自每日打卡计划
+            today_count = len(DailyCheckinPlanService.get_user_plan_items(user_id))
 
             statistics = {
                 'personal_rule_count': personal_count,
@@ -398,4 +394,31 @@ class UserCheckinRuleService:
 
         except SQLAlchemyError as e:
             logger.error(f"获取用户规则统计失败: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    @staticmethod
+    def get_user_checkin_statistics(user_id, period='week', start_date=None, end_date=None):
+        """
+        获取用户打卡统计（完成率、连续打卡天数、miss次数、按规则统计）
+
+        Args:
+            user_id: 用户ID
+            period: 统计周期（week/month）
+            start_date: 开始日期（含），YYYY-MM-DD
+            end_date: 结束日期（含），YYYY-MM-DD
+
+        Returns:
+            dict: 统计信息
+        """
+        return CheckinStatisticsService.get_statistics(user_id, period, start_date, end_date)
+
+    @staticmethod
+    def get_today_plan_cache_stats():
+        """
+        获取今日打卡计划缓存的命中统计
+
+        Returns:
+            dict: 包含 hits、misses、hit_rate 等字段
+        """
+        from wxcloudrun.daily_checkin_plan_service import today_plan_cache
+        return today_plan_cache.stats()
@@ -0,0 +1,110 @@
+"""
+用户搜索服务模块
+用户搜索走 users_fts 全文索引（昵称、姓名、脱敏手机号的 FTS5 三元组索引），按相关度排序；
+三元组索引只能匹配三个字符以上的关键词，较短的关键词和非SQLite数据库退回 LIKE 查询
+"""
+
+import logging
+
+from sqlalchemy import column, or_, table, text
+from database.flask_models import db, CommunityStaff, User, USER_SEARCH_INDEX_DDL
+
+logger = logging.getLogger('UserSearchService')
+
+# 索引中的可搜索列
+SEARCH_COLUMNS = ('nickname', 'name', 'phone_number')
+
+# 三元组分词器能匹配的最短关键词长度
+MIN_INDEX_KEYWORD_LENGTH = 3
+
+users_fts = table('users_fts', column('rowid'), column('rank'), column('users_fts'))
+
+
+class UserSearchService:
+    """用户搜索服务类"""
+
+    @staticmethod
+    def ensure_index():
+        """
+        确保搜索索引和同步触发器存在（旧数据库按需创建，新建时从 users 表重建索引内容）
+        :return: 是否新建了索引
+        """
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        with db.engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'"
+            )).first() is not None
+            for statement in USER_SEARCH_INDEX_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+                logger.info("用户搜索索引已创建并重建")
+        return not exists
+
+    @staticmethod
+    def uses_index(keyword):
+        """关键词是否可以走全文索引"""
+        return (db.engine.dialect.name == 'sqlite'
+                and len((keyword or '').strip()) >= MIN_INDEX_KEYWORD_LENGTH)
+
+    @staticmethod
+    def filter_keyword(query, keyword, columns=SEARCH_COLUMNS):
+        """
+        给用户查询加上关键词条件（子串匹配，不区分大小写）
+        :param query: User 查询
+        :param keyword: 搜索关键词
+        :param columns: 参与匹配的列，取自 SEARCH_COLUMNS
+        :return: 过滤后的查询
+        """
+        if UserSearchService.uses_index(keyword):
+            # 关键词作为短语匹配，双引号转义后不会被解析为 FTS 查询语法
+            phrase = '"' + keyword.strip().replace('"', '""') + '"'
+            if tuple(columns) != SEARCH_COLUMNS:
+                phrase = '{' + ' '.join(columns) + '} : ' + phrase
+            return query.join(users_fts, users_fts.c.rowid == User.user_id).filter(
+                users_fts.c.users_fts.op('MATCH')(phrase)
+            )
+        return query.filter(or_(*[getattr(User, name).ilike(f'%{keyword}%') for name in columns]))
+
+    @staticmethod
+    def order_by_relevance(query, keyword, *order_by):
+        """
+        按相关度排序（走索引时 bm25 相关度优先），再按给定的列排序
+        :param query: 已经过 filter_keyword 过滤的查询
+        :param keyword: 搜索关键词
+        :param order_by: 相关度相同时的排序列
+        :return: 排序后的查询
+        """
+        if UserSearchService.uses_index(keyword):
+            return query.order_by(users_fts.c.rank, *order_by)
+        return query.order_by(*order_by)
+
+    @staticmethod
+    def annotate_staff(user_ids, community_id=None):
+        """
+        一次 IN 查询加载一页用户的任职记录，在内存中得出各项工作人员标记
+        :param user_ids: 用户ID列表
+        :param community_id: 当前社区ID（可选）
+        :return: {user_id: {'is_staff', 'is_current_community_staff', 'is_current_community_manager',
+                            'is_other_community_manager'}}
+        """
+        user_ids = list(set(user_ids))
+        flags = {user_id: {'is_staff': False, 'is_current_community_staff': False,
+                           'is_current_community_manager': False, 'is_other_community_manager': False}
+                 for user_id in user_ids}
+        if not user_ids:
+            return flags
+        for user_id, staff_community_id, role in db.session.query(
+            CommunityStaff.user_id, CommunityStaff.community_id, CommunityStaff.role
+        ).filter(CommunityStaff.user_id.in_(user_ids)).all():
+            user_flags = flags[user_id]
+            user_flags['is_staff'] = True
+            if community_id and staff_community_id == community_id:
+                if role == 'staff':
+                    user_flags['is_current_community_staff'] = True
+                elif role == 'manager':
+                    user_flags['is_current_community_manager'] = True
+            elif role == 'manager':
+                user_flags['is_other_community_manager'] = True
+        return flags
@@ -16,6 +16,8 @@ from sqlalchemy.orm import joinedload
 
 # 导入Flask-SQLAlchemy模型和实例
 from database.flask_models import db, User, UserAuditLog
+from wxcloudrun.community_counter_service import CommunityCounterService
+from wxcloudrun.user_search_service import UserSearchService
 
 # 全局计数器，用于生成唯一的测试手机号
 _phone_counter = 0
@@ -94,6 +96,8 @@ class UserService:
             if user.verification_materials is not None:
                 existing_user.verification_materials = user.verification_materials
             if user.community_id is not None:
+                CommunityCounterService.user_moved(existing_user.user_id, existing_user.community_id,
+                                                   user.community_id)
                 existing_user.community_id = user.community_id
             if user.status is not None:
                 if isinstance(user.status, int):
@@ -250,6 +254,7 @@ class UserService:
         db.session.add(new_user)
         db.session.flush()  # 刷新以获取数据库生成的ID
         db.session.refresh(new_user)  # 确保获取数据库生成的值
+        CommunityCounterService.user_moved(new_user.user_id, None, new_user.community_id)
 
         # 记录审计日志
         audit_log = UserAuditLog(
@@ -300,35 +305,26 @@ class UserService:
 
             # 构建查询 - 只从安卡大家庭搜索
             from const_default import DEFAULT_COMMUNITY_ID
-            from sqlalchemy import or_
 
             query = User.query.filter(User.community_id == DEFAULT_COMMUNITY_ID)
 
-            # 关键词搜索（昵称或手机号）
-            query = query.filter(
-                or_(
-                    User.nickname.ilike(f'%{keyword}%'),
-                    User.phone_number.ilike(f'%{keyword}%')
-                )
-            )
+            # 关键词搜索（昵称、姓名或手机号，走用户搜索索引）
+            query = UserSearchService.filter_keyword(query, keyword)
 
             # 计算总数
             total_count = query.count()
 
             # 分页查询
             offset = (page - 1) * per_page
-            users = (query.order_by(User.created_at.desc())
+            users = (UserSearchService.order_by_relevance(query, keyword, User.created_at.desc())
                     .offset(offset)
                     .limit(per_page)
                     .all())
 
-            # 格式化响应数据
+            # 格式化响应数据（整页用户的任职记录一次查询）
+            staff_flags = UserSearchService.annotate_staff([u.user_id for u in users])
             result = []
             for u in users:
-                # 检查是否已是任何社区的工作人员
-                from database.flask_models import CommunityStaff
-                is_staff = db.session.query(CommunityStaff).filter_by(user_id=u.user_id).first() is not None
-                
                 user_data = {
                     'user_id': str(u.user_id),
                     'nickname': u.nickname or '未设置昵称',
@@ -336,7 +332,7 @@ class UserService:
                     'phone_number': u.phone_number or '未设置手机号',
                     'community_id': str(u.community_id) if u.community_id else None,
                     'created_at': u.created_at.isoformat() if u.created_at else None,
-                    'is_staff': is_staff
+                    'is_staff': staff_flags[u.user_id]['is_staff']
                 }
 
                 result.append(user_data)
@@ -392,56 +388,25 @@ class UserService:
                     }
                 }
 
-            # 构建基础查询
-            from database.flask_models import CommunityStaff
-            from sqlalchemy import or_
-            
-            query = User.query.filter(
-                or_(
-                    User.nickname.ilike(f'%{keyword}%'),
-                    User.phone_number.ilike(f'%{keyword}%')
-                )
-            )
-
+            # 构建基础查询（昵称、姓名或手机号，走用户搜索索引）
             # 角色过滤：排除超级管理员 (role=4)
-            query = query.filter(User.role != 4)
+            query = User.query.filter(User.role != 4)
+            query = UserSearchService.filter_keyword(query, keyword)
 
             total_count = query.count()
 
             # 分页查询
             offset = (page - 1) * per_page
-            users = (query.order_by(User.created_at.desc())
+            users = (UserSearchService.order_by_relevance(query, keyword, User.created_at.desc())
                     .offset(offset)
                     .limit(per_page)
                     .all())
 
-            # 格式化响应数据
+            # 格式化响应数据（整页用户的任职记录一次查询，当前社区/其他社区的任职标记在内存中得出）
+            staff_flags = UserSearchService.annotate_staff([u.user_id for u in users], community_id)
             result = []
             for u in users:
-                # 检查是否是当前社区的工作人员
-                is_current_community_staff = False
-                current_community_manager = False
-                other_community_manager = False
-                
-                if community_id:
-                    current_community_staff = db.session.query(CommunityStaff).filter_by(
-                        community_id=community_id, 
-                        user_id=u.user_id,
-                        role='staff'
-                    ).first() is not None
-                    
-                    current_community_manager = db.session.query(CommunityStaff).filter_by(
-                        community_id=community_id, 
-                        user_id=u.user_id,
-                        role='manager'
-                    ).first() is not None
-
-                # 检查是否是其他社区的管理员
-                other_community_manager = db.session.query(CommunityStaff).filter_by(
-                    user_id=u.user_id,
-                    role='manager'
-                ).filter(CommunityStaff.community_id != community_id).first() is not None
-
+                flags = staff_flags[u.user_id]
                 user_data = {
                     'user_id': str(u.user_id),
                     'wechat_openid': u.wechat_openid,
@@ -453,10 +418,10 @@ class UserService:
                     'community_id': str(u.community_id) if u.community_id else None,
                     'status': u.status,
                     'created_at': u.created_at.isoformat() if u.created_at else None,
-                    'is_current_community_staff': is_current_community_staff,
-                    'is_current_community_manager': current_community_manager,
-                    'is_other_community_manager': other_community_manager,
-                    'is_staff': db.session.query(CommunityStaff).filter_by(user_id=u.user_id).first() is not None
+                    'is_current_community_staff': flags['is_current_community_staff'],
+                    'is_current_community_manager': flags['is_current_community_manager'],
+                    'is_other_community_manager': flags['is_other_community_manager'],
+                    'is_staff': flags['is_staff']
                 }
 
                 result.append(user_data)
@@ -502,20 +467,20 @@ class UserService:
                 per_page = 100
 
             # 搜索用户
-            query = User.query.filter(
-                User.phone_number.ilike(f'%{normalized_phone}%')
-            ).filter(User.role != 4)  # 排除超级管理员
+            query = User.query.filter(User.role != 4)  # 排除超级管理员
+            query = UserSearchService.filter_keyword(query, normalized_phone, ('phone_number',))
 
             total_count = query.count()
 
             # 分页查询
             offset = (page - 1) * per_page
-            users = (query.order_by(User.created_at.desc())
+            users = (UserSearchService.order_by_relevance(query, normalized_phone, User.created_at.desc())
                     .offset(offset)
                     .limit(per_page)
                     .all())
 
-            # 格式化响应数据
+            # 格式化响应数据（整页用户的任职记录一次查询）
+            staff_flags = UserSearchService.annotate_staff([u.user_id for u in users])
             result = []
             for u in users:
                 user_data = {
@@ -529,7 +494,7 @@ class UserService:
                     'community_id': str(u.community_id) if u.community_id else None,
                     'status': u.status,
                     'created_at': u.created_at.isoformat() if u.created_at else None,
-                    'is_staff': db.session.query(CommunityStaff).filter_by(user_id=u.user_id).first() is not None
+                    'is_staff': staff_flags[u.user_id]['is_staff']
                 }
 
                 result.append(user_data)
@@ -573,20 +538,20 @@ class UserService:
                 per_page = 100
 
             # 搜索用户
-            query = User.query.filter(
-                User.nickname.ilike(f'%{keyword}%')
-            ).filter(User.role != 4)  # 排除超级管理员
+            query = User.query.filter(User.role != 4)  # 排除超级管理员
+            query = UserSearchService.filter_keyword(query, keyword, ('nickname',))
 
             total_count = query.count()
 
             # 分页查询
             offset = (page - 1) * per_page
-            users = (query.order_by(User.created_at.desc())
+            users = (UserSearchService.order_by_relevance(query, keyword, User.created_at.desc())
                     .offset(offset)
                     .limit(per_page)
                     .all())
 
-            # 格式化响应数据
+            # 格式化响应数据（整页用户的任职记录一次查询）
+            staff_flags = UserSearchService.annotate_staff([u.user_id for u in users])
             result = []
             for u in users:
                 user_data = {
@@ -600,7 +565,7 @@ class UserService:
                     'community_id': str(u.community_id) if u.community_id else None,
                     'status': u.status,
                     'created_at': u.created_at.isoformat() if u.created_at else None,
-                    'is_staff': db.session.query(CommunityStaff).filter_by(user_id=u.user_id).first() is not None
+                    'is_staff': staff_flags[u.user_id]['is_staff']
                 }
 
                 result.append(user_data)
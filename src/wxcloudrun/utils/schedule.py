@@ -0,0 +1,177 @@
+"""
+打卡规则排期计算
+把 frequency_type / week_days / custom_start_date / custom_end_date 统一换算为
+"星期位掩码 + 有效日期区间"，按位运算一次展开一个日期区间内的应打卡日：
+结果是整数位掩码，第 i 位对应区间起始日之后第 i 天
+"""
+
+from datetime import time, timedelta
+
+from sqlalchemy import and_, or_
+
+from .timeutil import parse_date_only
+
+# 频率类型
+FREQUENCY_DAILY = 0
+FREQUENCY_WEEKLY = 1
+FREQUENCY_WORKDAYS = 2
+FREQUENCY_CUSTOM = 3
+
+# 星期位掩码：第0位为周一，第6位为周日（与 week_days 字段一致）
+ALL_WEEKDAYS = 0b1111111
+WORKDAYS = 0b0011111
+
+# 时间段对应的计划时间（time_slot_type=4 为自定义时间，缺省时按晚上）
+SLOT_TIMES = {1: time(9, 0), 2: time(14, 0), 3: time(20, 0)}
+DEFAULT_SLOT_TIME = time(20, 0)
+
+
+def _attr(rule, name):
+    if isinstance(rule, dict):
+        return rule.get(name)
+    return getattr(rule, name, None)
+
+
+def _as_date(value):
+    return parse_date_only(value) if isinstance(value, str) else value
+
+
+def rule_schedule(rule):
+    """
+    规则的排期：(星期位掩码, 首个有效日期, 最后有效日期)，日期为None表示不限
+    :param rule: 规则对象、查询行或字典（需要 frequency_type、week_days、custom_start_date、custom_end_date）
+    :return: 元组，规则不会打卡时星期位掩码为0
+    """
+    frequency_type = _attr(rule, 'frequency_type')
+    if frequency_type == FREQUENCY_WEEKLY:
+        return (_attr(rule, 'week_days') or 0) & ALL_WEEKDAYS, None, None
+    if frequency_type == FREQUENCY_WORKDAYS:
+        return WORKDAYS, None, None
+    if frequency_type == FREQUENCY_CUSTOM:
+        first = _as_date(_attr(rule, 'custom_start_date'))
+        last = _as_date(_attr(rule, 'custom_end_date'))
+        if first and last:
+            return ALL_WEEKDAYS, first, last
+        return 0, None, None
+    return ALL_WEEKDAYS, None, None
+
+
+def _rotate(weekdays, weekday):
+    """把星期位掩码旋转为从 weekday 开始：第0位对应 weekday"""
+    return ((weekdays >> weekday) | (weekdays << (7 - weekday))) & ALL_WEEKDAYS
+
+
+def _schedule_mask(schedule, start, days):
+    weekdays, first, last = schedule
+    if not weekdays or days <= 0:
+        return 0
+    # 7位的星期模式按128进制重复：乘以 1 + 2^7 + 2^14 + ...，各段互不进位
+    weeks = (days + 6) // 7
+    mask = _rotate(weekdays, start.weekday()) * (((1 << (7 * weeks)) - 1) // ALL_WEEKDAYS)
+    low = max(0, (first - start).days) if first else 0
+    high = min(days, (last - start).days + 1) if last else days
+    if low >= high:
+        return 0
+    return mask & ((1 << high) - (1 << low))
+
+
+def due_mask(rule, start, end):
+    """
+    规则在 [start, end] 内的应打卡日位掩码
+    :param rule: 规则
+    :param start: 开始日期
+    :param end: 结束日期（包含）
+    :return: 整数，第 i 位表示 start + i 天需要打卡
+    """
+    return _schedule_mask(rule_schedule(rule), start, (end - start).days + 1)
+
+
+def expand(rules, start, end):
+    """
+    一次展开多条规则在 [start, end] 内的应打卡日，排期相同的规则共用同一次计算
+    :param rules: 规则列表
+    :param start: 开始日期
+    :param end: 结束日期（包含）
+    :return: 与 rules 顺序对应的位掩码列表
+    """
+    days = (end - start).days + 1
+    masks = {}
+    result = []
+    for rule in rules:
+        schedule = rule_schedule(rule)
+        if schedule not in masks:
+            masks[schedule] = _schedule_mask(schedule, start, days)
+        result.append(masks[schedule])
+    return result
+
+
+def due_days(mask, start):
+    """
+    位掩码对应的日期列表
+    :param mask: due_mask / expand 的结果
+    :param start: 位掩码第0位对应的日期
+    :return: 日期列表（升序）
+    """
+    days = []
+    while mask:
+        lowest = mask & -mask
+        days.append(start + timedelta(days=lowest.bit_length() - 1))
+        mask ^= lowest
+    return days
+
+
+def is_due(rule, day):
+    """判断规则在指定日期是否需要打卡"""
+    return bool(due_mask(rule, day, day))
+
+
+def due_condition(model, day):
+    """
+    与 is_due 等价的SQL条件，用于在查询中筛选某天需要打卡的规则
+    :param model: CheckinRule 或 CommunityCheckinRule
+    :param day: 目标日期
+    :return: SQL条件表达式
+    """
+    weekday = day.weekday()
+    conditions = [
+        model.frequency_type.notin_([FREQUENCY_WEEKLY, FREQUENCY_WORKDAYS, FREQUENCY_CUSTOM]),  # 每天
+        and_(model.frequency_type == FREQUENCY_WEEKLY,
+             model.week_days.op('&')(1 << weekday) != 0),  # 每周
+        and_(model.frequency_type == FREQUENCY_CUSTOM,
+             model.custom_start_date <= day,
+             model.custom_end_date >= day),  # 自定义日期范围
+    ]
+    if WORKDAYS >> weekday & 1:
+        conditions.append(model.frequency_type == FREQUENCY_WORKDAYS)  # 工作日
+    return or_(*conditions)
+
+
+def next_due(rule, day):
+    """
+    规则在 day 当天或之后的第一个应打卡日（常数时间）
+    :param rule: 规则
+    :param day: 起始日期
+    :return: 日期，之后不再需要打卡时返回None
+    """
+    weekdays, first, last = rule_schedule(rule)
+    if first and first > day:
+        day = first
+    pattern = _rotate(weekdays, day.weekday())
+    if not pattern:
+        return None
+    due = day + timedelta(days=(pattern & -pattern).bit_length() - 1)
+    if last and due > last:
+        return None
+    return due
+
+
+def slot_time(time_slot_type, custom_time=None):
+    """
+    时间段对应的计划时间
+    :param time_slot_type: 时间段类型（1上午/2下午/3晚上/4自定义）
+    :param custom_time: 自定义时间
+    :return: time 对象
+    """
+    if time_slot_type == 4 and custom_time:
+        return custom_time
+    return SLOT_TIMES.get(time_slot_type, DEFAULT_SLOT_TIME)
@@ -1,4 +1,9 @@
-from datetime import datetime
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import Integer, cast, func
+
+# 儒略日与 date.toordinal() 的差值
+JULIAN_DAY_OFFSET = 1721424
 
 def parse_time_only(v):
     if not v:
@@ -20,4 +25,32 @@ def parse_date_only(v):
     try:
         return datetime.strptime(v, '%Y-%m-%d').date()
     except ValueError as e:
-        raise ValueError(f'无效的日期格式: {v}') from e
\ No newline at end of file
+        raise ValueError(f'无效的日期格式: {v}') from e
+
+
+def day_range(d):
+    """
+    某天的时间范围，半开区间 [当天0点, 次日0点)，按范围查询可以使用 planned_time 上的索引
+    :param d: date 对象
+    :return: (当天0点, 次日0点)
+    """
+    start = datetime.combine(d, time.min)
+    return start, start + timedelta(days=1)
+
+
+def day_number(column):
+    """
+    日期时间列对应的整数日序号（SQLite 儒略日，连续日期的序号相差1）
+    :param column: 日期时间列或SQL表达式
+    :return: SQL表达式
+    """
+    return cast(func.julianday(func.date(column)), Integer)
+
+
+def date_number(value):
+    """
+    与 day_number 相同口径的日期序号
+    :param value: date 对象
+    :return: 整数
+    """
+    return value.toordinal() + JULIAN_DAY_OFFSET
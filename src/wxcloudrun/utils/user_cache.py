@@ -0,0 +1,133 @@
+"""
+按用户缓存计算结果的进程内缓存
+条目默认在当天结束时过期，数据变更时由业务代码显式失效，并统计命中/未命中次数；
+其他进程的变更无法显式失效本进程的条目，调用方可传入从数据库读取的版本戳，戳不一致的条目视为未命中。
+缓存的用户数和每个用户的条目数都有上限，超出时淘汰最久未使用的用户或条目，写入时顺带清理该用户已过期的条目
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .timeutil import day_range
+
+logger = logging.getLogger('UserCache')
+
+
+class UserCache:
+    """按用户缓存计算结果"""
+
+    # 默认最多缓存的用户数，以及每个用户最多缓存的条目数
+    MAX_USERS = 10000
+    MAX_KEYS_PER_USER = 8
+
+    def __init__(self, name, max_users=None, max_keys_per_user=None):
+        """
+        :param name: 缓存名称（用于统计）
+        :param max_users: 最多缓存的用户数，默认 MAX_USERS
+        :param max_keys_per_user: 每个用户最多缓存的条目数，默认 MAX_KEYS_PER_USER
+        """
+        self.name = name
+        self.max_users = max_users or self.MAX_USERS
+        self.max_keys_per_user = max_keys_per_user or self.MAX_KEYS_PER_USER
+        # {user_id: {key: (过期时间, 版本戳, 值)}}，两层都按最近使用顺序排列
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, key=None, now=None, stamp=None):
+        """
+        读取缓存
+        :param user_id: 用户ID
+        :param key: 同一用户下的区分键（如统计区间）
+        :param now: 当前时间，默认 datetime.now()
+        :param stamp: 当前版本戳，与写入时的版本戳不一致的条目视为已失效
+        :return: 缓存值，未命中、已过期或版本戳不一致时返回None
+        """
+        now = now or datetime.now()
+        with self._lock:
+            user_entries = self._entries.get(user_id)
+            entry = user_entries.get(key) if user_entries is not None else None
+            if entry is not None and entry[0] > now and entry[1] == stamp:
+                self._entries.move_to_end(user_id)
+                user_entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del user_entries[key]
+                if not user_entries:
+                    del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, value, key=None, expires_at=None, stamp=None):
+        """
+        写入缓存
+        :param user_id: 用户ID
+        :param value: 缓存值
+        :param key: 同一用户下的区分键
+        :param expires_at: 过期时间，默认当天结束（次日0点）
+        :param stamp: 计算该值时读取的版本戳
+        """
+        now = datetime.now()
+        expires_at = expires_at or day_range(now.date())[1]
+        with self._lock:
+            user_entries = self._entries.get(user_id)
+            if user_entries is None:
+                user_entries = self._entries[user_id] = OrderedDict()
+            else:
+                self._entries.move_to_end(user_id)
+                for expired in [k for k, entry in user_entries.items() if entry[0] <= now]:
+                    del user_entries[expired]
+            user_entries[key] = (expires_at, stamp, value)
+            user_entries.move_to_end(key)
+
+            while len(user_entries) > self.max_keys_per_user:
+                user_entries.popitem(last=False)
+                self.evictions += 1
+            while len(self._entries) > self.max_users:
+                _, evicted = self._entries.popitem(last=False)
+                self.evictions += len(evicted)
+
+    def invalidate(self, user_id):
+        """清除一个用户的全部缓存条目"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def invalidate_users(self, user_ids):
+        """清除多个用户的缓存条目"""
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        """清除所有缓存条目"""
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        """命中/未命中/淘汰计数归零"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        缓存统计
+        :return: 字典，包含 name、users、entries、hits、misses、evictions、hit_rate（百分比）
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'users': len(self._entries),
+                'entries': sum(len(user_entries) for user_entries in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0
+            }
@@ -5,7 +5,9 @@ pytest配置文件 - 支持Flask-SQLAlchemy架构
 import sys
 import os
 import pytest
+from contextlib import contextmanager
 from datetime import datetime
+from sqlalchemy import event
 
 # 设置测试环境变量
 os.environ['ENV_TYPE'] = 'unit'
@@ -31,6 +33,28 @@ from test_constants import TEST_CONSTANTS
 from hashlib import sha256
 
 
+@pytest.fixture(scope='function')
+def count_statements(test_app):
+    """
+    统计执行的SQL语句，用于验证查询次数不随数据量增长
+    用法: with count_statements() as statements: ...，块结束后 statements 为块内执行的语句列表
+    """
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
+
+
 @pytest.fixture(scope='function')
 def test_session(test_app):
     """
@@ -143,3 +167,9 @@ def test_app():
         # 清理
         db.drop_all()
 
+    # 进程内的按用户缓存不能跨测试的数据库保留
+    from wxcloudrun.checkin_statistics_service import statistics_cache
+    from wxcloudrun.daily_checkin_plan_service import today_plan_cache
+    statistics_cache.clear()
+    today_plan_cache.clear()
+
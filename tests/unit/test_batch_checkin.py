@@ -0,0 +1,176 @@
+"""
+批量打卡测试
+验证个人规则和社区规则在一次事务中打卡，并返回逐项结果
+"""
+import os
+import sys
+from datetime import datetime, date, time
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import (
+    db, CheckinRule, CheckinRecord, CommunityCheckinRule, User, UserCommunityRule
+)
+from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService
+
+
+def _add_rule(session, user, **kwargs):
+    rule = CheckinRule(user_id=user.user_id, rule_type='personal', rule_name='个人规则',
+                       status=kwargs.pop('status', 1), time_slot_type=1, **kwargs)
+    session.add(rule)
+    session.commit()
+    return rule
+
+
+def _add_community_rule(session, user, community, is_active=True):
+    rule = CommunityCheckinRule(community_id=community.community_id, rule_name='社区规则',
+                                status=1, time_slot_type=2, created_by=user.user_id)
+    session.add(rule)
+    session.flush()
+    session.add(UserCommunityRule(user_id=user.user_id, community_rule_id=rule.community_rule_id,
+                                  is_active=is_active))
+    session.commit()
+    return rule
+
+
+class TestBatchCheckin:
+
+    def test_checks_in_personal_and_community_rules(self, test_session, test_user, test_community):
+        """个人规则与社区规则一起打卡，社区记录写入打卡用户"""
+        test_user.community_id = test_community.community_id
+        test_session.commit()
+        personal = _add_rule(test_session, test_user)
+        community = _add_community_rule(test_session, test_user, test_community)
+
+        result = CheckinRecordService.perform_batch_checkin(
+            test_user.user_id, rule_ids=[personal.rule_id], community_rule_ids=[community.community_rule_id])
+
+        assert result['success_count'] == 2
+        assert result['failed_count'] == 0
+        assert [(r['rule_source'], r['success']) for r in result['results']] == [
+            ('personal', True), ('community', True)]
+
+        community_record = test_session.get(CheckinRecord, result['results'][1]['record_id'])
+        assert community_record.community_rule_id == community.community_rule_id
+        assert community_record.solo_user_id == test_user.user_id
+        assert community_record.user_id == test_user.user_id
+        assert community_record.planned_time == datetime.combine(date.today(), time(14, 0))
+
+    def test_reports_per_item_failures(self, test_session, test_user, test_community):
+        """无权限、已打卡的事项失败，不影响其他事项"""
+        other = User(nickname='其他用户', role=1, status=1)
+        test_session.add(other)
+        test_session.commit()
+        others_rule = _add_rule(test_session, other)
+        checked = _add_rule(test_session, test_user)
+        deleted = _add_rule(test_session, test_user, status=2)
+        fresh = _add_rule(test_session, test_user)
+        inactive = _add_community_rule(test_session, test_user, test_community, is_active=False)
+        test_session.add(CheckinRecord(rule_id=checked.rule_id, user_id=test_user.user_id, status=1,
+                                       planned_time=datetime.combine(date.today(), time(9, 0)),
+                                       checkin_time=datetime.now()))
+        test_session.commit()
+
+        result = CheckinRecordService.perform_batch_checkin(
+            test_user.user_id,
+            rule_ids=[others_rule.rule_id, checked.rule_id, deleted.rule_id, fresh.rule_id, fresh.rule_id],
+            community_rule_ids=[inactive.community_rule_id])
+
+        outcome = {(r['rule_source'], r['rule_id']): (r['success'], r['message']) for r in result['results']}
+        assert len(result['results']) == 5
+        assert outcome[('personal', others_rule.rule_id)] == (False, '打卡规则不存在或无权限')
+        assert outcome[('personal', checked.rule_id)] == (False, '今日该事项已打卡，请勿重复打卡')
+        assert outcome[('personal', deleted.rule_id)][0] is False
+        assert outcome[('personal', fresh.rule_id)] == (True, '打卡成功')
+        assert outcome[('community', inactive.community_rule_id)][0] is False
+        assert result['success_count'] == 1
+
+    def test_updates_missed_record_in_single_commit(self, test_session, test_user, monkeypatch):
+        """已有miss记录时原地更新为已打卡，每项一条 ON CONFLICT 写入且不先读取今日记录，所有写入只提交一次"""
+        rules = [_add_rule(test_session, test_user) for _ in range(3)]
+        missed = CheckinRecord(rule_id=rules[0].rule_id, user_id=test_user.user_id, status=0,
+                               planned_time=datetime.combine(date.today(), time(9, 0)))
+        test_session.add(missed)
+        test_session.commit()
+        refreshed = []
+        monkeypatch.setattr(DailyCheckinPlanService, 'refresh_user',
+                            lambda user_id, day=None: refreshed.append(user_id))
+
+        commits = []
+        record_statements = []
+
+        def count_commits(session):
+            commits.append(session)
+
+        def count_statements(conn, cursor, statement, parameters, context, executemany):
+            if 'checkin_records' in statement:
+                record_statements.append(statement)
+
+        session = test_session()
+        event.listen(session, 'after_commit', count_commits)
+        event.listen(db.engine, 'before_cursor_execute', count_statements)
+        try:
+            result = CheckinRecordService.perform_batch_checkin(
+                test_user.user_id, rule_ids=[rule.rule_id for rule in rules])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+            event.remove(session, 'after_commit', count_commits)
+
+        assert result['success_count'] == 3
+        assert result['results'][0]['record_id'] == missed.record_id
+        assert test_session.get(CheckinRecord, missed.record_id).status == 1
+        assert len(commits) == 1
+        assert len(record_statements) == 3
+        assert all(s.startswith('INSERT') and 'ON CONFLICT' in s for s in record_statements)
+        assert refreshed == [test_user.user_id]
+
+    def test_concurrent_checkin_fails_only_its_item(self, test_session, test_user, monkeypatch):
+        """权限校验后另一个请求先完成打卡时，该事项报告已打卡，其他事项照常提交"""
+        raced, fresh = _add_rule(test_session, test_user), _add_rule(test_session, test_user)
+        raced_id, user_id = raced.rule_id, test_user.user_id
+        calculate = CheckinRecordService._calculate_planned_time
+
+        def checkin_elsewhere(rule, day):
+            # 模拟并发请求在本批写入前插入了同一天的已打卡记录
+            if rule.rule_id == raced_id:
+                db.session.execute(CheckinRecord.__table__.insert().values(
+                    rule_id=raced_id, user_id=user_id, status=1, checkin_time=datetime.now(),
+                    planned_time=datetime.combine(day, time(9, 0)), planned_date=day))
+            return calculate(rule, day)
+
+        monkeypatch.setattr(CheckinRecordService, '_calculate_planned_time', checkin_elsewhere)
+        result = CheckinRecordService.perform_batch_checkin(user_id, rule_ids=[raced_id, fresh.rule_id])
+
+        assert [(r['success'], r['message']) for r in result['results']] == [
+            (False, '今日该事项已打卡，请勿重复打卡'), (True, '打卡成功')]
+        assert test_session.query(CheckinRecord).filter(CheckinRecord.rule_id == raced_id).count() == 1
+
+    def test_rejects_empty_and_oversized_batches(self, test_session, test_user):
+        """空批次和超过上限的批次直接拒绝"""
+        with pytest.raises(ValueError, match='缺少打卡事项'):
+            CheckinRecordService.perform_batch_checkin(test_user.user_id)
+        with pytest.raises(ValueError, match='单次最多'):
+            CheckinRecordService.perform_batch_checkin(
+                test_user.user_id, rule_ids=list(range(1, CheckinRecordService.BATCH_CHECKIN_MAX_ITEMS + 2)))
+
+    def test_idempotency_key_replays_first_result(self, test_session, test_user):
+        """携带相同 Idempotency-Key 重试时返回首次批量结果，不再报已打卡"""
+        first_rule = _add_rule(test_session, test_user)
+        second_rule = _add_rule(test_session, test_user)
+
+        first = CheckinRecordService.perform_batch_checkin(
+            test_user.user_id, rule_ids=[first_rule.rule_id, second_rule.rule_id], idempotency_key='batch-1')
+        retry = CheckinRecordService.perform_batch_checkin(
+            test_user.user_id, rule_ids=[first_rule.rule_id, second_rule.rule_id], idempotency_key='batch-1')
+
+        assert first['success_count'] == 2
+        assert retry == first
+        assert test_session.query(CheckinRecord).count() == 2
+
+        other = CheckinRecordService.perform_batch_checkin(
+            test_user.user_id, rule_ids=[first_rule.rule_id], idempotency_key='batch-2')
+        assert other['success_count'] == 0
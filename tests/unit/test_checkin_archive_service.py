@@ -0,0 +1,94 @@
+"""
+打卡记录归档测试
+验证超过保留期的记录按批迁移到归档表，历史和统计查询同时读取热表和归档表
+"""
+import os
+import sys
+from datetime import datetime, date, time, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import CheckinRule, CheckinRecord, CheckinRecordArchive
+from wxcloudrun.checkin_archive_service import CheckinArchiveService
+from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.checkin_statistics_service import CheckinStatisticsService
+
+
+@pytest.fixture
+def records(test_session, test_user):
+    """最近10天每天一条已打卡记录"""
+    rule = CheckinRule(user_id=test_user.user_id, rule_type='personal', rule_name='散步', status=1)
+    test_session.add(rule)
+    test_session.flush()
+    today = date.today()
+    for offset in range(10):
+        planned = datetime.combine(today - timedelta(days=offset), time(9, 0))
+        test_session.add(CheckinRecord(rule_id=rule.rule_id, user_id=test_user.user_id, status=1,
+                                       planned_time=planned, checkin_time=planned))
+    test_session.commit()
+    CheckinStatisticsService.clear_cache()
+    yield rule
+    CheckinStatisticsService.clear_cache()
+
+
+class TestCheckinArchiveService:
+
+    def test_moves_old_records_in_batches(self, test_session, test_user, records, monkeypatch):
+        """早于分界的记录按批迁移，保留原 record_id，热表只剩近期记录"""
+        monkeypatch.setenv('CHECKIN_ARCHIVE_DAYS', '3')
+        cutoff = CheckinArchiveService.archive_cutoff()
+        old_ids = sorted(r.record_id for r in test_session.query(CheckinRecord).filter(
+            CheckinRecord.planned_time < cutoff))
+
+        archived = CheckinArchiveService.archive_records(batch_size=2)
+
+        assert archived == 6
+        assert sorted(r.record_id for r in test_session.query(CheckinRecordArchive)) == old_ids
+        assert test_session.query(CheckinRecord).count() == 4
+        assert CheckinArchiveService.archive_records() == 0
+
+    def test_disabled_when_retention_is_zero(self, test_session, records, monkeypatch):
+        """保留天数为0时不归档"""
+        monkeypatch.setenv('CHECKIN_ARCHIVE_DAYS', '0')
+        assert CheckinArchiveService.archive_records() == 0
+        assert test_session.query(CheckinRecord).count() == 10
+
+    def test_history_and_statistics_read_both_tiers(self, test_session, test_user, records, monkeypatch):
+        """归档后历史分页和统计结果不变"""
+        today = date.today()
+        start = today - timedelta(days=9)
+        before_history = CheckinRecordService.get_checkin_history(test_user.user_id, start, today, limit=100)
+        before_stats = CheckinStatisticsService.get_statistics(
+            test_user.user_id, start_date=start.isoformat(), end_date=today.isoformat())
+
+        monkeypatch.setenv('CHECKIN_ARCHIVE_DAYS', '3')
+        CheckinArchiveService.archive_records()
+        CheckinStatisticsService.clear_cache()
+
+        seen = []
+        cursor = None
+        while True:
+            page = CheckinRecordService.get_checkin_history(test_user.user_id, start, today, cursor=cursor, limit=4)
+            seen.extend(page['history'])
+            if not page['has_more']:
+                break
+            cursor = page['next_cursor']
+        stats = CheckinStatisticsService.get_statistics(
+            test_user.user_id, start_date=start.isoformat(), end_date=today.isoformat())
+
+        assert seen == before_history['history']
+        assert seen[-1]['rule_name'] == '散步'
+        assert stats == before_stats
+        assert stats['longest_streak'] == 10
+
+    def test_recent_window_reads_hot_table_only(self, monkeypatch):
+        """区间不早于归档分界时只读热表"""
+        monkeypatch.setenv('CHECKIN_ARCHIVE_DAYS', '30')
+        recent = datetime.combine(date.today() - timedelta(days=7), time.min)
+        old = datetime.combine(date.today() - timedelta(days=60), time.min)
+
+        assert CheckinArchiveService.record_source(start_time=recent) is CheckinRecord
+        assert CheckinArchiveService.record_source(start_time=old) is not CheckinRecord
+        assert CheckinArchiveService.record_source() is not CheckinRecord
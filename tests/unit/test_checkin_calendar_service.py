@@ -0,0 +1,139 @@
+"""
+打卡月历测试
+验证每条规则的应打卡/已打卡/miss/待打卡日期掩码由一条查询得到
+"""
+import os
+import sys
+from datetime import datetime, date, time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import (
+    CheckinRule, CheckinRecord, CommunityCheckinRule, UserCommunityRule
+)
+from wxcloudrun.checkin_calendar_service import CheckinCalendarService
+
+# 2025-03 有31天，3月1日为周六，月中“今天”为3月15日
+TODAY = date(2025, 3, 15)
+CREATED = datetime(2025, 2, 1)
+
+
+def _bits(*days):
+    return sum(1 << (day - 1) for day in days)
+
+
+def _add_rule(session, user, name, created_at=CREATED, **kwargs):
+    rule = CheckinRule(user_id=user.user_id, rule_type='personal', rule_name=name,
+                       status=kwargs.pop('status', 1), created_at=created_at, **kwargs)
+    session.add(rule)
+    session.flush()
+    return rule
+
+
+def _add_record(session, user, day, status, rule=None, community_rule=None):
+    planned = datetime.combine(date(2025, 3, day), time(9, 0))
+    session.add(CheckinRecord(
+        rule_id=rule.rule_id if rule else None,
+        community_rule_id=community_rule.community_rule_id if community_rule else None,
+        solo_user_id=user.user_id if community_rule else None,
+        user_id=user.user_id, planned_time=planned, status=status,
+        checkin_time=planned if status == 1 else None))
+
+
+class TestCheckinCalendarService:
+
+    def test_month_masks_in_one_query(self, test_session, test_user, test_community, count_statements):
+        """每日状态按位折叠，应打卡日来自规则排期，整张月历一条查询"""
+        daily = _add_rule(test_session, test_user, '吃药')
+        mondays = _add_rule(test_session, test_user, '量血压', frequency_type=1, week_days=1)
+        deleted = _add_rule(test_session, test_user, '已删除', status=2)
+        paused = _add_rule(test_session, test_user, '已停用', status=0)
+        late = _add_rule(test_session, test_user, '新规则', created_at=datetime(2025, 3, 20, 10, 0))
+        test_user.community_id = test_community.community_id
+        community_rule = CommunityCheckinRule(community_id=test_community.community_id, rule_name='社区签到',
+                                              frequency_type=2, status=1, created_by=test_user.user_id,
+                                              created_at=CREATED)
+        test_session.add(community_rule)
+        test_session.flush()
+        test_session.add(UserCommunityRule(user_id=test_user.user_id, created_at=CREATED,
+                                           community_rule_id=community_rule.community_rule_id, is_active=True))
+
+        _add_record(test_session, test_user, 1, 1, rule=daily)
+        _add_record(test_session, test_user, 2, 0, rule=daily)
+        _add_record(test_session, test_user, 3, 1, rule=daily)
+        _add_record(test_session, test_user, 5, 2, rule=daily)  # 已撤销，不计入
+        _add_record(test_session, test_user, 4, 1, rule=deleted)
+        _add_record(test_session, test_user, 6, 0, rule=paused)
+        _add_record(test_session, test_user, 10, 1, community_rule=community_rule)
+        # 其他月份的记录不计入
+        test_session.add(CheckinRecord(rule_id=daily.rule_id, user_id=test_user.user_id, status=1,
+                                       planned_time=datetime(2025, 4, 1, 9, 0)))
+        test_session.commit()
+        user_id = test_user.user_id
+
+        with count_statements() as statements:
+            result = CheckinCalendarService.get_month_calendar(user_id, '2025-03', today=TODAY)
+
+        assert len(statements) == 1
+        assert (result['month'], result['days']) == ('2025-03', 31)
+        by_name = {rule['rule_name']: rule for rule in result['rules']}
+        assert list(by_name) == ['吃药', '量血压', '已删除', '已停用', '新规则', '社区签到']
+
+        assert by_name['吃药']['due_mask'] == (1 << 31) - 1
+        assert by_name['吃药']['checked_mask'] == _bits(1, 3)
+        assert by_name['吃药']['missed_mask'] == _bits(2)
+        assert by_name['吃药']['pending_mask'] == _bits(*range(15, 32))
+
+        assert by_name['量血压']['due_mask'] == _bits(3, 10, 17, 24, 31)
+        assert by_name['量血压']['pending_mask'] == _bits(17, 24, 31)
+
+        # 已删除的规则只保留有记录的日期
+        assert by_name['已删除']['due_mask'] == by_name['已删除']['checked_mask'] == _bits(4)
+        assert by_name['已删除']['pending_mask'] == 0
+        # 已停用的规则同样不再有待打卡日
+        assert by_name['已停用']['due_mask'] == by_name['已停用']['missed_mask'] == _bits(6)
+        assert by_name['已停用']['pending_mask'] == 0
+
+        # 创建之前的日期不需要打卡
+        assert by_name['新规则']['due_mask'] == _bits(*range(20, 32))
+
+        community = by_name['社区签到']
+        assert community['rule_source'] == 'community'
+        assert community['due_mask'] == _bits(3, 4, 5, 6, 7, 10, 11, 12, 13, 14, 17, 18, 19, 20, 21,
+                                              24, 25, 26, 27, 28, 31)
+        assert community['checked_mask'] == _bits(10)
+
+    def test_community_rule_due_from_assignment(self, test_session, test_user, test_community):
+        """社区规则从分配给用户的那天起才需要打卡，与规则本身的创建时间无关"""
+        test_user.community_id = test_community.community_id
+        community_rule = CommunityCheckinRule(community_id=test_community.community_id, rule_name='社区签到',
+                                              status=1, created_by=test_user.user_id, created_at=CREATED)
+        test_session.add(community_rule)
+        test_session.flush()
+        test_session.add(UserCommunityRule(user_id=test_user.user_id, created_at=datetime(2025, 3, 12, 8, 0),
+                                           community_rule_id=community_rule.community_rule_id, is_active=True))
+        test_session.commit()
+
+        result = CheckinCalendarService.get_month_calendar(test_user.user_id, '2025-03', today=TODAY)
+
+        assert result['rules'][0]['due_mask'] == _bits(*range(12, 32))
+        assert result['rules'][0]['pending_mask'] == _bits(*range(15, 32))
+
+    def test_past_and_future_months(self, test_session, test_user):
+        """过去的月份没有待打卡日，未来的月份全部待打卡"""
+        _add_rule(test_session, test_user, '吃药')
+        test_session.commit()
+
+        past = CheckinCalendarService.get_month_calendar(test_user.user_id, '2025-02', today=TODAY)
+        future = CheckinCalendarService.get_month_calendar(test_user.user_id, '2025-04', today=TODAY)
+
+        assert past['days'] == 28
+        assert past['rules'][0]['pending_mask'] == 0
+        assert future['rules'][0]['pending_mask'] == future['rules'][0]['due_mask'] == (1 << 30) - 1
+
+    def test_invalid_month(self, test_user):
+        """月份格式错误时抛出 ValueError"""
+        with pytest.raises(ValueError, match='无效的月份格式'):
+            CheckinCalendarService.get_month_calendar(test_user.user_id, '2025/03')
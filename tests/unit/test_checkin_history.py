@@ -0,0 +1,108 @@
+"""
+打卡历史测试
+验证 (planned_time, record_id) 游标分页、规则信息关联以及流式输出
+"""
+import json
+import os
+import sys
+from datetime import datetime, date, time, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import CheckinRule, CheckinRecord, CommunityCheckinRule
+from wxcloudrun.checkin_record_service import CheckinRecordService
+from app.shared.response import make_succ_stream_response
+
+START = date(2025, 1, 1)
+
+
+def _add_records(session, user, rule, days):
+    for offset in range(days):
+        planned = datetime.combine(START + timedelta(days=offset), time(9, 0))
+        session.add(CheckinRecord(rule_id=rule.rule_id, user_id=user.user_id,
+                                  planned_time=planned, checkin_time=planned, status=1))
+    session.commit()
+
+
+@pytest.fixture
+def history_rule(test_session, test_user):
+    rule = CheckinRule(user_id=test_user.user_id, rule_type='personal', rule_name='吃药',
+                       icon_url='pill.png', status=1)
+    test_session.add(rule)
+    test_session.commit()
+    return rule
+
+
+class TestCheckinHistory:
+
+    def test_pages_by_cursor_without_gaps(self, test_session, test_user, history_rule):
+        """相同计划时间的记录按 record_id 区分，翻页不重不漏"""
+        # 两条规则每天计划时间相同
+        second_rule = CheckinRule(user_id=test_user.user_id, rule_type='personal', rule_name='喝水', status=1)
+        test_session.add(second_rule)
+        test_session.commit()
+        _add_records(test_session, test_user, history_rule, days=4)
+        _add_records(test_session, test_user, second_rule, days=4)
+        end = START + timedelta(days=3)
+
+        seen = []
+        cursor = None
+        while True:
+            page = CheckinRecordService.get_checkin_history(
+                test_user.user_id, START, end, cursor=cursor, limit=3)
+            seen.extend(item['record_id'] for item in page['history'])
+            if not page['has_more']:
+                assert page['next_cursor'] is None
+                break
+            cursor = page['next_cursor']
+
+        expected = [r.record_id for r in test_session.query(CheckinRecord).order_by(
+            CheckinRecord.planned_time.desc(), CheckinRecord.record_id.desc())]
+        assert seen == expected
+        assert len(seen) == 8
+
+    def test_includes_end_date_and_joins_rule_info(self, test_session, test_user, test_community,
+                                                   history_rule):
+        """结束日期当天的记录包含在内，个人规则和社区规则名称、图标来自关联查询"""
+        _add_records(test_session, test_user, history_rule, days=2)
+        community_rule = CommunityCheckinRule(community_id=test_community.community_id, rule_name='社区打卡',
+                                              icon_url='community.png', status=1, created_by=test_user.user_id)
+        test_session.add(community_rule)
+        test_session.flush()
+        test_session.add(CheckinRecord(community_rule_id=community_rule.community_rule_id,
+                                       solo_user_id=test_user.user_id, user_id=test_user.user_id,
+                                       planned_time=datetime.combine(START + timedelta(days=1), time(20, 0)),
+                                       status=0))
+        test_session.commit()
+
+        page = CheckinRecordService.get_checkin_history(
+            test_user.user_id, START, START + timedelta(days=1))
+
+        assert len(page['history']) == 3
+        latest = page['history'][0]
+        assert (latest['rule_source'], latest['rule_name'], latest['icon_url'], latest['status']) == (
+            'community', '社区打卡', 'community.png', 'unchecked')
+        assert page['history'][1]['rule_name'] == '吃药'
+        assert page['history'][1]['status'] == 'checked'
+
+    def test_rejects_invalid_cursor(self, test_session, test_user):
+        """无效游标返回明确错误"""
+        with pytest.raises(ValueError, match='无效的分页游标'):
+            CheckinRecordService.get_checkin_history(test_user.user_id, None, None, cursor='not-a-cursor')
+
+    def test_stream_reads_in_batches(self, test_app, test_session, test_user, history_rule):
+        """流式输出按批读取，生成完整的JSON数组"""
+        _add_records(test_session, test_user, history_rule, days=7)
+
+        items = CheckinRecordService.iter_checkin_history(test_user.user_id, None, None, batch_size=3)
+        with test_app.test_request_context():
+            response = make_succ_stream_response({'start_date': None, 'end_date': None}, 'history', items)
+            body = json.loads(response.get_data())
+
+        assert body['code'] == 1
+        history = body['data']['history']
+        assert len(history) == 7
+        assert history[0]['planned_time'] == '2025-01-07 09:00:00'
+        assert history[-1]['planned_time'] == '2025-01-01 09:00:00'
@@ -0,0 +1,92 @@
+"""
+打卡记录索引测试
+验证按日期查询记录时使用半开区间，SQLite 查询计划命中 checkin_records 的复合索引
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import db, CheckinRecord
+from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.checkin_rule_service import CheckinRuleService
+from wxcloudrun.community_service import CommunityService
+from wxcloudrun.utils.timeutil import day_range
+
+
+@contextmanager
+def _capture_record_queries():
+    """捕获执行过的 checkin_records 查询语句及参数"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM checkin_records' in statement:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _query_plan(statement, parameters):
+    """返回 EXPLAIN QUERY PLAN 的明细文本"""
+    connection = db.session.connection().connection.driver_connection
+    rows = connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return ' | '.join(row[-1] for row in rows)
+
+
+class TestCheckinRecordIndexes:
+
+    def test_day_range_is_half_open(self):
+        """日期区间为 [当天0点, 次日0点)"""
+        start, end = day_range(date(2025, 1, 31))
+        assert start.isoformat() == '2025-01-31T00:00:00'
+        assert end.isoformat() == '2025-02-01T00:00:00'
+
+    def test_composite_indexes_exist(self, test_session):
+        """checkin_records 上创建了四个复合索引"""
+        index_columns = {
+            index.name: [column.name for column in index.columns]
+            for index in CheckinRecord.__table__.indexes
+        }
+        assert index_columns['idx_checkin_records_rule_planned'] == ['rule_id', 'planned_time']
+        assert index_columns['idx_checkin_records_community_rule_planned'] == ['community_rule_id', 'planned_time']
+        assert index_columns['idx_checkin_records_user_planned'] == ['user_id', 'planned_time']
+        assert index_columns['idx_checkin_records_solo_user_planned'] == ['solo_user_id', 'planned_time']
+
+    def test_record_lookup_by_rule_uses_index(self, test_session):
+        """按规则和日期查询记录使用 (rule_id, planned_time) / (community_rule_id, planned_time) 索引"""
+        with _capture_record_queries() as statements:
+            CheckinRecordService._query_records_by_rule_and_date(1, date.today())
+            CheckinRecordService._query_records_by_rule_and_date(1, date.today(), rule_source='community')
+
+        personal_plan = _query_plan(*statements[0])
+        community_plan = _query_plan(*statements[1])
+        assert 'idx_checkin_records_rule_planned (rule_id=? AND planned_time>? AND planned_time<?)' in personal_plan
+        assert 'idx_checkin_records_community_rule_planned (community_rule_id=? AND planned_time>? AND planned_time<?)' in community_plan
+
+    def test_today_records_lookup_uses_index(self, test_session):
+        """今日打卡记录查询使用复合索引"""
+        with _capture_record_queries() as statements:
+            CheckinRuleService._query_today_records(1, date.today())
+            CheckinRuleService._query_today_records(1, date.today(), rule_source='community')
+
+        assert 'USING INDEX idx_checkin_records_rule_planned' in _query_plan(*statements[0])
+        assert 'USING INDEX idx_checkin_records_community_rule_planned' in _query_plan(*statements[1])
+
+    def test_community_member_records_use_user_index(self, test_session, test_user, test_community):
+        """社区成员今日未打卡记录查询使用 (user_id, planned_time) 索引"""
+        test_user.community_id = test_community.community_id
+        test_session.commit()
+
+        with _capture_record_queries() as statements:
+            CommunityService.get_community_members(test_community.community_id)
+
+        assert statements
+        assert 'USING INDEX idx_checkin_records_user_planned' in _query_plan(*statements[0])
@@ -139,8 +139,8 @@ class TestDeleteRuleCoreLogic:
             record = CheckinRecord(
                 rule_id=rule.rule_id,
                 user_id=test_user.user_id,
-                planned_time=datetime.now(),
-                checkin_time=datetime.now(),
+                planned_time=datetime.now() - timedelta(days=i),
+                checkin_time=datetime.now() - timedelta(days=i),
                 checkin_type=f"测试打卡{i+1}"
             )
             test_session.add(record)
@@ -0,0 +1,157 @@
+"""
+打卡统计服务测试
+验证完成率、连续打卡天数、miss次数在数据库端计算，并按用户缓存到下一次打卡
+"""
+import os
+import sys
+from datetime import datetime, date, time, timedelta
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import db, CheckinRule, CheckinRecord
+from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.checkin_statistics_service import CheckinStatisticsService
+from wxcloudrun.user_checkin_rule_service import UserCheckinRuleService
+
+
+def _add_rule(session, user, name):
+    rule = CheckinRule(user_id=user.user_id, rule_type='personal', rule_name=name, status=1, time_slot_type=1)
+    session.add(rule)
+    session.commit()
+    return rule
+
+
+def _add_record(session, user, rule, day, status):
+    planned = datetime.combine(day, time(9, 0))
+    session.add(CheckinRecord(rule_id=rule.rule_id, user_id=user.user_id, planned_time=planned,
+                              checkin_time=planned if status == 1 else None, status=status))
+
+
+class TestCheckinStatisticsService:
+
+    def test_rates_streaks_and_missed_counts(self, test_session, test_user):
+        """按规则和总体计算完成率、当前/最长连续天数和miss次数，撤销记录不计入"""
+        end = date(2025, 3, 10)
+        start = end - timedelta(days=6)
+        reading = _add_rule(test_session, test_user, '阅读')
+        walking = _add_rule(test_session, test_user, '散步')
+        # 阅读: 3/4 ~ 3/6 完成，3/7 miss，3/8 ~ 3/10 完成 -> 最长3，当前3
+        for offset in range(7):
+            day = start + timedelta(days=offset)
+            _add_record(test_session, test_user, reading, day, 0 if offset == 3 else 1)
+        # 散步: 3/9 miss，3/10 完成；跑步: 3/10 只有一条撤销记录
+        _add_record(test_session, test_user, walking, end - timedelta(days=1), 0)
+        _add_record(test_session, test_user, walking, end, 1)
+        _add_record(test_session, test_user, _add_rule(test_session, test_user, '跑步'), end, 2)
+        test_session.commit()
+
+        stats = CheckinStatisticsService.get_statistics(
+            test_user.user_id, start_date=start.isoformat(), end_date=end.isoformat())
+
+        assert (stats['total_days'], stats['checkin_days']) == (7, 6)
+        assert (stats['completed_checkins'], stats['missed_checkins']) == (7, 2)
+        assert stats['checkin_rate'] == 77.8
+        # 全部完成的日期: 3/4 ~ 3/6、3/8、3/10
+        assert (stats['current_streak'], stats['longest_streak']) == (1, 3)
+
+        by_name = {rule['rule_name']: rule for rule in stats['rules']}
+        assert by_name['阅读']['completion_rate'] == 85.7
+        assert (by_name['阅读']['current_streak'], by_name['阅读']['longest_streak']) == (3, 3)
+        assert by_name['阅读']['missed_checkins'] == 1
+        assert by_name['阅读']['scheduled_days'] == 7
+        assert (by_name['散步']['total_checkins'], by_name['散步']['current_streak']) == (2, 1)
+
+        daily = {day['date']: day for day in stats['daily_stats']}
+        assert daily['2025-03-07'] == {'date': '2025-03-07', 'total_rules': 1, 'completed_rules': 0,
+                                       'missed_rules': 1, 'checkin_rate': 0.0}
+        assert daily['2025-03-10']['total_rules'] == 2
+
+    def test_current_streak_counts_until_yesterday(self, test_session, test_user):
+        """统计截止今天时，今天还没打卡不打断连续天数"""
+        rule = _add_rule(test_session, test_user, '喝水')
+        today = date.today()
+        for offset in range(1, 4):
+            _add_record(test_session, test_user, rule, today - timedelta(days=offset), 1)
+        _add_record(test_session, test_user, rule, today, 0)
+        test_session.commit()
+
+        stats = CheckinStatisticsService.get_statistics(test_user.user_id, period='week')
+
+        assert stats['period'] == 'week'
+        assert stats['end_date'] == today.isoformat()
+        assert stats['rules'][0]['current_streak'] == 3
+        assert stats['current_streak'] == 3
+
+    def test_streaks_follow_due_days(self, test_session, test_user):
+        """每周规则只在应打卡日计算连续天数，非应打卡日不打断连续，应打卡日没有记录视为中断"""
+        start, end = date(2025, 3, 3), date(2025, 3, 16)
+        steady, skipped = [
+            CheckinRule(user_id=test_user.user_id, rule_type='personal', rule_name=name, status=1,
+                        time_slot_type=1, frequency_type=1, week_days=0b10101)
+            for name in ('周一三五', '漏打一次')
+        ]
+        test_session.add_all([steady, skipped])
+        test_session.commit()
+        # 应打卡日: 3/3、3/5、3/7、3/10、3/12、3/14；漏打一次的规则 3/12 没有记录
+        for day in (3, 5, 7, 10, 12, 14):
+            _add_record(test_session, test_user, steady, date(2025, 3, day), 1)
+            if day != 12:
+                _add_record(test_session, test_user, skipped, date(2025, 3, day), 1)
+        test_session.commit()
+
+        stats = CheckinStatisticsService.get_statistics(
+            test_user.user_id, start_date=start.isoformat(), end_date=end.isoformat())
+
+        by_name = {rule['rule_name']: rule for rule in stats['rules']}
+        assert (by_name['周一三五']['current_streak'], by_name['周一三五']['longest_streak']) == (6, 6)
+        assert by_name['周一三五']['scheduled_days'] == 6
+        assert (by_name['漏打一次']['current_streak'], by_name['漏打一次']['longest_streak']) == (1, 4)
+        assert (stats['current_streak'], stats['longest_streak']) == (1, 4)
+
+    def test_cached_until_next_checkin(self, test_session, test_user):
+        """统计结果缓存，打卡后失效重新计算"""
+        rule = _add_rule(test_session, test_user, '早起')
+        statements = []
+
+        def count_statements(conn, cursor, statement, parameters, context, executemany):
+            if 'FROM checkin_records' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statements)
+        try:
+            first = UserCheckinRuleService.get_user_checkin_statistics(test_user.user_id)
+            queries = len(statements)
+            second = UserCheckinRuleService.get_user_checkin_statistics(test_user.user_id)
+            assert len(statements) == queries
+            assert first == second
+            assert first['completed_checkins'] == 0
+
+            CheckinRecordService.perform_checkin(rule.rule_id, test_user.user_id)
+            third = UserCheckinRuleService.get_user_checkin_statistics(test_user.user_id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+
+        assert third['completed_checkins'] == 1
+        assert third['current_streak'] == 1
+
+    def test_rejects_invalid_window(self, test_session, test_user):
+        """无效周期和颠倒的日期区间直接拒绝"""
+        with pytest.raises(ValueError, match='无效的统计周期'):
+            CheckinStatisticsService.get_statistics(test_user.user_id, period='year')
+        with pytest.raises(ValueError, match='开始日期不能晚于结束日期'):
+            CheckinStatisticsService.get_statistics(
+                test_user.user_id, start_date='2025-03-10', end_date='2025-03-01')
+
+    def test_rule_statistics_counts_in_database(self, test_session, test_user):
+        """规则统计的今日事项数取自每日打卡计划"""
+        _add_rule(test_session, test_user, '阅读')
+        _add_rule(test_session, test_user, '散步')
+
+        statistics = UserCheckinRuleService.get_user_rules_statistics(test_user.user_id)
+
+        assert statistics['personal_rule_count'] == 2
+        assert statistics['community_rule_count'] == 0
+        assert statistics['today_checkin_count'] == 2
@@ -0,0 +1,166 @@
+"""
+打卡写入幂等测试
+验证每个用户每条规则每天只有一条记录，打卡由一条 INSERT ... ON CONFLICT 语句完成，
+相同 Idempotency-Key 的重试直接返回首次结果，旧数据补齐计划日期并清理同一天的重复记录
+"""
+import os
+import sys
+from datetime import datetime, date, time, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import (
+    CheckinIdempotencyKey, CheckinRule, CheckinRecord, CheckinRecordArchive, CommunityCheckinRule
+)
+from wxcloudrun.checkin_record_service import CheckinRecordService
+
+
+@pytest.fixture
+def rule(test_session, test_user):
+    rule = CheckinRule(user_id=test_user.user_id, rule_type='personal', rule_name='吃药',
+                       time_slot_type=1, status=1)
+    test_session.add(rule)
+    test_session.commit()
+    return rule
+
+
+def _today_records(session, rule):
+    return session.query(CheckinRecord).filter(CheckinRecord.rule_id == rule.rule_id).all()
+
+
+class TestCheckinUpsert:
+
+    def test_second_checkin_is_rejected_without_new_row(self, test_session, test_user, rule, count_statements):
+        """同一天重复打卡被拒绝，且只有一条记录"""
+        user_id, rule_id = test_user.user_id, rule.rule_id
+        with count_statements() as statements:
+            first = CheckinRecordService.perform_checkin(rule_id, user_id)
+        writes = [s for s in statements if s.lstrip().upper().startswith(('INSERT', 'UPDATE'))
+                  and 'checkin_records' in s]
+        assert len(writes) == 1
+        assert 'ON CONFLICT' in writes[0]
+
+        with pytest.raises(ValueError, match='今日该事项已打卡'):
+            CheckinRecordService.perform_checkin(rule_id, user_id)
+
+        records = _today_records(test_session, rule)
+        assert [r.record_id for r in records] == [first['record_id']]
+        assert records[0].planned_date == date.today()
+        assert records[0].planned_time == datetime.combine(date.today(), time(9, 0))
+
+    def test_missed_and_cancelled_rows_are_reused(self, test_session, test_user, rule):
+        """miss记录和撤销后的记录在打卡时原地更新"""
+        user_id, rule_id = test_user.user_id, rule.rule_id
+        missed = CheckinRecordService.mark_missed(rule_id, user_id)
+        checked = CheckinRecordService.perform_checkin(rule_id, user_id)
+        assert checked['record_id'] == missed['record_id']
+
+        CheckinRecordService.cancel_checkin(checked['record_id'], user_id)
+        again = CheckinRecordService.perform_checkin(rule_id, user_id)
+        assert again['record_id'] == checked['record_id']
+
+        with pytest.raises(ValueError, match='无需标记miss'):
+            CheckinRecordService.mark_missed(rule_id, user_id)
+
+        test_session.expire_all()
+        records = _today_records(test_session, rule)
+        assert [(r.record_id, r.status) for r in records] == [(again['record_id'], 1)]
+        assert records[0].checkin_time is not None
+
+    def test_community_checkin_sets_owner(self, test_session, test_user, test_community):
+        """社区规则记录带上 user_id，并按社区规则唯一"""
+        community_rule = CommunityCheckinRule(community_id=test_community.community_id, rule_name='社区签到',
+                                              time_slot_type=2, status=1, created_by=test_user.user_id)
+        test_session.add(community_rule)
+        test_session.commit()
+        user_id, community_rule_id = test_user.user_id, community_rule.community_rule_id
+        planned_time = datetime.combine(date.today(), time(14, 0))
+
+        first = CheckinRecordService._upsert_daily_record(
+            community_rule_id, user_id, 'community', planned_time, datetime.now(), 1)
+        second = CheckinRecordService._upsert_daily_record(
+            community_rule_id, user_id, 'community', planned_time, datetime.now(), 1)
+
+        assert first is not None and second is None
+        record = test_session.get(CheckinRecord, first)
+        assert (record.user_id, record.solo_user_id, record.rule_id) == (user_id, user_id, None)
+
+    def test_idempotency_key_replays_first_result(self, test_session, test_user, rule, count_statements):
+        """相同幂等键的重试只读取一次幂等键表（不依赖进程内状态），返回首次结果"""
+        user_id, rule_id = test_user.user_id, rule.rule_id
+        first = CheckinRecordService.perform_checkin(rule_id, user_id, idempotency_key='req-1')
+
+        with count_statements() as statements:
+            retry = CheckinRecordService.perform_checkin(rule_id, user_id, idempotency_key='req-1')
+
+        assert len(statements) == 1 and 'checkin_idempotency_keys' in statements[0]
+        assert retry == first
+        with pytest.raises(ValueError, match='今日该事项已打卡'):
+            CheckinRecordService.perform_checkin(rule_id, user_id, idempotency_key='req-2')
+
+    def test_idempotency_keys_expire(self, test_session, test_user, rule):
+        """过期的幂等键不再返回首次结果，由后台任务清理"""
+        user_id, rule_id = test_user.user_id, rule.rule_id
+        first = CheckinRecordService.perform_checkin(rule_id, user_id, idempotency_key='req-1')
+        stored = test_session.get(CheckinIdempotencyKey, (user_id, 'req-1'))
+        assert stored.expires_at > datetime.now()
+
+        later = stored.expires_at + timedelta(seconds=1)
+        assert CheckinRecordService._load_idempotent_result(user_id, 'req-1') == first
+        assert CheckinRecordService._load_idempotent_result(user_id, 'req-1', now=later) is None
+        assert CheckinRecordService.purge_idempotency_keys(now=later) == 1
+        assert test_session.query(CheckinIdempotencyKey).count() == 0
+
+    def test_unique_constraint_rejects_raw_duplicate(self, test_session, test_user, rule):
+        """绕过服务直接插入同一天的第二条记录会违反唯一约束"""
+        planned_time = datetime.combine(date.today(), time(9, 0))
+        test_session.add(CheckinRecord(rule_id=rule.rule_id, user_id=test_user.user_id,
+                                       planned_time=planned_time, status=0))
+        test_session.commit()
+
+        test_session.add(CheckinRecord(rule_id=rule.rule_id, user_id=test_user.user_id,
+                                       planned_time=planned_time.replace(hour=20), status=1))
+        with pytest.raises(IntegrityError):
+            test_session.commit()
+        test_session.rollback()
+
+    def test_migrate_daily_unique_archives_legacy_duplicates(self, test_session, test_user, rule):
+        """旧数据没有计划日期时同一天的重复记录移入归档表（保留已打卡的记录）并回填，归档表只回填不删除"""
+        morning = datetime.combine(date.today(), time(9, 0))
+        yesterday = datetime.combine(date.today() - timedelta(days=1), time(9, 0))
+        rows = [CheckinRecord(rule_id=rule.rule_id, user_id=test_user.user_id, planned_time=morning, status=0),
+                CheckinRecord(rule_id=rule.rule_id, user_id=test_user.user_id, planned_time=yesterday, status=1)]
+        test_session.add_all(rows)
+        test_session.add(CheckinRecordArchive(record_id=1000, rule_id=rule.rule_id, user_id=test_user.user_id,
+                                              planned_time=yesterday, status=2))
+        test_session.commit()
+        pending_id = rows[0].record_id
+        # 模拟迁移前的数据：planned_date 为空时唯一约束不生效，同一天可以有多条记录
+        test_session.execute(text('UPDATE checkin_records SET planned_date = NULL'))
+        test_session.execute(text('UPDATE checkin_records_archive SET planned_date = NULL'))
+        for status in (1, 2):
+            test_session.execute(text(
+                'INSERT INTO checkin_records (user_id, rule_id, planned_time, status) VALUES (:u, :r, :t, :s)'
+            ), {'u': test_user.user_id, 'r': rule.rule_id, 't': morning.replace(hour=20), 's': status})
+        test_session.execute(text(
+            'INSERT INTO checkin_records_archive (record_id, user_id, rule_id, planned_time, status) '
+            'VALUES (1001, :u, :r, :t, 1)'
+        ), {'u': test_user.user_id, 'r': rule.rule_id, 't': yesterday})
+        test_session.commit()
+
+        assert CheckinRecordService.migrate_daily_unique() == {'removed': 2, 'backfilled': 6}
+        test_session.expire_all()
+        records = test_session.query(CheckinRecord).order_by(CheckinRecord.planned_time).all()
+        assert [(r.planned_date, r.status) for r in records] == [(yesterday.date(), 1), (date.today(), 1)]
+        archived = test_session.query(CheckinRecordArchive).order_by(CheckinRecordArchive.record_id).all()
+        assert [(r.planned_date, r.status) for r in archived] == [
+            (date.today(), 0), (date.today(), 2), (yesterday.date(), 2), (yesterday.date(), 1)]
+        assert archived[0].record_id == pending_id
+
+        assert CheckinRecordService.migrate_daily_unique() == {'removed': 0, 'backfilled': 0}
+        with pytest.raises(ValueError, match='今日该事项已打卡'):
+            CheckinRecordService.perform_checkin(rule.rule_id, test_user.user_id)
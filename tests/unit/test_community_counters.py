@@ -0,0 +1,82 @@
+"""
+社区人数计数测试
+验证成员加入/移出、工作人员增删和社区切换时计数表在同一事务内更新，以及定期校正修复偏差
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import db, CommunityCounter, User
+from wxcloudrun.community_counter_service import CommunityCounterService
+from wxcloudrun.community_service import CommunityService
+from wxcloudrun.community_staff_service import CommunityStaffService
+
+
+def _add_users(session, count, prefix):
+    users = [User(nickname=f'{prefix}{i}', role=1, status=1) for i in range(count)]
+    session.add_all(users)
+    session.commit()
+    return [user.user_id for user in users]
+
+
+def _stored(community_id):
+    counter = db.session.get(CommunityCounter, community_id)
+    db.session.refresh(counter)
+    return (counter.manager_count, counter.staff_count, counter.member_count, counter.resident_count)
+
+
+def _assert_matches_live(*community_ids):
+    live = CommunityCounterService.compute(community_ids)
+    for community_id in community_ids:
+        assert CommunityCounterService.get_counts([community_id])[community_id] == live[community_id]
+
+
+class TestCommunityCounters:
+
+    def test_counts_follow_membership_and_staff_changes(self, test_session, test_superuser):
+        """加入、任职、移除和切换社区后计数与实时统计一致"""
+        first = CommunityService.create_community('计数社区一', '', test_superuser.user_id)
+        second = CommunityService.create_community('计数社区二', '', test_superuser.user_id)
+        first_id, second_id = first.community_id, second.community_id
+        assert _stored(first_id) == (0, 0, 0, 0)
+
+        user_ids = _add_users(test_session, 4, '居民')
+        CommunityService.add_users_to_community(first_id, user_ids)
+        assert _stored(first_id) == (0, 0, 4, 4)
+
+        # 归属本社区的用户任职后不再计为普通成员，外社区用户任职只增加工作人员数
+        outsider = _add_users(test_session, 1, '外部')[0]
+        CommunityStaffService.add_staff(test_superuser.user_id, first_id, [user_ids[0], outsider], role='staff')
+        CommunityService.add_community_staff(first_id, [user_ids[1]], role='manager')
+        assert _stored(first_id) == (1, 2, 2, 4)
+
+        CommunityStaffService.remove_staff(first_id, user_ids[0])
+        assert _stored(first_id) == (1, 1, 3, 4)
+
+        CommunityService.remove_user_from_community(first_id, user_ids[2])
+        assert _stored(first_id) == (1, 1, 2, 3)
+
+        # 主管切换社区：原社区的任职关系一并移除
+        CommunityStaffService.handle_user_community_change(user_ids[1], first_id, second_id)
+        assert _stored(first_id) == (0, 1, 2, 2)
+        assert _stored(second_id) == (0, 0, 1, 1)
+        _assert_matches_live(first_id, second_id)
+
+    def test_reconcile_repairs_drift(self, test_session, test_superuser):
+        """校正任务修正偏差、补齐缺失的计数行，没有偏差时不做修改"""
+        drifted = CommunityService.create_community('偏差社区', '', test_superuser.user_id)
+        missing = CommunityService.create_community('缺失社区', '', test_superuser.user_id)
+        CommunityService.add_users_to_community(drifted.community_id, _add_users(test_session, 3, '甲'))
+        CommunityService.add_users_to_community(missing.community_id, _add_users(test_session, 2, '乙'))
+        drifted_id, missing_id = drifted.community_id, missing.community_id
+        CommunityCounterService.reconcile()
+
+        test_session.get(CommunityCounter, drifted_id).member_count = 10
+        test_session.delete(test_session.get(CommunityCounter, missing_id))
+        test_session.commit()
+
+        assert CommunityCounterService.reconcile() == 2
+        assert _stored(drifted_id) == (0, 0, 3, 3)
+        assert _stored(missing_id) == (0, 0, 2, 2)
+        assert CommunityCounterService.reconcile() == 0
@@ -0,0 +1,89 @@
+"""
+社区列表批量统计测试
+验证整页社区的主管/专员/成员数量由一次计数表查询得到，创建者和主管由一次 IN 查询加载
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import Community, CommunityStaff, User
+from wxcloudrun.community_counter_service import CommunityCounterService
+from wxcloudrun.community_service import CommunityService
+from app.modules.community.routes import _format_communities_info, _format_community_info
+
+
+def _add_community(session, index, creator, managers=0, staff=0, members=0):
+    community = Community(name=f'社区{index}', creator_id=creator.user_id, status=1)
+    session.add(community)
+    session.flush()
+    for role, count in (('manager', managers), ('staff', staff), (None, members)):
+        for n in range(count):
+            user = User(nickname=f'社区{index}-{role or "member"}{n}', role=1, status=1,
+                        community_id=community.community_id)
+            session.add(user)
+            session.flush()
+            if role:
+                session.add(CommunityStaff(community_id=community.community_id, user_id=user.user_id, role=role))
+                if role == 'manager' and n == 0:
+                    community.manager_id = user.user_id
+    return community
+
+
+class TestCommunityListStats:
+
+    def test_member_stats_in_one_query(self, test_session, test_user, count_statements):
+        """工作人员按角色计数，普通成员不含本社区工作人员"""
+        first = _add_community(test_session, 1, test_user, managers=1, staff=2, members=3)
+        second = _add_community(test_session, 2, test_user, staff=1)
+        empty = _add_community(test_session, 3, test_user)
+        test_session.commit()
+        CommunityCounterService.reconcile()
+        ids = [first.community_id, second.community_id, empty.community_id]
+
+        with count_statements() as statements:
+            stats = CommunityService.get_communities_member_stats(ids)
+
+        assert len(statements) == 1
+        assert stats[first.community_id] == {'manager_count': 1, 'staff_count': 2, 'user_count': 3}
+        assert stats[second.community_id] == {'manager_count': 0, 'staff_count': 1, 'user_count': 0}
+        assert stats[empty.community_id] == {'manager_count': 0, 'staff_count': 0, 'user_count': 0}
+        assert CommunityService.get_communities_member_stats([]) == {}
+
+    def test_member_stats_without_counters_fall_back_to_live_count(self, test_session, test_user):
+        """没有计数行的社区实时统计"""
+        community = _add_community(test_session, 1, test_user, managers=1, members=2)
+        test_session.commit()
+
+        stats = CommunityService.get_communities_member_stats([community.community_id])
+
+        assert stats[community.community_id] == {'manager_count': 1, 'staff_count': 0, 'user_count': 2}
+
+    def test_page_query_count_does_not_grow(self, test_session, test_user, count_statements):
+        """格式化一页社区的查询次数与社区数量无关"""
+        for i in range(6):
+            _add_community(test_session, i, test_user, managers=1, staff=i, members=i + 1)
+        test_session.commit()
+        CommunityCounterService.reconcile()
+        communities = test_session.query(Community).order_by(Community.community_id).all()
+
+        with count_statements() as statements:
+            data = _format_communities_info(communities, include_worker_stats=True)
+
+        assert len(statements) == 2
+        assert [d['community_id'] for d in data] == [c.community_id for c in communities]
+        last = data[-1]
+        assert (last['manager_count'], last['staff_count'], last['worker_count'], last['user_count']) == (1, 5, 6, 6)
+        assert last['creator']['user_id'] == test_user.user_id
+        assert last['manager']['nickname'] == '社区5-manager0'
+
+    def test_single_community_matches_batch(self, test_session, test_user):
+        """单个社区的格式化结果与批量结果一致"""
+        community = _add_community(test_session, 1, test_user, managers=1, members=2)
+        test_session.commit()
+
+        assert _format_community_info(community, include_worker_stats=True) == \
+            _format_communities_info([community], include_worker_stats=True)[0]
+        plain = _format_community_info(community)
+        assert (plain['manager_count'], plain['user_count']) == (0, 0)
+        assert plain['manager']['user_id'] == community.manager_id
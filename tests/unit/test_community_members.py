@@ -0,0 +1,82 @@
+"""
+社区成员列表测试
+验证成员分页和今日未打卡事项由两次集合查询得到，结果按成员分组
+"""
+import os
+import sys
+from datetime import datetime, date, time, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import (
+    CheckinRule, CheckinRecord, CommunityCheckinRule, CommunityStaff, User
+)
+from wxcloudrun.community_service import CommunityService
+
+
+def _add_member(session, community, index):
+    user = User(nickname=f'成员{index}', role=1, status=1, community_id=community.community_id,
+                community_joined_at=datetime(2025, 1, 1) + timedelta(days=index))
+    session.add(user)
+    session.flush()
+    return user
+
+
+def _add_record(session, user, hour, status, rule=None, community_rule=None):
+    planned = datetime.combine(date.today(), time(hour, 0))
+    session.add(CheckinRecord(
+        rule_id=rule.rule_id if rule else None,
+        community_rule_id=community_rule.community_rule_id if community_rule else None,
+        solo_user_id=user.user_id if community_rule else None,
+        user_id=user.user_id, planned_time=planned, status=status))
+
+
+class TestCommunityMembers:
+
+    def test_members_and_unchecked_items_in_two_queries(self, test_session, test_user, test_community, count_statements):
+        """工作人员不在列表中，每人今日未打卡事项带规则名称和计划时间"""
+        members = [_add_member(test_session, test_community, i) for i in range(5)]
+        staff = _add_member(test_session, test_community, 9)
+        test_session.add(CommunityStaff(community_id=test_community.community_id, user_id=staff.user_id,
+                                        role='staff'))
+        community_rule = CommunityCheckinRule(community_id=test_community.community_id, rule_name='社区签到',
+                                              status=1, created_by=test_user.user_id)
+        test_session.add(community_rule)
+        test_session.flush()
+        for index, member in enumerate(members):
+            rule = CheckinRule(user_id=member.user_id, rule_type='personal', rule_name=f'吃药{index}', status=1)
+            test_session.add(rule)
+            test_session.flush()
+            _add_record(test_session, member, 9, 0, rule=rule)
+            _add_record(test_session, member, 20, 0 if index % 2 == 0 else 1, community_rule=community_rule)
+        # 昨天的miss记录不计入
+        test_session.add(CheckinRecord(rule_id=rule.rule_id, user_id=members[-1].user_id, status=0,
+                                       planned_time=datetime.combine(date.today() - timedelta(days=1), time(9, 0))))
+        test_session.commit()
+        community_id = test_community.community_id
+
+        with count_statements() as statements:
+            page, total = CommunityService.get_community_members(community_id, page=1, page_size=3)
+
+        assert len(statements) == 2
+        assert total == 5
+        # 按加入时间倒序
+        assert [m['nickname'] for m in page] == ['成员4', '成员3', '成员2']
+        assert page[0]['unchecked_count'] == 2
+        assert page[0]['unchecked_items'] == [
+            {'rule_id': str(rule.rule_id), 'rule_source': 'personal', 'rule_name': '吃药4', 'planned_time': '09:00:00'},
+            {'rule_id': str(community_rule.community_rule_id), 'rule_source': 'community',
+             'rule_name': '社区签到', 'planned_time': '20:00:00'},
+        ]
+        assert page[1]['unchecked_count'] == 1
+
+    def test_page_past_the_end_still_reports_total(self, test_session, test_community):
+        """页码超出范围时返回空列表和正确的总数"""
+        for i in range(2):
+            _add_member(test_session, test_community, i)
+        test_session.commit()
+
+        page, total = CommunityService.get_community_members(test_community.community_id, page=3, page_size=2)
+
+        assert page == []
+        assert total == 2
@@ -263,3 +263,39 @@ def test_multiple_users_see_same_rule_status(test_session):
         assert community_rules[0]['is_active_for_user'] == False
         assert community_rules[0]['status_label'] == '停用'
 
+
+
+def test_rule_mappings_fan_out_in_batches(test_session, test_superuser, monkeypatch):
+    """启用/停用规则时按批插入或更新所有成员的映射，已有映射被重新激活而不重复插入"""
+    monkeypatch.setattr(CommunityCheckinRuleService, 'MAPPING_BATCH_SIZE', 2)
+    community = Community(name="测试社区_批量映射", description="批量映射", status=1)
+    test_session.add(community)
+    test_session.flush()
+    members = [User(nickname=f"成员{i}", role=1, status=1, community_id=community.community_id)
+               for i in range(5)]
+    outsider = User(nickname="其他社区成员", role=1, status=1)
+    test_session.add_all(members + [outsider])
+    rule = CommunityCheckinRule(community_id=community.community_id, rule_name="批量规则",
+                                status=0, created_by=test_superuser.user_id)
+    test_session.add(rule)
+    test_session.flush()
+    # 已停用的旧映射在启用时重新激活
+    test_session.add(UserCommunityRule(user_id=members[0].user_id, community_rule_id=rule.community_rule_id,
+                                       is_active=False))
+    test_session.commit()
+    rule_id = rule.community_rule_id
+
+    CommunityCheckinRuleService.enable_community_rule(rule_id, test_superuser.user_id)
+
+    mappings = test_session.query(UserCommunityRule).filter_by(community_rule_id=rule_id).all()
+    assert sorted(m.user_id for m in mappings) == sorted(m.user_id for m in members)
+    assert all(m.is_active for m in mappings)
+    assert test_session.get(CommunityCheckinRule, rule_id).status == 1
+
+    CommunityCheckinRuleService.disable_community_rule(rule_id, test_superuser.user_id)
+
+    test_session.expire_all()
+    mappings = test_session.query(UserCommunityRule).filter_by(community_rule_id=rule_id).all()
+    assert len(mappings) == 5
+    assert not any(m.is_active for m in mappings)
+    assert test_session.get(CommunityCheckinRule, rule_id).status == 0
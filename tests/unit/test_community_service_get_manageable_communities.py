@@ -379,4 +379,31 @@ class TestGetManageableCommunitiesSpecialLogic:
                 "社区应该按创建时间倒序排列"
 
         # 验证最新社区排在第一位
-        assert result_communities[0].community_id == latest_community.community_id
\ No newline at end of file
+        assert result_communities[0].community_id == latest_community.community_id
+
+    def test_super_admin_pages_in_sql(self, test_session, count_statements):
+        """
+        测试超级管理员的社区列表在 SQL 中分页
+        验证每页一条查询同时得到该页社区和总数，页码超出范围时仍返回总数
+        """
+        super_admin = User(wechat_openid="super_admin_openid_5", nickname="超级管理员5", role=4, status=1)
+        test_session.add(super_admin)
+        get_or_create_special_communities(test_session)
+        for day in range(1, 6):
+            create_normal_community(test_session, created_at=datetime(2024, 1, day))
+        test_session.commit()
+        super_admin = test_session.query(User).filter_by(wechat_openid="super_admin_openid_5").first()
+
+        with count_statements() as statements:
+            page1, total = CommunityService.get_manageable_communities(super_admin, page=1, per_page=3)
+        assert len(statements) == 1
+        assert total == 7
+        assert [c.created_at for c in page1] == [datetime(2024, 1, day) for day in (5, 4, 3)]
+
+        page3, total = CommunityService.get_manageable_communities(super_admin, page=3, per_page=3)
+        assert len(page3) == 1
+        assert total == 7
+
+        page4, total = CommunityService.get_manageable_communities(super_admin, page=4, per_page=3)
+        assert page4 == []
+        assert total == 7
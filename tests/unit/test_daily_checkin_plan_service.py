@@ -0,0 +1,265 @@
+"""
+每日打卡计划服务测试
+验证计划的批量构建、按用户读取以及规则变更和打卡后的增量修补
+"""
+import os
+import sys
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import (
+    CheckinRecord, CheckinRule, CommunityCheckinRule, DailyCheckinPlan, User, UserCommunityRule
+)
+from wxcloudrun.checkin_record_service import CheckinRecordService
+from wxcloudrun.checkin_rule_service import CheckinRuleService
+from wxcloudrun.community_checkin_rule_service import CommunityCheckinRuleService
+from wxcloudrun.daily_checkin_plan_service import DailyCheckinPlanService, today_plan_cache
+from wxcloudrun.user_checkin_rule_service import UserCheckinRuleService
+
+
+def _add_rule(session, user, **kwargs):
+    rule = CheckinRule(
+        user_id=user.user_id,
+        rule_type='personal',
+        rule_name=kwargs.pop('rule_name', '测试规则'),
+        status=kwargs.pop('status', 1),
+        **kwargs
+    )
+    session.add(rule)
+    session.commit()
+    return rule
+
+
+def _add_community_rule(session, creator, community, members):
+    rule = CommunityCheckinRule(
+        community_id=community.community_id,
+        rule_name='社区规则',
+        status=1,
+        time_slot_type=1,
+        created_by=creator.user_id
+    )
+    session.add(rule)
+    session.flush()
+    for member in members:
+        session.add(UserCommunityRule(user_id=member.user_id, community_rule_id=rule.community_rule_id,
+                                      is_active=True))
+    session.commit()
+    return rule
+
+
+def _plan_rows(session, **filters):
+    return session.query(DailyCheckinPlan).filter_by(plan_date=date.today(), **filters).all()
+
+
+class TestDailyCheckinPlanService:
+
+    def test_build_plans_materializes_due_items(self, test_session, test_user, test_community):
+        """批量构建个人规则和社区规则扇出的事项，跳过停用和今日不需打卡的规则"""
+        morning = _add_rule(test_session, test_user, time_slot_type=1)
+        _add_rule(test_session, test_user, time_slot_type=1, status=0)
+        _add_rule(test_session, test_user, frequency_type=3, time_slot_type=1)  # 无日期范围
+        member = User(nickname='成员', role=1, status=1, community_id=test_community.community_id)
+        test_session.add(member)
+        test_session.commit()
+        community_rule = _add_community_rule(test_session, test_user, test_community, [test_user, member])
+
+        assert DailyCheckinPlanService.build_plans() == 3
+        assert DailyCheckinPlanService.is_built(date.today())
+        assert DailyCheckinPlanService.ensure_built() is False
+
+        items = DailyCheckinPlanService.get_user_plan_items(test_user.user_id)
+        assert [(i.rule_source, i.rule_id) for i in items] == [
+            ('personal', morning.rule_id), ('community', community_rule.community_rule_id)
+        ]
+        assert all(i.status == 'unchecked' and i.planned_time.time() == time(9, 0) for i in items)
+        assert items[1].community_name == test_community.name
+        assert len(_plan_rows(test_session, user_id=member.user_id)) == 1
+
+    def test_unbuilt_day_computes_user_items_without_writing(self, test_session, test_user, count_statements):
+        """当天尚未批量构建时，读取时即时计算该用户的计划，不写入计划表"""
+        rule = _add_rule(test_session, test_user, time_slot_type=2)
+
+        with count_statements() as statements:
+            plan = CheckinRuleService.get_today_checkin_plan(test_user.user_id)
+
+        assert [item['rule_id'] for item in plan['checkin_items']] == [rule.rule_id]
+        assert plan['checkin_items'][0]['planned_time'] == '14:00:00'
+        assert all(statement.startswith('SELECT') for statement in statements)
+        assert _plan_rows(test_session, user_id=test_user.user_id) == []
+
+    def test_rule_changes_patch_built_plan(self, test_session, test_user):
+        """批量构建后，创建/删除个人规则会修补用户的计划"""
+        DailyCheckinPlanService.build_plans()
+        assert DailyCheckinPlanService.get_user_plan_items(test_user.user_id) == []
+
+        rule = CheckinRuleService.create_rule(
+            {'rule_name': '新规则', 'frequency_type': 0, 'time_slot_type': 3}, test_user.user_id)
+        items = DailyCheckinPlanService.get_user_plan_items(test_user.user_id)
+        assert [(i.rule_id, i.rule_name) for i in items] == [(rule.rule_id, '新规则')]
+
+        CheckinRuleService.delete_rule(rule.rule_id, test_user.user_id)
+        assert DailyCheckinPlanService.get_user_plan_items(test_user.user_id) == []
+
+    def test_external_session_refreshes_after_caller_commit(self, test_session, test_user):
+        """使用外部会话变更规则时不提交也不修补计划，调用者提交后调用 refresh_daily_plan"""
+        DailyCheckinPlanService.build_plans()
+        user_id = test_user.user_id
+
+        rule = CheckinRuleService.create_rule(
+            {'rule_name': '外部会话', 'frequency_type': 0, 'time_slot_type': 3}, user_id, session=test_session)
+        test_session.commit()
+        assert DailyCheckinPlanService.get_user_plan_items(user_id) == []
+        CheckinRuleService.refresh_daily_plan(user_id)
+        assert [i.rule_id for i in DailyCheckinPlanService.get_user_plan_items(user_id)] == [rule.rule_id]
+
+        CheckinRuleService.delete_rule(rule.rule_id, user_id, session=test_session)
+        test_session.commit()
+        CheckinRuleService.refresh_daily_plan(user_id)
+        assert DailyCheckinPlanService.get_user_plan_items(user_id) == []
+
+    def test_checkin_and_cancel_patch_item_status(self, test_session, test_user):
+        """打卡和撤销打卡后，计划事项状态随之更新"""
+        rule = _add_rule(test_session, test_user, time_slot_type=1)
+        DailyCheckinPlanService.build_plans()
+
+        result = CheckinRecordService.perform_checkin(rule.rule_id, test_user.user_id)
+        item = CheckinRuleService.get_today_checkin_plan(test_user.user_id)['checkin_items'][0]
+        assert item['status'] == 'checked'
+        assert item['record_id'] == result['record_id']
+        assert item['checkin_time'] is not None
+
+        CheckinRecordService.cancel_checkin(result['record_id'], test_user.user_id)
+        item = CheckinRuleService.get_today_checkin_plan(test_user.user_id)['checkin_items'][0]
+        assert item['status'] == 'unchecked'
+        assert item['checkin_time'] is None
+
+    def test_community_rule_toggle_patches_members(self, test_session, test_superuser, test_community):
+        """停用/启用社区规则后，成员计划中的事项被移除/恢复"""
+        member = User(nickname='成员', role=1, status=1, community_id=test_community.community_id)
+        test_session.add(member)
+        test_session.commit()
+        rule = _add_community_rule(test_session, test_superuser, test_community, [member])
+        DailyCheckinPlanService.build_plans()
+
+        CommunityCheckinRuleService.disable_community_rule(rule.community_rule_id, test_superuser.user_id)
+        assert UserCheckinRuleService.get_today_checkin_plan(member.user_id)['items'] == []
+
+        CommunityCheckinRuleService.enable_community_rule(rule.community_rule_id, test_superuser.user_id)
+        items = UserCheckinRuleService.get_today_checkin_plan(member.user_id)['items']
+        assert [(i['rule_source'], i['rule_id']) for i in items] == [('community', rule.community_rule_id)]
+        assert items[0]['community_name'] == test_community.name
+
+
+    def test_plan_query_count_does_not_grow_with_rules(self, test_session, test_user, test_superuser,
+                                                       test_community, count_statements):
+        """按需计算计划时每次读取今日记录只按用户读取一次，查询次数与规则数量无关"""
+        def plan_statements(user):
+            user_id = user.user_id
+            today_plan_cache.clear()
+            with count_statements() as statements:
+                UserCheckinRuleService.get_today_checkin_plan(user_id)
+                CheckinRuleService.get_today_checkin_plan(user_id)
+            test_session.query(DailyCheckinPlan).delete()
+            test_session.commit()
+            return statements
+
+        few = User(nickname='少量规则', role=1, status=1)
+        many = User(nickname='大量规则', role=1, status=1)
+        test_session.add_all([few, many])
+        test_session.commit()
+        for user, count in ((few, 1), (many, 12)):
+            for index in range(count):
+                rule = _add_rule(test_session, user, time_slot_type=1)
+                test_session.add(CheckinRecord(rule_id=rule.rule_id, user_id=user.user_id, status=index % 2,
+                                               planned_time=datetime.combine(date.today(), time(9, 0))))
+                community_rule = _add_community_rule(test_session, test_superuser, test_community, [user])
+                test_session.add(CheckinRecord(community_rule_id=community_rule.community_rule_id,
+                                               solo_user_id=user.user_id, user_id=user.user_id, status=1,
+                                               planned_time=datetime.combine(date.today(), time(9, 0))))
+            test_session.commit()
+
+        few_statements = plan_statements(few)
+        many_statements = plan_statements(many)
+
+        assert len(many_statements) == len(few_statements)
+        record_reads = [s for s in many_statements if s.startswith('SELECT') and 'FROM checkin_records' in s]
+        assert len(record_reads) == 2
+        items = UserCheckinRuleService.get_today_checkin_plan(many.user_id)['items']
+        assert len(items) == 24
+        assert sum(item['status'] == 'checked' for item in items) == 18
+
+class TestTodayPlanCache:
+
+    def test_hit_until_checkin_invalidates(self, test_session, test_user):
+        """重复读取命中缓存，打卡和撤销后失效"""
+        rule = _add_rule(test_session, test_user, time_slot_type=1)
+        DailyCheckinPlanService.build_plans()
+        today_plan_cache.reset_stats()
+
+        first = UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)
+        second = UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)
+        assert first == second
+        assert (today_plan_cache.hits, today_plan_cache.misses) == (1, 1)
+
+        second['items'].clear()
+        assert len(UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items']) == 1
+
+        result = CheckinRecordService.perform_checkin(rule.rule_id, test_user.user_id)
+        assert UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items'][0]['status'] == 'checked'
+
+        CheckinRecordService.cancel_checkin(result['record_id'], test_user.user_id)
+        assert UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items'][0]['status'] == 'unchecked'
+        stats = UserCheckinRuleService.get_today_plan_cache_stats()
+        assert (stats['hits'], stats['misses']) == (2, 3)
+
+    def test_rule_changes_invalidate(self, test_session, test_user, test_superuser, test_community):
+        """个人规则增删、社区规则停用后缓存失效"""
+        DailyCheckinPlanService.build_plans()
+        assert UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items'] == []
+
+        rule = CheckinRuleService.create_rule(
+            {'rule_name': '新规则', 'frequency_type': 0, 'time_slot_type': 3}, test_user.user_id)
+        assert len(UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items']) == 1
+
+        CheckinRuleService.delete_rule(rule.rule_id, test_user.user_id)
+        assert UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items'] == []
+
+        community_rule = _add_community_rule(test_session, test_superuser, test_community, [test_user])
+        DailyCheckinPlanService.refresh_community_rule(community_rule.community_rule_id)
+        assert len(UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items']) == 1
+        CommunityCheckinRuleService.disable_community_rule(community_rule.community_rule_id, test_superuser.user_id)
+        assert UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items'] == []
+
+    def test_other_process_changes_invalidate(self, test_session, test_user):
+        """其他进程变更计划（不经过本进程的显式失效）后，版本戳不一致的缓存条目不再命中"""
+        rule = _add_rule(test_session, test_user, time_slot_type=1)
+        DailyCheckinPlanService.build_plans()
+        UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)
+
+        # 模拟另一个进程打卡：直接修改计划行并递增版本号，本进程缓存中的条目保持不变
+        test_session.query(DailyCheckinPlan).filter(
+            DailyCheckinPlan.user_id == test_user.user_id,
+            DailyCheckinPlan.rule_id == rule.rule_id
+        ).update({'status': 'checked'}, synchronize_session=False)
+        DailyCheckinPlanService.bump_versions([test_user.user_id])
+        test_session.commit()
+
+        today_plan_cache.reset_stats()
+        items = UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items']
+        assert items[0]['status'] == 'checked'
+        assert (today_plan_cache.hits, today_plan_cache.misses) == (0, 1)
+
+        # 其他进程重新构建当天计划同样使旧条目失效
+        DailyCheckinPlanService.build_plans()
+        test_session.query(DailyCheckinPlan).delete()
+        test_session.commit()
+        assert UserCheckinRuleService.get_today_checkin_plan(test_user.user_id)['items'] == []
+
+    def test_entries_expire_at_midnight(self):
+        """缓存条目在当天结束时过期"""
+        today_plan_cache.set(1, {'items': []})
+        assert today_plan_cache.get(1) == {'items': []}
+        midnight = datetime.combine(date.today() + timedelta(days=1), time.min)
+        assert today_plan_cache.get(1, now=midnight) is None
+        assert today_plan_cache.get(1) is None
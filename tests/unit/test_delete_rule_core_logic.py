@@ -114,8 +114,8 @@ class TestDeleteRuleCoreLogic:
         base_time = datetime.now()
         records_data = [
             {"checkin_type": "已打卡", "checkin_time": base_time},  # 已打卡
-            {"checkin_type": "未打卡", "checkin_time": base_time + timedelta(hours=1)},  # 未打卡
-            {"checkin_type": "已撤销", "checkin_time": base_time + timedelta(hours=2)},  # 已撤销
+            {"checkin_type": "未打卡", "checkin_time": base_time + timedelta(days=1)},  # 未打卡
+            {"checkin_type": "已撤销", "checkin_time": base_time + timedelta(days=2)},  # 已撤销
         ]
 
         for record_data in records_data:
@@ -176,9 +176,9 @@ class TestDeleteRuleCoreLogic:
             record = CheckinRecord(
                 rule_id=rule.rule_id,
                 user_id=test_user.user_id,
-                planned_time=datetime.now() + timedelta(hours=i),
+                planned_time=datetime.now() + timedelta(days=i),
                 checkin_type=f"打卡{i+1}",
-                checkin_time=datetime.now() + timedelta(hours=i)
+                checkin_time=datetime.now() + timedelta(days=i)
             )
             test_session.add(record)
         test_session.commit()
@@ -0,0 +1,381 @@
+"""
+后台miss扫描测试
+验证集合式批量扫描与逐条规则扫描结果一致
+"""
+import os
+import sys
+from datetime import datetime, date, time, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import (
+    CheckinRule, CheckinRecord, Community, CommunityCheckinRule, User, UserCommunityRule
+)
+from wxcloudrun import background_tasks
+from wxcloudrun.background_tasks import (
+    MissDeadlineScheduler,
+    _process_missed_for_today,
+    _scan_community_missed_for_today_bulk,
+    _scan_missed_for_today_bulk,
+    _process_missed_for_today_per_rule
+)
+from wxcloudrun.checkin_rule_service import CheckinRuleService
+
+# 固定为周三，方便验证每周/工作日规则
+TODAY = date(2025, 1, 15)
+NOW = datetime.combine(TODAY, time(21, 0))
+
+
+def _add_rule(session, user, **kwargs):
+    rule = CheckinRule(
+        user_id=user.user_id,
+        rule_type='personal',
+        rule_name=kwargs.pop('rule_name', '测试规则'),
+        status=kwargs.pop('status', 1),
+        **kwargs
+    )
+    session.add(rule)
+    session.commit()
+    return rule
+
+
+def _records_for(session, rule):
+    return session.query(CheckinRecord).filter_by(rule_id=rule.rule_id).all()
+
+
+class TestBulkMissedScanner:
+
+    def test_marks_due_rules_past_deadline(self, test_session, test_user):
+        """已过计划时间且未打卡的规则被批量标记为miss"""
+        daily = _add_rule(test_session, test_user, frequency_type=0, time_slot_type=1)
+        evening = _add_rule(test_session, test_user, frequency_type=0, time_slot_type=3)
+        late = _add_rule(test_session, test_user, frequency_type=0, time_slot_type=4,
+                         custom_time=time(23, 30))
+
+        report = _scan_missed_for_today_bulk(NOW)
+
+        assert report['scanned'] == 3
+        assert report['inserted'] == 2
+        daily_records = _records_for(test_session, daily)
+        assert len(daily_records) == 1
+        assert daily_records[0].status == 0
+        assert daily_records[0].planned_time == datetime.combine(TODAY, time(9, 0))
+        assert len(_records_for(test_session, evening)) == 1
+        assert _records_for(test_session, late) == []
+
+    def test_invalidates_statistics_of_marked_users(self, test_session, test_user):
+        """标记miss后被标记用户的统计缓存失效，其他用户的缓存保留"""
+        from wxcloudrun.checkin_statistics_service import statistics_cache
+        _add_rule(test_session, test_user, frequency_type=0, time_slot_type=1)
+        other_user_id = test_user.user_id + 1
+        statistics_cache.set(test_user.user_id, {'cached': True}, key='week')
+        statistics_cache.set(other_user_id, {'cached': True}, key='week')
+
+        assert _scan_missed_for_today_bulk(NOW)['inserted'] == 1
+        assert statistics_cache.get(test_user.user_id, 'week') is None
+        assert statistics_cache.get(other_user_id, 'week') == {'cached': True}
+
+    def test_skips_marked_deleted_and_unscheduled_rules(self, test_session, test_user):
+        """已打卡、已删除、已停用、今日不需要打卡的规则不会被标记"""
+        checked = _add_rule(test_session, test_user, time_slot_type=1)
+        test_session.add(CheckinRecord(
+            rule_id=checked.rule_id, user_id=test_user.user_id,
+            planned_time=datetime.combine(TODAY, time(9, 0)),
+            checkin_time=datetime.combine(TODAY, time(8, 55)), status=1
+        ))
+        cancelled = _add_rule(test_session, test_user, time_slot_type=1)
+        test_session.add(CheckinRecord(
+            rule_id=cancelled.rule_id, user_id=test_user.user_id,
+            planned_time=datetime.combine(TODAY, time(9, 0)), status=2
+        ))
+        test_session.commit()
+        deleted = _add_rule(test_session, test_user, time_slot_type=1, status=2)
+        disabled = _add_rule(test_session, test_user, time_slot_type=1, status=0)
+        # 周三不在 week_days（仅周一）中
+        weekly_off = _add_rule(test_session, test_user, frequency_type=1, week_days=1, time_slot_type=1)
+        weekly_on = _add_rule(test_session, test_user, frequency_type=1, week_days=1 << 2, time_slot_type=1)
+        expired = _add_rule(test_session, test_user, frequency_type=3, time_slot_type=1,
+                            custom_start_date=TODAY - timedelta(days=10),
+                            custom_end_date=TODAY - timedelta(days=1))
+
+        report = _scan_missed_for_today_bulk(NOW)
+
+        assert len(_records_for(test_session, checked)) == 1
+        assert _records_for(test_session, checked)[0].status == 1
+        # 已撤销的记录不算已处理，改为miss（每天只有一条记录）
+        cancelled_records = _records_for(test_session, cancelled)
+        assert [r.status for r in cancelled_records] == [0]
+        assert _records_for(test_session, deleted) == []
+        assert _records_for(test_session, disabled) == []
+        assert _records_for(test_session, weekly_off) == []
+        assert len(_records_for(test_session, weekly_on)) == 1
+        assert _records_for(test_session, expired) == []
+        assert report['inserted'] == 2
+
+    def test_batches_and_is_idempotent(self, test_session, test_user):
+        """分批处理全部规则，重复扫描不会重复插入"""
+        rules = [_add_rule(test_session, test_user, time_slot_type=1) for _ in range(5)]
+
+        report = _scan_missed_for_today_bulk(NOW, batch_size=2)
+        assert report == {'scanned': 5, 'inserted': 5, 'batches': 3}
+
+        second = _scan_missed_for_today_bulk(NOW, batch_size=2)
+        assert second['inserted'] == 0
+        for rule in rules:
+            assert len(_records_for(test_session, rule)) == 1
+
+    def test_matches_per_rule_scanner(self, test_session, test_user):
+        """批量扫描与逐条扫描的结果一致"""
+        _add_rule(test_session, test_user, time_slot_type=1)
+        _add_rule(test_session, test_user, frequency_type=2, time_slot_type=2)
+        _add_rule(test_session, test_user, frequency_type=1, week_days=1, time_slot_type=1)
+
+        _process_missed_for_today_per_rule(NOW)
+        per_rule = sorted((r.rule_id, r.planned_time) for r in test_session.query(CheckinRecord).all())
+
+        test_session.query(CheckinRecord).delete()
+        test_session.commit()
+
+        _scan_missed_for_today_bulk(NOW)
+        bulk = sorted((r.rule_id, r.planned_time) for r in test_session.query(CheckinRecord).all())
+
+        assert bulk == per_rule
+        assert len(bulk) == 2
+
+
+class TestMissDeadlineScheduler:
+
+    def test_rebuild_orders_rules_by_deadline(self, test_session, test_user):
+        """重建后按截止时间依次到期，未到期时不返回任何规则"""
+        morning = _add_rule(test_session, test_user, time_slot_type=1)
+        afternoon = _add_rule(test_session, test_user, time_slot_type=2)
+        _add_rule(test_session, test_user, time_slot_type=1, status=2)
+
+        scheduler = MissDeadlineScheduler(grace_minutes=30)
+        assert scheduler.rebuild(TODAY) == 2
+        assert scheduler.next_deadline() == datetime.combine(TODAY, time(9, 30))
+
+        assert scheduler.pop_due(datetime.combine(TODAY, time(9, 29))) == {}
+        assert scheduler.pop_due(datetime.combine(TODAY, time(9, 30))) == {('personal', TODAY): [morning.rule_id]}
+        assert scheduler.next_deadline() == datetime.combine(TODAY, time(14, 30))
+        assert scheduler.pop_due(NOW) == {('personal', TODAY): [afternoon.rule_id]}
+        assert scheduler.next_deadline() is None
+
+    def test_schedule_and_discard_patch_heap(self):
+        """修改截止时间后旧条目失效，移除后不再到期"""
+        scheduler = MissDeadlineScheduler()
+        scheduler.schedule(1, datetime.combine(TODAY, time(9, 0)), TODAY)
+        scheduler.schedule(1, datetime.combine(TODAY, time(11, 0)), TODAY)
+        scheduler.schedule(2, datetime.combine(TODAY, time(10, 0)), TODAY)
+        scheduler.discard(2, TODAY)
+
+        assert scheduler.next_deadline() == datetime.combine(TODAY, time(11, 0))
+        assert scheduler.pop_due(datetime.combine(TODAY, time(10, 30))) == {}
+        assert scheduler.pop_due(NOW) == {('personal', TODAY): [1]}
+        assert scheduler.pending_count() == 0
+
+    def test_rule_service_patches_running_scheduler(self, test_session, test_user, monkeypatch):
+        """通过 CheckinRuleService 创建/修改/删除规则时增量修补调度器"""
+        scheduler = MissDeadlineScheduler()
+        monkeypatch.setattr(background_tasks, '_deadline_scheduler', scheduler)
+        today = date.today()
+
+        rule = CheckinRuleService.create_rule(
+            {'rule_name': '喝水', 'time_slot_type': 4, 'custom_time': '10:00:00'}, test_user.user_id)
+        assert scheduler.next_deadline() == datetime.combine(today, time(10, 0))
+
+        CheckinRuleService.update_rule(rule.rule_id, {'custom_time': '11:15:00'}, test_user.user_id)
+        assert scheduler.next_deadline() == datetime.combine(today, time(11, 15))
+
+        CheckinRuleService.delete_rule(rule.rule_id, test_user.user_id)
+        assert scheduler.next_deadline() is None
+
+    def test_due_rules_are_marked_by_targeted_scan(self, test_session, test_user):
+        """到期规则只对指定规则执行扫描"""
+        morning = _add_rule(test_session, test_user, time_slot_type=1)
+        afternoon = _add_rule(test_session, test_user, time_slot_type=2)
+
+        scheduler = MissDeadlineScheduler()
+        scheduler.rebuild(TODAY)
+        now = datetime.combine(TODAY, time(15, 0))
+        for (_, day), rule_ids in scheduler.pop_due(datetime.combine(TODAY, time(9, 0))).items():
+            report = _scan_missed_for_today_bulk(now, rule_ids=rule_ids, day=day)
+
+        assert report['scanned'] == 1
+        assert len(_records_for(test_session, morning)) == 1
+        assert _records_for(test_session, afternoon) == []
+
+    def test_targeted_scan_rechecks_rules_changed_elsewhere(self, test_session, test_user):
+        """其他进程停用或改期的规则尚未同步到调度器时，到期扫描按数据库当前状态判断，不会误标记"""
+        disabled = _add_rule(test_session, test_user, time_slot_type=1)
+        moved = _add_rule(test_session, test_user, time_slot_type=1)
+        scheduler = MissDeadlineScheduler()
+        scheduler.rebuild(TODAY)
+
+        # 模拟非leader进程的修改：只写数据库，不修补本进程的调度器
+        disabled.status = 0
+        moved.time_slot_type = 4
+        moved.custom_time = time(22, 0)
+        test_session.commit()
+
+        due = scheduler.pop_due(datetime.combine(TODAY, time(9, 0)))
+        report = _scan_missed_for_today_bulk(datetime.combine(TODAY, time(9, 0)),
+                                             rule_ids=due[('personal', TODAY)], day=TODAY)
+
+        assert report['inserted'] == 0
+        assert _records_for(test_session, disabled) == []
+        assert _records_for(test_session, moved) == []
+        # 下次重建按新的计划时间调度
+        assert scheduler.rebuild(TODAY) == 1
+        assert scheduler.next_deadline() == datetime.combine(TODAY, time(22, 0))
+
+
+def _add_community_rule(session, creator, community, **kwargs):
+    rule = CommunityCheckinRule(
+        community_id=community.community_id,
+        rule_name=kwargs.pop('rule_name', '社区规则'),
+        status=kwargs.pop('status', 1),
+        created_by=creator.user_id,
+        **kwargs
+    )
+    session.add(rule)
+    session.commit()
+    return rule
+
+
+def _add_members(session, community, rule, count, is_active=True):
+    members = []
+    for i in range(count):
+        user = User(nickname=f'成员{i}', role=1, status=1, community_id=community.community_id)
+        session.add(user)
+        session.flush()
+        session.add(UserCommunityRule(user_id=user.user_id, community_rule_id=rule.community_rule_id,
+                                      is_active=is_active))
+        members.append(user)
+    session.commit()
+    return members
+
+
+def _community_records(session, rule):
+    return session.query(CheckinRecord).filter_by(community_rule_id=rule.community_rule_id).all()
+
+
+class TestCommunityMissedFanout:
+
+    def test_fans_out_active_members(self, test_session, test_user, test_community):
+        """激活映射的成员按批次生成社区规则miss记录"""
+        rule = _add_community_rule(test_session, test_user, test_community, time_slot_type=1)
+        members = _add_members(test_session, test_community, rule, 5)
+
+        report = _scan_community_missed_for_today_bulk(NOW, batch_size=2)
+
+        assert report == {'scanned': 5, 'inserted': 5, 'batches': 3}
+        records = _community_records(test_session, rule)
+        assert sorted(r.solo_user_id for r in records) == sorted(m.user_id for m in members)
+        assert all(r.user_id == r.solo_user_id and r.rule_id is None and r.status == 0 for r in records)
+        assert records[0].planned_time == datetime.combine(TODAY, time(9, 0))
+
+        assert _scan_community_missed_for_today_bulk(NOW)['inserted'] == 0
+
+    def test_skips_inactive_checked_and_moved_members(self, test_session, test_user, test_community):
+        """停用映射、已打卡、已离开社区的成员以及停用的规则不会被标记"""
+        rule = _add_community_rule(test_session, test_user, test_community, time_slot_type=1)
+        active, checked, moved = _add_members(test_session, test_community, rule, 3)
+        _add_members(test_session, test_community, rule, 1, is_active=False)
+        test_session.add(CheckinRecord(
+            community_rule_id=rule.community_rule_id, solo_user_id=checked.user_id,
+            user_id=checked.user_id, planned_time=datetime.combine(TODAY, time(9, 0)), status=1
+        ))
+        other = Community(name='其他社区', status=1)
+        test_session.add(other)
+        test_session.flush()
+        moved.community_id = other.community_id
+        disabled = _add_community_rule(test_session, test_user, test_community, time_slot_type=1, status=0)
+        _add_members(test_session, test_community, disabled, 1)
+        test_session.commit()
+
+        report = _scan_community_missed_for_today_bulk(NOW)
+
+        assert report['inserted'] == 1
+        missed = [r for r in _community_records(test_session, rule) if r.status == 0]
+        assert [r.solo_user_id for r in missed] == [active.user_id]
+        assert _community_records(test_session, disabled) == []
+
+    def test_full_scan_covers_personal_and_community(self, test_session, test_user, test_community):
+        """全量扫描同时处理个人规则与社区规则"""
+        _add_rule(test_session, test_user, time_slot_type=1)
+        rule = _add_community_rule(test_session, test_user, test_community, time_slot_type=2)
+        _add_members(test_session, test_community, rule, 2)
+
+        report = _process_missed_for_today(NOW)
+
+        assert report['inserted'] == 3
+
+    def test_scheduler_tracks_community_rules(self, test_session, test_user, test_community):
+        """调度器按社区规则截止时间到期，到期后再扇出到成员"""
+        rule = _add_community_rule(test_session, test_user, test_community, time_slot_type=2)
+        _add_members(test_session, test_community, rule, 3)
+
+        scheduler = MissDeadlineScheduler()
+        assert scheduler.rebuild(TODAY) == 1
+        due = scheduler.pop_due(datetime.combine(TODAY, time(14, 0)))
+        assert due == {('community', TODAY): [rule.community_rule_id]}
+
+        report = _scan_community_missed_for_today_bulk(
+            datetime.combine(TODAY, time(14, 0)), community_rule_ids=due[('community', TODAY)], day=TODAY)
+        assert report['inserted'] == 3
+
+
+class TestShardedScan:
+
+    def test_shards_partition_rules_by_user(self, test_session, test_user, test_community):
+        """各分片互不重叠，合并后与全量扫描一致"""
+        rule = _add_community_rule(test_session, test_user, test_community, time_slot_type=1)
+        members = _add_members(test_session, test_community, rule, 5)
+        for user in [test_user] + members:
+            _add_rule(test_session, user, time_slot_type=1)
+
+        reports = [background_tasks._scan_missed_shard(NOW, shard=(index, 3)) for index in range(3)]
+
+        assert sum(r['inserted'] for r in reports) == 11
+        assert all(r['inserted'] > 0 for r in reports)
+        assert background_tasks._scan_missed_shard(NOW)['inserted'] == 0
+
+    def test_memory_database_falls_back_to_single_process(self, test_session, test_user, monkeypatch):
+        """内存数据库无法跨进程共享，并行扫描退化为单进程"""
+        _add_rule(test_session, test_user, time_slot_type=1)
+        monkeypatch.setenv('MISS_SCAN_WORKERS', '4')
+
+        report = _process_missed_for_today(NOW)
+
+        assert report['inserted'] == 1
+
+    def test_process_pool_scans_file_database(self, tmp_path):
+        """文件数据库按分片在多个进程中扫描并合并报告"""
+        from flask import Flask
+        from database.flask_models import db
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'scan.db'}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            users = [User(nickname=f'用户{i}', role=1, status=1) for i in range(6)]
+            db.session.add_all(users)
+            db.session.flush()
+            db.session.add_all([
+                CheckinRule(user_id=user.user_id, rule_type='personal', rule_name='规则',
+                            status=1, time_slot_type=1)
+                for user in users
+            ])
+            db.session.commit()
+
+            report = background_tasks._scan_missed_for_today_parallel(NOW, 2)
+
+            assert report['scanned'] == 6
+            assert report['inserted'] == 6
+            assert db.session.query(CheckinRecord).filter_by(status=0).count() == 6
+            db.session.remove()
+            db.engine.dispose()
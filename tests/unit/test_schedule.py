@@ -0,0 +1,112 @@
+"""
+规则排期计算测试
+验证按位展开的应打卡日与逐日判断一致，并覆盖 next_due 和时间段换算
+"""
+import os
+import sys
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import CheckinRule
+from wxcloudrun.utils import schedule
+
+# 2025-01-13 为周一
+MONDAY = date(2025, 1, 13)
+
+
+def _rule(frequency_type=0, week_days=127, custom_start_date=None, custom_end_date=None):
+    return SimpleNamespace(frequency_type=frequency_type, week_days=week_days,
+                           custom_start_date=custom_start_date, custom_end_date=custom_end_date)
+
+
+RULES = [
+    _rule(),
+    _rule(frequency_type=1, week_days=0b0000101),  # 周一、周三
+    _rule(frequency_type=1, week_days=1 << 6),  # 周日
+    _rule(frequency_type=1, week_days=0),
+    _rule(frequency_type=2),
+    _rule(frequency_type=3, custom_start_date=MONDAY + timedelta(days=3),
+          custom_end_date=MONDAY + timedelta(days=12)),
+    _rule(frequency_type=3, custom_start_date=MONDAY),
+]
+
+
+def _brute_force(rule, day):
+    if rule.frequency_type == 1:
+        return bool(rule.week_days & (1 << day.weekday()))
+    if rule.frequency_type == 2:
+        return day.weekday() < 5
+    if rule.frequency_type == 3:
+        if rule.custom_start_date and rule.custom_end_date:
+            return rule.custom_start_date <= day <= rule.custom_end_date
+        return False
+    return True
+
+
+class TestSchedule:
+
+    def test_expand_matches_day_by_day_evaluation(self):
+        """任意起始星期和区间长度下，位掩码展开与逐日判断一致"""
+        for offset in range(7):
+            start = MONDAY + timedelta(days=offset)
+            for days in (1, 6, 7, 8, 31):
+                end = start + timedelta(days=days - 1)
+                masks = schedule.expand(RULES, start, end)
+                for rule, mask in zip(RULES, masks):
+                    expected = [start + timedelta(days=i) for i in range(days)
+                                if _brute_force(rule, start + timedelta(days=i))]
+                    assert schedule.due_days(mask, start) == expected
+                    assert mask == schedule.due_mask(rule, start, end)
+
+    def test_expand_shares_identical_schedules(self):
+        """排期相同的规则得到同一个位掩码"""
+        masks = schedule.expand([_rule(), _rule(frequency_type=1), _rule(frequency_type=2)],
+                                MONDAY, MONDAY + timedelta(days=13))
+        assert masks[0] == masks[1] == (1 << 14) - 1
+        assert masks[2] == 0b00111110011111
+
+    def test_next_due(self):
+        """next_due 返回当天或之后第一个应打卡日，区间结束后返回None"""
+        weekly = RULES[1]
+        assert schedule.next_due(weekly, MONDAY) == MONDAY
+        assert schedule.next_due(weekly, MONDAY + timedelta(days=1)) == MONDAY + timedelta(days=2)
+        assert schedule.next_due(weekly, MONDAY + timedelta(days=3)) == MONDAY + timedelta(days=7)
+        assert schedule.next_due(RULES[3], MONDAY) is None
+
+        custom = RULES[5]
+        assert schedule.next_due(custom, MONDAY) == MONDAY + timedelta(days=3)
+        assert schedule.next_due(custom, MONDAY + timedelta(days=12)) == MONDAY + timedelta(days=12)
+        assert schedule.next_due(custom, MONDAY + timedelta(days=13)) is None
+        assert schedule.next_due(RULES[4], MONDAY + timedelta(days=5)) == MONDAY + timedelta(days=7)
+
+    def test_accepts_dicts_with_iso_dates(self):
+        """社区规则字典中的ISO日期字符串同样可用"""
+        rule = {'frequency_type': 3, 'custom_start_date': '2025-01-14', 'custom_end_date': '2025-01-15'}
+        assert schedule.due_days(schedule.due_mask(rule, MONDAY, MONDAY + timedelta(days=6)), MONDAY) == [
+            date(2025, 1, 14), date(2025, 1, 15)]
+
+    def test_slot_time(self):
+        """时间段换算为计划时间，自定义时间缺失时按晚上"""
+        assert schedule.slot_time(1) == time(9, 0)
+        assert schedule.slot_time(2) == time(14, 0)
+        assert schedule.slot_time(3) == time(20, 0)
+        assert schedule.slot_time(4, time(7, 30)) == time(7, 30)
+        assert schedule.slot_time(4) == time(20, 0)
+
+    def test_sql_condition_matches_engine(self, test_session, test_user):
+        """SQL频率条件与排期计算对同一批规则给出相同结果"""
+        for index, rule in enumerate(RULES):
+            test_session.add(CheckinRule(user_id=test_user.user_id, rule_name=f'规则{index}', status=1,
+                                         frequency_type=rule.frequency_type, week_days=rule.week_days,
+                                         custom_start_date=rule.custom_start_date,
+                                         custom_end_date=rule.custom_end_date))
+        test_session.commit()
+        rules = test_session.query(CheckinRule).order_by(CheckinRule.rule_id).all()
+
+        for offset in range(14):
+            day = MONDAY + timedelta(days=offset)
+            due_ids = {rule_id for (rule_id,) in test_session.query(CheckinRule.rule_id).filter(
+                schedule.due_condition(CheckinRule, day))}
+            assert due_ids == {rule.rule_id for rule in rules if schedule.is_due(rule, day)}
@@ -0,0 +1,102 @@
+"""
+监督记录查询测试
+验证监护人可查看的打卡记录由一次查询得到，按时间倒序并支持游标分页
+"""
+import os
+import sys
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import db, CheckinRule, CheckinRecord, SupervisionRuleRelation, User
+from wxcloudrun.checkin_record_service import CheckinRecordService
+
+DAY = date(2025, 5, 1)
+
+
+def _add_user(session, nickname):
+    user = User(nickname=nickname, role=1, status=1)
+    session.add(user)
+    session.commit()
+    return user
+
+
+def _add_rule_with_records(session, user, name, hours):
+    rule = CheckinRule(user_id=user.user_id, rule_type='personal', rule_name=name, status=1)
+    session.add(rule)
+    session.flush()
+    for hour in hours:
+        session.add(CheckinRecord(rule_id=rule.rule_id, user_id=user.user_id, status=1,
+                                  planned_time=datetime.combine(DAY, time(hour, 0))))
+    session.commit()
+    return rule
+
+
+def _relate(session, supervisor, solo, rule=None, status=2):
+    session.add(SupervisionRuleRelation(supervisor_user_id=supervisor.user_id, solo_user_id=solo.user_id,
+                                        rule_id=rule.rule_id if rule else None, status=status))
+    session.commit()
+
+
+class TestSupervisedRecords:
+
+    def test_single_query_with_all_and_specific_relations(self, test_session, test_user):
+        """全部规则关系和单条规则关系合并为一次查询，重复关系不产生重复记录"""
+        parent = _add_user(test_session, '父亲')
+        mother = _add_user(test_session, '母亲')
+        stranger = _add_user(test_session, '陌生人')
+        parent_rule = _add_rule_with_records(test_session, parent, '吃药', [8])
+        _add_rule_with_records(test_session, parent, '喝水', [20])
+        mother_rule = _add_rule_with_records(test_session, mother, '散步', [9])
+        _add_rule_with_records(test_session, mother, '阅读', [10])
+        _add_rule_with_records(test_session, stranger, '跑步', [11])
+
+        _relate(test_session, test_user, parent)
+        _relate(test_session, test_user, parent, parent_rule)
+        _relate(test_session, test_user, mother, mother_rule)
+        _relate(test_session, test_user, stranger, status=1)
+
+        supervisor_id = test_user.user_id
+        statements = []
+
+        def count_statements(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statements)
+        try:
+            records = CheckinRecordService.get_supervised_records(supervisor_id, DAY, DAY)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+
+        assert len(statements) == 1
+        assert [record.planned_time.hour for record in records] == [20, 9, 8]
+
+    def test_cursor_paging(self, test_session, test_user):
+        """游标分页不重不漏，传入的session同样可用"""
+        parent = _add_user(test_session, '父亲')
+        # 每条规则每天一条记录，两条规则的计划时间相同
+        for index, hour in enumerate([7, 8, 8, 9, 12]):
+            _add_rule_with_records(test_session, parent, f'规则{index}', [hour])
+        _relate(test_session, test_user, parent)
+
+        seen = []
+        cursor = None
+        while True:
+            page = CheckinRecordService.get_supervised_records_page(
+                test_user.user_id, DAY, DAY, cursor=cursor, limit=2)
+            seen.extend(record.record_id for record in page['records'])
+            if not page['has_more']:
+                break
+            cursor = page['next_cursor']
+
+        everything = CheckinRecordService.get_supervised_records(
+            test_user.user_id, datetime.combine(DAY, time.min), datetime.combine(DAY + timedelta(days=1), time.min),
+            session=test_session)
+        assert seen == [record.record_id for record in everything]
+        assert len(seen) == 5
+
+    def test_no_relations_returns_empty(self, test_session, test_user):
+        """没有已同意的监督关系时返回空列表"""
+        assert CheckinRecordService.get_supervised_records(test_user.user_id, DAY, DAY) == []
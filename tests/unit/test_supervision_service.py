@@ -0,0 +1,122 @@
+"""
+监督关系服务测试
+验证监督/被监督用户列表和监督记录来自数据库，并且查询次数固定
+"""
+import os
+import sys
+from datetime import datetime, date, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import (
+    CheckinRule, CheckinRecord, CheckinRecordArchive, CommunityCheckinRule, SupervisionRuleRelation, User
+)
+from wxcloudrun.supervision_service import SupervisionService
+
+DAY = date(2025, 6, 1)
+
+
+def _add_parent(session, supervisor, nickname, rule_count, checkin_hour=None, all_rules=False):
+    parent = User(nickname=nickname, avatar_url=f'{nickname}.png', role=1, status=1)
+    session.add(parent)
+    session.flush()
+    rules = []
+    for index in range(rule_count):
+        rule = CheckinRule(user_id=parent.user_id, rule_type='personal', rule_name=f'{nickname}规则{index}', status=1)
+        session.add(rule)
+        session.flush()
+        rules.append(rule)
+        session.add(SupervisionRuleRelation(supervisor_user_id=supervisor.user_id, solo_user_id=parent.user_id,
+                                            rule_id=None if all_rules else rule.rule_id, status=2))
+    if checkin_hour is not None:
+        planned = datetime.combine(DAY, time(checkin_hour, 0))
+        session.add(CheckinRecord(rule_id=rules[0].rule_id, user_id=parent.user_id, status=1,
+                                  planned_time=planned, checkin_time=planned))
+    session.commit()
+    return parent, rules
+
+
+class TestSupervisionService:
+
+    def test_supervised_users_aggregate_in_constant_queries(self, test_session, test_user, count_statements):
+        """监督数量和最近打卡时间在分组查询中得到，分页与用户数量无关"""
+        parents = [_add_parent(test_session, test_user, f'老人{i}', rule_count=i + 1, checkin_hour=8 + i)[0]
+                   for i in range(5)]
+        pending = User(nickname='待确认', role=1, status=1)
+        test_session.add(pending)
+        test_session.flush()
+        test_session.add(SupervisionRuleRelation(supervisor_user_id=test_user.user_id,
+                                                 solo_user_id=pending.user_id, status=1))
+        test_session.commit()
+        supervisor_id = test_user.user_id
+
+        with count_statements() as statements:
+            first = SupervisionService.get_supervised_users(supervisor_id, page=1, per_page=3)
+            second = SupervisionService.get_supervised_users(supervisor_id, page=2, per_page=3)
+
+        assert len(statements) == 4
+        assert first['total'] == 5
+        assert [u['user_id'] for u in first['supervised_users'] + second['supervised_users']] == [
+            p.user_id for p in parents]
+        third = first['supervised_users'][2]
+        assert (third['nickname'], third['avatar_url'], third['supervision_count']) == ('老人2', '老人2.png', 3)
+        assert third['last_checkin'] == '2025-06-01 10:00:00'
+
+    def test_guardians(self, test_session, test_user):
+        """被监督人查看监督自己的用户"""
+        parent, _ = _add_parent(test_session, test_user, '老人', rule_count=2, all_rules=True)
+
+        result = SupervisionService.get_guardians(parent.user_id)
+
+        assert result['total'] == 1
+        guardian = result['guardians'][0]
+        assert guardian['user_id'] == test_user.user_id
+        assert guardian['supervision_count'] == 2
+        assert guardian['supervise_all_rules'] is True
+        assert guardian['last_checkin'] is None
+
+    def test_supervision_records_load_names_with_page(self, test_session, test_user, test_community, count_statements):
+        """记录页随页加载被监督人昵称和规则名称，查询次数与记录数无关"""
+        parent, rules = _add_parent(test_session, test_user, '老人', rule_count=6, all_rules=True)
+        community_rule = CommunityCheckinRule(community_id=test_community.community_id, rule_name='社区签到',
+                                              status=1, created_by=test_user.user_id)
+        test_session.add(community_rule)
+        test_session.flush()
+        for rule, hour in zip(rules, range(6, 12)):
+            test_session.add(CheckinRecord(rule_id=rule.rule_id, user_id=parent.user_id, status=1,
+                                           planned_time=datetime.combine(DAY, time(hour, 0))))
+        test_session.add(CheckinRecord(community_rule_id=community_rule.community_rule_id,
+                                       solo_user_id=parent.user_id, user_id=parent.user_id, status=0,
+                                       planned_time=datetime.combine(DAY, time(20, 0))))
+        test_session.commit()
+        supervisor = test_session.get(User, test_user.user_id)
+
+        with count_statements() as statements:
+            page = SupervisionService.get_supervision_records(supervisor, DAY, DAY, limit=4)
+
+        assert len(statements) == 2
+        assert page['has_more'] is True
+        assert [r['rule_name'] for r in page['records']] == ['社区签到', '老人规则5', '老人规则4', '老人规则3']
+        assert {r['supervised_nickname'] for r in page['records']} == {'老人'}
+        assert page['records'][0]['status'] == 'unchecked'
+
+        rest = SupervisionService.get_supervision_records(supervisor, DAY, DAY, cursor=page['next_cursor'], limit=4)
+        assert len(rest['records']) == 3
+        assert rest['has_more'] is False
+
+    def test_supervision_records_include_archived_rows(self, test_session, test_user, monkeypatch):
+        """查询区间早于归档分界时同时读取归档表，已归档的记录按时间顺序出现在结果中"""
+        monkeypatch.setenv('CHECKIN_ARCHIVE_DAYS', '3')
+        parent, rules = _add_parent(test_session, test_user, '老人', rule_count=1, checkin_hour=9)
+        planned = datetime.combine(DAY, time(7, 0))
+        test_session.add(CheckinRecordArchive(record_id=1000, rule_id=rules[0].rule_id, user_id=parent.user_id,
+                                              status=1, planned_time=planned, checkin_time=planned))
+        test_session.commit()
+        supervisor = test_session.get(User, test_user.user_id)
+
+        page = SupervisionService.get_supervision_records(supervisor, DAY, DAY)
+
+        assert [(r['planned_time'], r['rule_name']) for r in page['records']] == [
+            ('2025-06-01 09:00:00', '老人规则0'), ('2025-06-01 07:00:00', '老人规则0')]
+        assert page['records'][1]['record_id'] == 1000
+        assert page['records'][1]['supervised_nickname'] == '老人'
@@ -0,0 +1,58 @@
+"""
+后台任务租约服务测试
+验证多进程选主的获取、续约、过期接管与释放
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from wxcloudrun.task_lease_service import TaskLeaseService
+
+LEASE = 'missing-mark'
+T0 = datetime(2025, 1, 15, 9, 0, 0)
+
+
+class TestTaskLeaseService:
+
+    def test_only_one_holder_acquires(self, test_session):
+        """同一时刻只有一个持有者能获得租约"""
+        assert TaskLeaseService.try_acquire(LEASE, 'worker-a', 90, now=T0) is True
+        assert TaskLeaseService.try_acquire(LEASE, 'worker-b', 90, now=T0 + timedelta(seconds=10)) is False
+
+        lease = TaskLeaseService.get_lease(LEASE)
+        assert lease.holder_id == 'worker-a'
+        assert lease.expires_at == T0 + timedelta(seconds=90)
+
+    def test_holder_renews_heartbeat(self, test_session):
+        """持有者续约后过期时间顺延，获得时间保持不变"""
+        TaskLeaseService.try_acquire(LEASE, 'worker-a', 90, now=T0)
+        renew_at = T0 + timedelta(seconds=30)
+
+        assert TaskLeaseService.try_acquire(LEASE, 'worker-a', 90, now=renew_at) is True
+
+        lease = TaskLeaseService.get_lease(LEASE)
+        test_session.refresh(lease)
+        assert lease.acquired_at == T0
+        assert lease.heartbeat_at == renew_at
+        assert lease.expires_at == renew_at + timedelta(seconds=90)
+
+    def test_takeover_after_expiry(self, test_session):
+        """持有者停止心跳后，其他进程在租约过期后接管"""
+        TaskLeaseService.try_acquire(LEASE, 'worker-a', 90, now=T0)
+
+        assert TaskLeaseService.try_acquire(LEASE, 'worker-b', 90, now=T0 + timedelta(seconds=89)) is False
+        assert TaskLeaseService.try_acquire(LEASE, 'worker-b', 90, now=T0 + timedelta(seconds=90)) is True
+        # 原持有者恢复后不能再续约
+        assert TaskLeaseService.try_acquire(LEASE, 'worker-a', 90, now=T0 + timedelta(seconds=95)) is False
+
+    def test_release_allows_immediate_takeover(self, test_session):
+        """释放租约后其他进程可以立即接管，非持有者不能释放"""
+        TaskLeaseService.try_acquire(LEASE, 'worker-a', 90, now=T0)
+        assert TaskLeaseService.release(LEASE, 'worker-b', now=T0) is False
+        assert TaskLeaseService.release(LEASE, 'worker-a', now=T0 + timedelta(seconds=5)) is True
+
+        assert TaskLeaseService.try_acquire(LEASE, 'worker-b', 90, now=T0 + timedelta(seconds=5)) is True
@@ -0,0 +1,60 @@
+"""
+按用户缓存测试
+验证过期与版本戳失效，以及用户数、每用户条目数的上限和写入时的过期清理
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from wxcloudrun.utils.user_cache import UserCache
+
+
+class TestUserCache:
+
+    def test_expired_and_stale_entries_miss(self):
+        """过期或版本戳不一致的条目视为未命中"""
+        cache = UserCache('test')
+        now = datetime.now()
+        cache.set(1, 'value', key='a', expires_at=now + timedelta(minutes=5), stamp=1)
+
+        assert cache.get(1, key='a', stamp=1) == 'value'
+        assert cache.get(1, key='a', stamp=2) is None
+        cache.set(1, 'value', key='a', expires_at=now + timedelta(minutes=5))
+        assert cache.get(1, key='a', now=now + timedelta(minutes=10)) is None
+        assert cache.stats()['entries'] == 0
+
+    def test_evicts_least_recently_used_user(self):
+        """超过用户数上限时淘汰最久未使用的用户"""
+        cache = UserCache('test', max_users=2)
+        cache.set(1, 'one')
+        cache.set(2, 'two')
+        assert cache.get(1) == 'one'  # 用户1最近使用过
+
+        cache.set(3, 'three')
+
+        assert cache.get(2) is None
+        assert (cache.get(1), cache.get(3)) == ('one', 'three')
+        assert cache.stats()['users'] == 2
+        assert cache.stats()['evictions'] == 1
+
+    def test_limits_keys_per_user(self):
+        """同一用户的条目超过上限时淘汰最久未使用的条目"""
+        cache = UserCache('test', max_keys_per_user=3)
+        for window in range(5):
+            cache.set(1, window, key=window)
+
+        assert [cache.get(1, key=window) for window in range(5)] == [None, None, 2, 3, 4]
+        assert cache.stats()['entries'] == 3
+
+    def test_set_sweeps_expired_entries_of_user(self):
+        """写入时清理该用户已过期的条目，不必等到再次读取"""
+        cache = UserCache('test')
+        cache.set(1, 'old', key='a', expires_at=datetime.now() - timedelta(seconds=1))
+        cache.set(1, 'old', key='b', expires_at=datetime.now() - timedelta(seconds=1))
+
+        cache.set(1, 'new', key='c')
+
+        assert cache.stats()['entries'] == 1
+        assert cache.get(1, key='c') == 'new'
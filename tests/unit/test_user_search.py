@@ -0,0 +1,136 @@
+"""
+用户搜索索引测试
+验证 users_fts 三元组索引随 users 表同步，各搜索入口走索引匹配、按相关度排序并返回索引上的总数，
+整页结果的工作人员标记由一次查询得出
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from database.flask_models import db, Community, CommunityStaff, User
+from wxcloudrun.community_service import CommunityService
+from wxcloudrun.user_search_service import UserSearchService
+from wxcloudrun.user_service import UserService
+
+
+def _add_users(session, *rows):
+    created = datetime(2025, 1, 1)
+    users = []
+    for index, (nickname, phone) in enumerate(rows):
+        users.append(User(nickname=nickname, name=nickname, phone_number=phone, role=1, status=1,
+                          created_at=created + timedelta(days=index)))
+    session.add_all(users)
+    session.commit()
+    return users
+
+
+def _nicknames(result):
+    return [user['nickname'] for user in result['users']]
+
+
+class TestUserSearch:
+
+    def test_index_follows_user_changes(self, test_session):
+        """新增、改名和删除用户后索引同步更新"""
+        user, = _add_users(test_session, ('王小明', '138****1234'))
+        match = UserSearchService.filter_keyword(db.session.query(User), '王小明')
+        assert [u.user_id for u in match] == [user.user_id]
+
+        user.nickname = user.name = '王大明'
+        test_session.commit()
+        assert UserSearchService.filter_keyword(db.session.query(User), '王小明').count() == 0
+        assert UserSearchService.filter_keyword(db.session.query(User), '王大明').count() == 1
+
+        test_session.delete(user)
+        test_session.commit()
+        assert UserSearchService.filter_keyword(db.session.query(User), '王大明').count() == 0
+
+    def test_search_uses_index_with_total(self, test_session):
+        """关键词在昵称或手机号中的子串都能命中，超级管理员不返回，总数来自索引匹配"""
+        _add_users(test_session, ('Alice', '138****1001'), ('malice', '138****1002'),
+                   ('Bob', '139****1001'), ('Carol', '137****0000'))
+        test_session.add(User(nickname='alice admin', phone_number='136****0000', role=4, status=1))
+        test_session.commit()
+
+        result = UserService.search_users('ali', page=1, per_page=1)
+        assert result['pagination']['total'] == 2
+        assert result['pagination']['has_more'] is True
+        assert len(result['users']) == 1
+
+        assert sorted(_nicknames(UserService.search_users('1001'))) == ['Alice', 'Bob']
+        # 只按昵称搜索时不匹配手机号
+        assert _nicknames(UserService.search_users_by_nickname('1001')) == []
+        assert _nicknames(UserService.search_users_by_phone('1001')) == ['Bob', 'Alice']
+
+    def test_short_keyword_falls_back_to_like(self, test_session):
+        """少于三个字符的关键词无法走三元组索引，按 LIKE 匹配"""
+        _add_users(test_session, ('张三', '138****0001'), ('李四', '138****0002'))
+
+        assert not UserSearchService.uses_index('张三')
+        assert [u['nickname'] for u in CommunityService.search_users('张')] == ['张三']
+
+    def test_ensure_index_rebuilds_for_existing_database(self, test_session):
+        """旧数据库没有索引时按需创建并从 users 表重建内容，已存在时不做处理"""
+        _add_users(test_session, ('赵六六', '138****0006'))
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP TABLE users_fts'))
+            for trigger in ('users_fts_ai', 'users_fts_ad', 'users_fts_au'):
+                conn.execute(text(f'DROP TRIGGER {trigger}'))
+
+        assert UserSearchService.ensure_index() is True
+        assert UserSearchService.ensure_index() is False
+        assert _nicknames(UserService.search_users('赵六六')) == ['赵六六']
+
+    def test_autogenerate_keeps_index(self, test_session):
+        """Alembic 自动生成迁移时跳过索引虚拟表及其影子表，不会生成删除语句"""
+        from alembic.autogenerate import compare_metadata
+        from alembic.migration import MigrationContext
+        from database.flask_models import include_in_migrations
+
+        with db.engine.connect() as conn:
+            unfiltered = compare_metadata(MigrationContext.configure(conn), db.metadata)
+            assert {diff[1].name for diff in unfiltered if diff[0] == 'remove_table'} >= {'users_fts', 'users_fts_data'}
+
+            context = MigrationContext.configure(conn, opts={'include_name': include_in_migrations})
+            assert compare_metadata(context, db.metadata) == []
+
+    def test_staff_flags_in_one_query(self, test_session, count_statements):
+        """整页用户的任职记录一次查询，当前社区和其他社区的任职标记在内存中得出"""
+        current = Community(name='当前社区', status=1)
+        other = Community(name='其他社区', status=1)
+        test_session.add_all([current, other])
+        test_session.flush()
+        staff, manager, elsewhere, plain = _add_users(
+            test_session, ('成员甲', '138****0001'), ('成员乙', '138****0002'),
+            ('成员丙', '138****0003'), ('成员丁', '138****0004'))
+        test_session.add_all([
+            CommunityStaff(community_id=current.community_id, user_id=staff.user_id, role='staff'),
+            CommunityStaff(community_id=current.community_id, user_id=manager.user_id, role='manager'),
+            CommunityStaff(community_id=other.community_id, user_id=elsewhere.user_id, role='manager'),
+        ])
+        test_session.commit()
+        community_id = current.community_id
+
+        with count_statements() as statements:
+            result = UserService.search_users('138****', per_page=20, community_id=community_id)
+
+        # 总数、分页和任职记录各一次查询，与页面大小无关
+        assert len(statements) == 3
+        flags = {user['nickname']: (user['is_staff'], user['is_current_community_staff'],
+                                    user['is_current_community_manager'], user['is_other_community_manager'])
+                 for user in result['users']}
+        assert flags == {
+            '成员甲': (True, True, False, False),
+            '成员乙': (True, False, True, False),
+            '成员丙': (True, False, False, True),
+            '成员丁': (False, False, False, False),
+        }
+
+        with count_statements() as statements:
+            ankafamily = CommunityService.search_users('成员丁')
+        assert len(statements) == 2
+        assert ankafamily[0]['is_staff'] is False